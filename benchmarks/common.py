@@ -0,0 +1,141 @@
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
+import models.my_model  # noqa: F401
+from helpers.db import Base
+
+
+@asynccontextmanager
+async def database(url: Optional[str] = None) -> AsyncIterator[AsyncEngine]:
+    # fresh schema for every run, on a temporary sqlite file unless a url is given
+    path = None
+    if url is None:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        url = f"sqlite+aiosqlite:///{path}"
+
+    engine = create_async_engine(url)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    try:
+        yield engine
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+
+        await engine.dispose()
+
+        if path:
+            os.remove(path)
+
+
+def sessionmaker(engine: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(bind=engine, autoflush=False)
+
+
+class RoundTripCounter:
+    # counts statements and transaction control calls sent to the database
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine.sync_engine
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    @property
+    def total(self) -> int:
+        return self.statements + self.commits + self.rollbacks
+
+    def _on_execute(self, *args):
+        self.statements += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def _on_rollback(self, *args):
+        self.rollbacks += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        event.listen(self.engine, "commit", self._on_commit)
+        event.listen(self.engine, "rollback", self._on_rollback)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+        event.remove(self.engine, "commit", self._on_commit)
+        event.remove(self.engine, "rollback", self._on_rollback)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self.start
+
+
+async def asgi_request(
+    app,
+    method: str = "GET",
+    path: str = "/",
+    headers: Optional[list[tuple[bytes, bytes]]] = None,
+    body: bytes = b"",
+    client: tuple[str, int] = ("127.0.0.1", 50000),
+    response_headers: Optional[list[tuple[bytes, bytes]]] = None,
+) -> tuple[int, bytes]:
+    # drive an asgi app directly, without sockets or an http client in between
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"bench")] + (headers or []),
+        "client": client,
+        "server": ("bench", 80),
+    }
+    received = False
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal received
+        if received:
+            # the client stays connected until the response is sent, like a
+            # real connection (an early disconnect would cut file responses)
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if response_headers is not None:
+                response_headers.extend(message["headers"])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+from benchmarks.common import Timer, asgi_request
+from helpers.compression import CODECS, CompressionMiddleware
+
+SIZES = {"1KB": 1024, "10KB": 10 * 1024, "100KB": 100 * 1024, "1MB": 1024 * 1024}
+
+LEVELS = {"gzip": [1, 6, 9], "br": [1, 4, 11], "zstd": [1, 3, 19]}
+
+
+def payload(size: int) -> bytes:
+    # a list response like /api/my-model/list, trimmed to the size
+    now = datetime.now(timezone.utc).isoformat()
+    models = []
+    body = b""
+    while len(body) < size:
+        i = len(models)
+        models.append(
+            {
+                "id": i,
+                "field1": f"Row {i}",
+                "field2": i % 2 == 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        body = json.dumps({"message": "list", "models": models}).encode()
+    return body
+
+
+def codecs(size: int, seconds: float):
+    # cpu time per response against the bytes it saves on the wire
+    data = payload(size)
+    for name, codec in CODECS.items():
+        for level in LEVELS[name]:
+            compressed = codec.compress(data, level)
+            runs = 0
+            start = time.perf_counter()
+            deadline = start + seconds
+            while runs < 3 or time.perf_counter() < deadline:
+                codec.compress(data, level)
+                runs += 1
+
+            per_op = (time.perf_counter() - start) / runs
+            saved = len(data) - len(compressed)
+            print(
+                f"compression {name:<4} level={level:<2} size={len(data):<8} "
+                f"ratio={len(data) / len(compressed):5.1f} "
+                f"saved={saved:<8} us/op={per_op * 1e6:8.1f} "
+                f"saved/ms={saved / (per_op * 1e3):.0f}"
+            )
+
+
+async def middleware(size: int, requests: int):
+    # the whole response path, with and without the middleware in front
+    data = payload(size)
+    app = FastAPI()
+
+    @app.get("/list")
+    async def list_items():
+        return Response(data, media_type="application/json")
+
+    apps = {"none": app, "gzip": CompressionMiddleware(app)}
+    headers = [(b"accept-encoding", b"gzip")]
+
+    for name, asgi_app in apps.items():
+        sent = 0
+        with Timer() as timer:
+            for _ in range(requests):
+                _, body = await asgi_request(asgi_app, path="/list", headers=headers)
+                sent += len(body)
+
+        print(
+            f"compression middleware {name:<4} size={len(data):<8} "
+            f"req/s={requests / timer.elapsed:.0f} bytes/req={sent // requests}"
+        )
+
+
+async def main(seconds: float, requests: int):
+    for size in SIZES.values():
+        codecs(size, seconds)
+    for size in SIZES.values():
+        await middleware(size, max(requests * 1024 // size, 10))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.seconds, args.requests))
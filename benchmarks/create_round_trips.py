@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+
+from benchmarks.common import RoundTripCounter, Timer, database, sessionmaker
+from models.my_model import MyModel
+from services import my_model as service_my_model
+
+
+async def create_then_select(db):
+    # previous route behaviour: add, commit, refresh, then a fresh find_by_id
+    obj = MyModel(field1="Benchmark", field2=True)
+    id = await service_my_model.create(obj, db)
+    return await service_my_model.find_by_id(id, db)
+
+
+async def create_returning(db):
+    obj = MyModel(field1="Benchmark", field2=True)
+    return await service_my_model.create_returning(obj, db)
+
+
+async def run(name, fn, engine, requests):
+    session_local = sessionmaker(engine)
+
+    with RoundTripCounter(engine) as counter, Timer() as timer:
+        for _ in range(requests):
+            async with session_local() as db:
+                await fn(db)
+
+    print(
+        f"{name:<20} "
+        f"statements/req={counter.statements / requests:.2f} "
+        f"commits/req={counter.commits / requests:.2f} "
+        f"round-trips/req={counter.total / requests:.2f} "
+        f"ms/req={timer.elapsed * 1000 / requests:.3f}"
+    )
+
+
+async def main(url, requests):
+    async with database(url) as engine:
+        await run("create + find_by_id", create_then_select, engine, requests)
+        await run("create_returning", create_returning, engine, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.requests))
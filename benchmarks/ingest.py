@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import Timer, database, percentile, sessionmaker
+from helpers.ingest import IngestQueue
+from models.my_model import MyModel, MyModelRequest
+from services import my_model as service_my_model
+
+
+async def run_clients(create, clients, requests):
+    latencies = []
+
+    async def client(index):
+        for i in range(index, requests, clients):
+            start = time.perf_counter()
+            model = await create(MyModelRequest(field1=f"Row {i}", field2=True))
+            latencies.append(time.perf_counter() - start)
+            assert model is not None
+
+    with Timer() as timer:
+        await asyncio.gather(*[client(index) for index in range(clients)])
+
+    return requests / timer.elapsed, latencies
+
+
+async def main(url, clients, requests, max_batch, max_delay):
+    for name in ("create per request", "ingest queue"):
+        async with database(url) as engine:
+            session_local = sessionmaker(engine)
+
+            if name == "ingest queue":
+
+                async def flush(items):
+                    async with session_local() as db:
+                        return await service_my_model.bulk_create(items, db)
+
+                queue = IngestQueue(flush, max_batch=max_batch, max_delay=max_delay)
+                create = queue.submit
+            else:
+                queue = None
+
+                async def create(item):
+                    async with session_local() as db:
+                        obj = MyModel(**item.model_dump())
+                        return await service_my_model.create_returning(obj, db)
+
+            rate, latencies = await run_clients(create, clients, requests)
+            if queue:
+                await queue.close()
+
+            p50 = percentile(latencies, 0.5) * 1000
+            p99 = percentile(latencies, 0.99) * 1000
+            print(
+                f"clients={clients:<4} {name:<20} req/s={rate:.0f} "
+                f"p50_ms={p50:.2f} p99_ms={p99:.2f}"
+            )
+            if queue:
+                stats = queue.stats()
+                print(
+                    f"{'':<12} batches={stats['batches']} "
+                    f"average_batch={stats['average_batch']:.1f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--max-batch", type=int, default=400)
+    parser.add_argument("--max-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    asyncio.run(
+        main(args.url, args.clients, args.requests, args.max_batch, args.max_delay)
+    )
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+
+from fastapi import FastAPI
+from sqlalchemy import event
+
+from benchmarks.common import Timer, asgi_request, database, sessionmaker
+from helpers import instrumentation, router
+from helpers.db import get_read_session
+from helpers.instrumentation import MetricsMiddleware
+from models.my_model import MyModelRequest
+from services import my_model as service_my_model
+
+
+def build_app(session_local, instrumented: bool) -> FastAPI:
+    app = FastAPI()
+    router.setup(app)
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+
+    async def override_get_read_session():
+        async with session_local() as session:
+            yield session
+
+    app.dependency_overrides[get_read_session] = override_get_read_session
+    return app
+
+
+async def main(url, requests, limit):
+    async with database(url) as engine:
+        session_local = sessionmaker(engine)
+        async with session_local() as db:
+            items = [
+                MyModelRequest(field1=f"Row {i}", field2=True) for i in range(limit)
+            ]
+            await service_my_model.bulk_create(items, db)
+
+        path = f"/api/my-model/list?limit={limit}"
+        for name, instrumented in (("plain", False), ("instrumented", True)):
+            if instrumented:
+                instrumentation.instrument_engine(engine)
+
+            app = build_app(session_local, instrumented)
+            for _ in range(100):
+                await asgi_request(app, path=path)
+
+            with Timer() as timer:
+                for _ in range(requests):
+                    status, _ = await asgi_request(app, path=path)
+                    assert status == 200, status
+
+            us = timer.elapsed * 1_000_000 / requests
+            print(f"list limit={limit:<5} {name:<13} us/req={us:.1f}")
+
+        event.remove(
+            engine.sync_engine,
+            "before_cursor_execute",
+            instrumentation.before_cursor_execute,
+        )
+        event.remove(
+            engine.sync_engine,
+            "after_cursor_execute",
+            instrumentation.after_cursor_execute,
+        )
+
+        with Timer() as timer:
+            for _ in range(requests):
+                instrumentation.collect().render()
+        print(f"/metrics render us/op={timer.elapsed * 1_000_000 / requests:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.requests, args.limit))
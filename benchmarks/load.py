@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from benchmarks.common import Timer, asgi_request, database, percentile, sessionmaker
+from helpers.db import create_engine, get_read_session, get_session
+from helpers.rate_limiter import RateLimitMiddleware
+from models.my_model import MyModelRequest
+from services import my_model as service_my_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "results", "baseline.json")
+
+# name -> (method, path, expected status)
+ENDPOINTS = {
+    "random": ("GET", "/api/my-model/random", 200),
+    "create": ("POST", "/api/my-model/create", 201),
+}
+
+# sends one request, returns the status (0 when the connection failed)
+Send = Callable[[str, str, bytes], Awaitable[int]]
+
+
+async def seed(engine, rows: int):
+    session_local = sessionmaker(engine)
+    async with session_local() as db:
+        items = [
+            MyModelRequest(field1=f"Row {i}", field2=i % 2 == 0) for i in range(rows)
+        ]
+        await service_my_model.bulk_create(items, db)
+
+
+def plan(requests: int, write_ratio: float, seed: int) -> list[str]:
+    # drawn up front, so every driver and every run replays the same mix
+    rng = random.Random(seed)
+    return [
+        "create" if rng.random() < write_ratio else "random" for _ in range(requests)
+    ]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run_load(send: Send, mix: list[str], clients: int) -> dict[str, Any]:
+    # closed loop: each client sends its next request when the last one is done
+    latencies: dict[str, list[float]] = {name: [] for name in ENDPOINTS}
+    errors = dict.fromkeys(ENDPOINTS, 0)
+
+    async def client(index):
+        for i in range(index, len(mix), clients):
+            name = mix[i]
+            method, path, expected = ENDPOINTS[name]
+            body = b""
+            if method == "POST":
+                body = json.dumps({"field1": f"Load {i}", "field2": True}).encode()
+
+            start = time.perf_counter()
+            try:
+                status = await send(method, path, body)
+            except (OSError, asyncio.IncompleteReadError):
+                status = 0
+            latencies[name].append(time.perf_counter() - start)
+            if status != expected:
+                errors[name] += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*[client(index) for index in range(clients)])
+
+    endpoints = {
+        name: summarize(values, errors[name], timer.elapsed)
+        for name, values in latencies.items()
+        if values
+    }
+    endpoints["all"] = summarize(
+        [value for values in latencies.values() for value in values],
+        sum(errors.values()),
+        timer.elapsed,
+    )
+    return endpoints
+
+
+@asynccontextmanager
+async def asgi_driver(url: str, workers: int) -> AsyncIterator[Send]:
+    # main.app as deployed, driven in process without sockets. lifespan is not
+    # run, so the scheduler and the loop lag monitor stay off
+    from main import app
+
+    # every request comes from one address, the limiter would reject most
+    app.user_middleware = [
+        middleware
+        for middleware in app.user_middleware
+        if middleware.cls is not RateLimitMiddleware
+    ]
+
+    writer = create_engine(url)
+    reader = create_engine(url, read_only=True)
+    write_session = sessionmaker(writer)
+    read_session = sessionmaker(reader)
+
+    async def override_get_session():
+        async with write_session() as session:
+            yield session
+
+    async def override_get_read_session():
+        async with read_session() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_read_session
+    headers = [(b"content-type", b"application/json")]
+
+    async def send(method: str, path: str, body: bytes) -> int:
+        status, _ = await asgi_request(
+            app, method=method, path=path, headers=headers, body=body
+        )
+        return status
+
+    try:
+        yield send
+    finally:
+        app.dependency_overrides.clear()
+        await writer.dispose()
+        await reader.dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Connection:
+    # minimal http/1.1 keep-alive client for responses with a content-length.
+    # a full client like httpx spends more cpu per request than the app, on
+    # the same machine that would be measured instead of the server
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: bytes = b"") -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+
+        try:
+            self.writer.write(
+                f"{method} {path} HTTP/1.1\r\nhost: {self.host}\r\n"
+                f"content-type: application/json\r\n"
+                f"content-length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await self.writer.drain()
+
+            status = int((await self.reader.readuntil(b"\r\n")).split()[1])
+            length = 0
+            keep_alive = True
+            while (line := await self.reader.readuntil(b"\r\n")) != b"\r\n":
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    length = int(value)
+                elif name == b"connection" and value.strip().lower() == b"close":
+                    keep_alive = False
+            await self.reader.readexactly(length)
+        except BaseException:
+            self.close()
+            raise
+
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def wait_ready(connection: Connection, process: subprocess.Popen):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        try:
+            if await connection.request("GET", "/metrics") == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+
+    raise RuntimeError("server did not start within 30s")
+
+
+@asynccontextmanager
+async def uvicorn_driver(url: str, workers: int) -> AsyncIterator[Send]:
+    # `python -m server` in a subprocess, driven over real sockets
+    host, port = "127.0.0.1", free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": url,
+        "READ_DATABASE_URL": "",
+        "WEB_HOST": host,
+        "WEB_PORT": str(port),
+        "WEB_WORKERS": str(workers),
+        "RATE_LIMIT": "",
+        "MIGRATE_ON_START": "false",
+        "SCHEDULER_ENABLED": "false",
+    }
+    process = subprocess.Popen([sys.executable, "-m", "server"], cwd=ROOT, env=env)
+    # one keep-alive connection per concurrent client
+    idle: list[Connection] = []
+
+    async def send(method: str, path: str, body: bytes) -> int:
+        connection = idle.pop() if idle else Connection(host, port)
+        status = await connection.request(method, path, body)
+        idle.append(connection)
+        return status
+
+    try:
+        await wait_ready(Connection(host, port), process)
+        yield send
+    finally:
+        for connection in idle:
+            connection.close()
+        process.terminate()
+        process.wait(timeout=30)
+
+
+DRIVERS = {"asgi": asgi_driver, "uvicorn": uvicorn_driver}
+
+
+async def run(driver: str, config: dict[str, Any]) -> dict[str, Any]:
+    async with database(config["url"]) as engine:
+        await seed(engine, config["rows"])
+        url = engine.url.render_as_string(hide_password=False)
+
+        async with DRIVERS[driver](url, config["workers"]) as send:
+            warmup = plan(config["warmup"], config["write_ratio"], config["seed"] + 1)
+            await run_load(send, warmup, config["clients"])
+
+            mix = plan(config["requests"], config["write_ratio"], config["seed"])
+            endpoints = await run_load(send, mix, config["clients"])
+
+    return {"driver": driver, "endpoints": endpoints}
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    # throughput below, or p95/p99 latency above, the baseline by more than
+    # the tolerance counts as a regression, and so does any new error
+    regressions = []
+    baseline_runs = {run["driver"]: run for run in baseline["runs"]}
+
+    for run in results["runs"]:
+        base_run = baseline_runs.get(run["driver"])
+        if base_run is None:
+            continue
+
+        for name, current in run["endpoints"].items():
+            base = base_run["endpoints"].get(name)
+            if base is None:
+                continue
+
+            checks = [
+                ("req_s", current["req_s"] < base["req_s"] * (1 - tolerance)),
+                ("errors", current["errors"] > base["errors"]),
+            ]
+            for key in ("p95_ms", "p99_ms"):
+                checks.append((key, current[key] > base[key] * (1 + tolerance)))
+
+            for key, regressed in checks:
+                change = (
+                    (current[key] - base[key]) / base[key] * 100 if base[key] else 0
+                )
+                print(
+                    f"compare {run['driver']:<8} {name:<7} {key:<7} "
+                    f"baseline={base[key]:<10} current={current[key]:<10} "
+                    f"change={change:+.1f}%{' REGRESSION' if regressed else ''}"
+                )
+                if regressed:
+                    regressions.append(f"{run['driver']} {name} {key}")
+
+    return regressions
+
+
+def write_json(path: str, data: dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+        file.write("\n")
+
+
+async def main(args) -> int:
+    config = {
+        "url": args.url,
+        "rows": args.rows,
+        "clients": args.clients,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "write_ratio": args.write_ratio,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+    results: dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in config.items() if key != "url"},
+        "runs": [],
+    }
+
+    for driver in args.drivers:
+        run_result = await run(driver, config)
+        results["runs"].append(run_result)
+        for name, stats in run_result["endpoints"].items():
+            print(
+                f"load {driver:<8} {name:<7} requests={stats['requests']:<6} "
+                f"errors={stats['errors']:<4} req/s={stats['req_s']:<9} "
+                f"p50_ms={stats['p50_ms']:<8} p95_ms={stats['p95_ms']:<8} "
+                f"p99_ms={stats['p99_ms']}"
+            )
+
+    if args.output:
+        write_json(args.output, results)
+
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline["config"] != results["config"]:
+        print("baseline was recorded with another config, comparison skipped")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument(
+        "--drivers", nargs="+", default=list(DRIVERS), choices=list(DRIVERS)
+    )
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
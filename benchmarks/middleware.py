@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+
+from fastapi.middleware.cors import CORSMiddleware as StarletteCORSMiddleware
+
+from benchmarks.common import Timer, asgi_request
+from helpers.compression import CompressionMiddleware
+from helpers.cors import CORSMiddleware
+from helpers.diagnostics import DiagnosticsMiddleware
+from helpers.instrumentation import MetricsMiddleware
+from helpers.rate_limiter import Rate, RateLimitMiddleware
+
+BODY = b'{"message":"ok"}'
+
+# each layer as main.py configures it, limits high enough to never reject
+LAYERS = {
+    "rate_limiter": lambda app: RateLimitMiddleware(app, rate=Rate(10**9, 1)),
+    "cors": lambda app: CORSMiddleware(app, allow_origins=["*"]),
+    "compression": CompressionMiddleware,
+    "metrics": MetricsMiddleware,
+    "diagnostics": DiagnosticsMiddleware,
+}
+
+# the previous cors layer, for comparison
+BASELINES = {
+    "starlette_cors": lambda app: StarletteCORSMiddleware(
+        app,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    ),
+}
+
+CASES = {
+    "plain": ("GET", []),
+    "origin": ("GET", [(b"origin", b"http://example.com")]),
+    "preflight": (
+        "OPTIONS",
+        [
+            (b"origin", b"http://example.com"),
+            (b"access-control-request-method", b"POST"),
+            (b"access-control-request-headers", b"content-type"),
+        ],
+    ),
+}
+
+
+async def endpoint(scope, receive, send):
+    # bare asgi app, so only the middleware cost is measured
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(BODY)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": BODY})
+
+
+def stack(names: list[str]):
+    # first name is the outermost layer, like the order requests go through
+    app = endpoint
+    for name in reversed(names):
+        app = {**LAYERS, **BASELINES}[name](app)
+    return app
+
+
+async def measure(app, method, headers, requests) -> float:
+    for _ in range(100):
+        await asgi_request(app, method=method, path="/", headers=headers)
+
+    with Timer() as timer:
+        for _ in range(requests):
+            await asgi_request(app, method=method, path="/", headers=headers)
+
+    return timer.elapsed * 1_000_000 / requests
+
+
+async def main(requests, cases):
+    # main.py with the default settings (sql diagnostics off), it adds
+    # rate_limiter first, so it ends up innermost
+    combined = ["metrics", "compression", "cors", "rate_limiter"]
+    stacks = {"none": [], **{name: [name] for name in {**LAYERS, **BASELINES}}}
+    stacks["main"] = combined
+
+    for case in cases:
+        method, headers = CASES[case]
+        base = await measure(stack([]), method, headers, requests)
+        for name, names in stacks.items():
+            us = await measure(stack(names), method, headers, requests)
+            print(
+                f"middleware {case:<9} {name:<14} us/req={us:6.1f} "
+                f"overhead={us - base:6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=CASES)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.cases))
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+
+from sqlalchemy import delete, func, select
+
+from benchmarks.common import Timer, database, sessionmaker
+from models.my_model import MyModel, MyModelRequest
+from services import my_model as service_my_model
+
+
+async def seed(session_local, rows, gap_ratio):
+    async with session_local() as db:
+        batch = 10_000
+        for start in range(0, rows, batch):
+            size = min(batch, rows - start)
+            items = [
+                MyModelRequest(field1=f"Row {i}", field2=True) for i in range(size)
+            ]
+            await service_my_model.bulk_create(items, db)
+
+        # leave gaps like deleted rows would
+        if gap_ratio:
+            stride = max(2, int(1 / gap_ratio))
+            await db.execute(delete(MyModel).where(MyModel.id % stride == 0))
+            await db.commit()
+
+
+async def order_by_random(db, count):
+    stmt = select(MyModel).order_by(func.random()).limit(count)
+    result = await db.execute(stmt)
+    return list(result.scalars())
+
+
+async def id_probe(db, count):
+    return await service_my_model.get_random_rows(db, count)
+
+
+async def measure(session_local, fn, count, requests):
+    with Timer() as timer:
+        for _ in range(requests):
+            async with session_local() as db:
+                await fn(db, count)
+
+    return timer.elapsed * 1000 / requests
+
+
+async def main(url, sizes, count, requests, gap_ratio):
+    for size in sizes:
+        async with database(url) as engine:
+            session_local = sessionmaker(engine)
+            await seed(session_local, size, gap_ratio)
+
+            for name, fn in (
+                ("order by random()", order_by_random),
+                ("id probe", id_probe),
+            ):
+                ms = await measure(session_local, fn, count, requests)
+                print(f"rows={size:<10} count={count:<4} {name:<18} ms/req={ms:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--gap-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.sizes, args.count, args.requests, args.gap_ratio))
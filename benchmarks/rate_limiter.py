@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from benchmarks.common import Timer, asgi_request
+from helpers.rate_limiter import Rate, RateLimitMiddleware
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/")
+    async def read_root():
+        return {"Hello": "World"}
+
+    return app
+
+
+def no_limiter() -> FastAPI:
+    return create_app()
+
+
+def throttled_limiter() -> FastAPI:
+    # previous stack: two throttled limiters wrapped in BaseHTTPMiddleware,
+    # with limits high enough that no request is rejected
+    from throttled.fastapi import IPLimiter, TotalLimiter
+    from throttled.models import Rate as ThrottledRate
+    from throttled.storage.memory import MemoryStorage
+
+    app = create_app()
+    memory = MemoryStorage(cache={})
+    total_limiter = TotalLimiter(limit=ThrottledRate(10**9, 1), storage=memory)
+    ip_limiter = IPLimiter(limit=ThrottledRate(10**9, 1), storage=memory)
+    app.add_middleware(BaseHTTPMiddleware, dispatch=total_limiter.dispatch)
+    app.add_middleware(BaseHTTPMiddleware, dispatch=ip_limiter.dispatch)
+    return app
+
+
+def gcra_limiter() -> FastAPI:
+    app = create_app()
+    app.add_middleware(RateLimitMiddleware, rate=Rate(10**9, 1), total=Rate(10**9, 1))
+    return app
+
+
+async def measure(app, requests, clients):
+    with Timer() as timer:
+        for i in range(requests):
+            client = (f"10.0.{i % clients // 256}.{i % 256}", 50000)
+            status, _ = await asgi_request(app, client=client)
+            assert status == 200, status
+
+    return requests / timer.elapsed
+
+
+async def main(requests, clients):
+    for name, factory in (
+        ("no limiter", no_limiter),
+        ("throttled + BaseHTTPMiddleware", throttled_limiter),
+        ("pure asgi gcra", gcra_limiter),
+    ):
+        app = factory()
+        await measure(app, 200, clients)
+        rps = await measure(app, requests, clients)
+        print(f"{name:<32} req/s={rps:,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=1000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.clients))
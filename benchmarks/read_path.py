@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import select
+
+from benchmarks.common import Timer, database, sessionmaker
+from helpers.cache import NullCache, get_cache, set_cache
+from models.my_model import MyModel, MyModelRequest, MyModelSchema
+from services import my_model as service_my_model
+
+
+async def seed(session_local, rows):
+    async with session_local() as db:
+        batch = 10_000
+        for start in range(0, rows, batch):
+            size = min(batch, rows - start)
+            items = [
+                MyModelRequest(field1=f"Row {i}", field2=True) for i in range(size)
+            ]
+            await service_my_model.bulk_create(items, db)
+
+
+async def orm_by_id(db, ids):
+    # previous path: full entities through the identity map
+    for id in ids:
+        result = await db.execute(select(MyModel).where(MyModel.id == id))
+        MyModelSchema.model_validate(result.scalar_one())
+
+
+async def core_by_id(db, ids):
+    for id in ids:
+        await service_my_model.find_by_id(id, db)
+
+
+async def orm_many(db, ids):
+    result = await db.execute(select(MyModel).where(MyModel.id.in_(ids)))
+    [MyModelSchema.model_validate(item) for item in result.scalars()]
+
+
+async def core_many(db, ids):
+    await service_my_model._find_many(ids, db)
+
+
+async def measure(session_local, fn, ids, batch, requests):
+    rows = 0
+    with Timer() as timer:
+        for _ in range(requests):
+            sample = random.sample(ids, batch)
+            async with session_local() as db:
+                await fn(db, sample)
+            rows += batch
+
+    return rows / timer.elapsed
+
+
+async def main(url, size, batch, requests):
+    # measure the database path, not cache hits
+    previous = get_cache()
+    set_cache(NullCache())
+
+    try:
+        async with database(url) as engine:
+            session_local = sessionmaker(engine)
+            await seed(session_local, size)
+
+            async with session_local() as db:
+                ids = list((await db.execute(select(MyModel.id))).scalars())
+
+            for name, fn, count in (
+                ("orm by id", orm_by_id, 1),
+                ("core by id", core_by_id, 1),
+                ("orm in (batch)", orm_many, batch),
+                ("core in (batch)", core_many, batch),
+            ):
+                rate = await measure(session_local, fn, ids, count, requests)
+                print(f"rows={size:<8} {name:<20} rows/s={rate:.0f}")
+    finally:
+        set_cache(previous)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.size, args.batch, args.requests))
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from benchmarks.common import Timer, asgi_request, database, sessionmaker
+from helpers import router, serialization
+from helpers.db import get_read_session
+from models.my_model import (
+    MyModel,
+    MyModelListResponse,
+    MyModelRequest,
+    MyModelSchema,
+)
+from services import my_model as service_my_model
+
+LIST_ADAPTER = TypeAdapter(MyModelListResponse)
+
+
+def default_path(rows) -> bytes:
+    # what the list route does by default: validate every row into a schema,
+    # then fastapi checks the response model and encodes it
+    models = [MyModelSchema.model_validate(row) for row in rows]
+    response = MyModelListResponse(message="list", models=models)
+    return LIST_ADAPTER.dump_json(LIST_ADAPTER.validate_python(response))
+
+
+def construct_path(rows) -> bytes:
+    # skip validation with model_construct, same encoder
+    models = [MyModelSchema.model_construct(**row._mapping) for row in rows]
+    response = MyModelListResponse.model_construct(message="list", models=models)
+    return response.__pydantic_serializer__.to_json(response)
+
+
+def fast_path(rows) -> bytes:
+    return serialization.dump_json(
+        MyModelListResponse,
+        message="list",
+        models=serialization.as_dicts(rows),
+        next_cursor=None,
+    )
+
+
+async def seed(session_local, rows):
+    async with session_local() as db:
+        items = [MyModelRequest(field1=f"Row {i}", field2=True) for i in range(rows)]
+        await service_my_model.bulk_create(items, db)
+
+
+def micro(rows, iterations):
+    assert default_path(rows) == construct_path(rows) == fast_path(rows)
+
+    for name, fn in (
+        ("default", default_path),
+        ("construct", construct_path),
+        ("fast", fast_path),
+    ):
+        with Timer() as timer:
+            for _ in range(iterations):
+                fn(rows)
+
+        us = timer.elapsed * 1_000_000 / iterations
+        print(f"serialize rows={len(rows):<6} {name:<10} us/op={us:.1f}")
+
+
+async def endpoint(session_local, limit, requests):
+    app = FastAPI()
+    router.setup(app)
+
+    async def override_get_read_session():
+        async with session_local() as session:
+            yield session
+
+    app.dependency_overrides[get_read_session] = override_get_read_session
+    path = f"/api/my-model/list?limit={limit}"
+
+    for name, fast in (("default", False), ("fast", True)):
+        with patch.object(serialization, "FAST_SERIALIZATION", fast):
+            with Timer() as timer:
+                for _ in range(requests):
+                    status, _ = await asgi_request(app, path=path)
+                    assert status == 200, status
+
+        print(
+            f"endpoint limit={limit:<6} {name:<10} req/s={requests / timer.elapsed:.0f}"
+        )
+
+
+async def main(url, sizes, iterations, requests):
+    async with database(url) as engine:
+        session_local = sessionmaker(engine)
+        await seed(session_local, max(sizes))
+
+        for size in sizes:
+            async with session_local() as db:
+                result = await db.execute(
+                    select(*service_my_model.RETURNING_COLUMNS)
+                    .order_by(MyModel.id)
+                    .limit(size)
+                )
+                rows = result.all()
+
+            micro(rows, iterations)
+            await endpoint(session_local, size, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.url, args.sizes, args.iterations, args.requests))
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import random
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.common import Timer, database, sessionmaker
+from helpers.cache import NullCache, get_cache, set_cache
+from helpers.db import create_engine
+from models.my_model import MyModel
+from services import my_model as service_my_model
+
+
+async def workload(write_session, read_session, clients, requests, write_ratio):
+    ids = []
+    errors = 0
+
+    async with write_session() as db:
+        db.add(MyModel(field1="Seed", field2=True))
+        await db.commit()
+        ids.append(1)
+
+    async def client(index):
+        nonlocal errors
+        for _ in range(index, requests, clients):
+            try:
+                if random.random() < write_ratio:
+                    async with write_session() as db:
+                        obj = MyModel(field1="Row", field2=True)
+                        db.add(obj)
+                        await db.flush()
+                        id = obj.id
+                        await db.commit()
+                        ids.append(id)
+                else:
+                    async with read_session() as db:
+                        await service_my_model.find_by_id(random.choice(ids), db)
+            except OperationalError:
+                errors += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*[client(index) for index in range(clients)])
+
+    return requests / timer.elapsed, errors
+
+
+async def main(clients, requests, write_ratio):
+    # measure the database, not cache hits
+    previous = get_cache()
+    set_cache(NullCache())
+
+    try:
+        for name in ("default", "wal + single writer"):
+            async with database() as engine:
+                url = engine.url.render_as_string(hide_password=False)
+
+                if name == "default":
+                    # no pragmas, one pool for reads and writes
+                    writer = reader = create_async_engine(
+                        url, pool_size=10, max_overflow=10
+                    )
+                else:
+                    writer = create_engine(url)
+                    reader = create_engine(url, read_only=True)
+
+                rate, errors = await workload(
+                    sessionmaker(writer),
+                    sessionmaker(reader),
+                    clients,
+                    requests,
+                    write_ratio,
+                )
+                print(
+                    f"clients={clients:<4} writes={write_ratio:<5} {name:<20} "
+                    f"req/s={rate:.0f} errors={errors}"
+                )
+
+                await writer.dispose()
+                await reader.dispose()
+    finally:
+        set_cache(previous)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.clients, args.requests, args.write_ratio))
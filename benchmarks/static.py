@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from benchmarks.common import Timer, asgi_request
+from helpers.static import STATIC_DIRECTORY, StaticCache
+
+
+def build_app(static_app) -> FastAPI:
+    app = FastAPI()
+    app.mount("/", static_app, name="public")
+    return app
+
+
+async def main(requests):
+    apps = {
+        "files": build_app(StaticFiles(directory=STATIC_DIRECTORY, html=True)),
+        "cache": build_app(StaticCache(STATIC_DIRECTORY)),
+    }
+    cases = {
+        "index": ("/", [(b"accept-encoding", b"gzip, br")]),
+        "revalidate": ("/", None),
+        "missing": ("/missing/path", None),
+    }
+
+    for name, app in apps.items():
+        # the etag the client got for the page, sent back on revalidation
+        response_headers = []
+        await asgi_request(app, path="/", response_headers=response_headers)
+        etag = dict(response_headers)[b"etag"]
+
+        for case, (path, headers) in cases.items():
+            if case == "revalidate":
+                headers = [(b"if-none-match", etag)]
+
+            size = 0
+            with Timer() as timer:
+                for _ in range(requests):
+                    status, body = await asgi_request(app, path=path, headers=headers)
+                    size += len(body)
+
+            print(
+                f"static {case:<11} {name:<6} status={status} "
+                f"req/s={requests / timer.elapsed:.0f} bytes/req={size // requests}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
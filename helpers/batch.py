@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from sqlalchemy import Row, Select, and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from helpers.db import AsyncSessionLocal
+from helpers.scheduler import scheduler
+from models.batch import BatchCheckpoint
+
+logger = logging.getLogger(__name__)
+
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "1000"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "2"))
+
+ChunkProcessor = Callable[[Sequence[Row], AsyncSession], Awaitable[Any]]
+
+_tables_ready: set[int] = set()
+
+
+async def ensure_tables(sessionmaker: async_sessionmaker):
+    engine = sessionmaker.kw["bind"]
+    if id(engine) in _tables_ready:
+        return
+
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            BatchCheckpoint.metadata.create_all,
+            tables=[BatchCheckpoint.__table__],
+            checkfirst=True,
+        )
+    _tables_ready.add(id(engine))
+
+
+def dump_key(value: Any) -> str:
+    # json keeps numbers and strings, other keys (dates, uuids, decimals) are
+    # stored as their str() and parsed back by parse_key
+    return json.dumps(value, default=str)
+
+
+def key_columns(key) -> list:
+    # a key that is not the primary key is paged together with it, like
+    # list_query does for created_at: rows sharing the key value of a chunk's
+    # last row would be skipped by a plain key > last_key
+    column = getattr(key, "expression", key)
+    table = getattr(column, "table", None)
+    primary_key = list(table.primary_key.columns) if table is not None else []
+    if not primary_key or [pk.name for pk in primary_key] == [column.name]:
+        return [key]
+    return [key, *primary_key]
+
+
+def seek(columns: list, values: tuple):
+    # (a, b) > (x, y) spelled out, row value comparisons are not portable
+    clause = columns[-1] > values[-1]
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        clause = or_(column > value, and_(column == value, clause))
+    return clause
+
+
+def parse_value(value: Any, column) -> Any:
+    # converts a stored value back to the python type of its column
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+
+    if value is None or isinstance(value, python_type):
+        return value
+    if hasattr(python_type, "fromisoformat"):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def parse_key(value: Any, key=None) -> Any:
+    # a single column key is stored as its value, a paged one as a list
+    if key is None:
+        return value
+
+    columns = key_columns(key)
+    if len(columns) == 1:
+        return parse_value(value, key)
+    return tuple(parse_value(item, column) for item, column in zip(value, columns))
+
+
+async def load_checkpoint(
+    name: str, sessionmaker: async_sessionmaker = AsyncSessionLocal, key=None
+) -> Optional[tuple[Any, int]]:
+    await ensure_tables(sessionmaker)
+
+    async with sessionmaker() as session:
+        result = await session.execute(
+            select(BatchCheckpoint.last_key, BatchCheckpoint.rows).where(
+                BatchCheckpoint.name == name
+            )
+        )
+        row = result.one_or_none()
+        if row is None or row.last_key is None:
+            return None
+        return parse_key(json.loads(row.last_key), key), row.rows
+
+
+async def save_checkpoint(
+    name: str,
+    last_key: Any,
+    rows: int,
+    sessionmaker: async_sessionmaker = AsyncSessionLocal,
+):
+    values = {"last_key": dump_key(last_key), "rows": rows}
+
+    async with sessionmaker() as session:
+        result = await session.execute(
+            update(BatchCheckpoint).where(BatchCheckpoint.name == name).values(values)
+        )
+        if not result.rowcount:
+            try:
+                async with session.begin_nested():
+                    await session.execute(
+                        insert(BatchCheckpoint).values(name=name, **values)
+                    )
+            except IntegrityError:
+                await session.execute(
+                    update(BatchCheckpoint)
+                    .where(BatchCheckpoint.name == name)
+                    .values(values)
+                )
+        await session.commit()
+
+
+async def clear_checkpoint(
+    name: str, sessionmaker: async_sessionmaker = AsyncSessionLocal
+):
+    async with sessionmaker() as session:
+        await session.execute(
+            delete(BatchCheckpoint).where(BatchCheckpoint.name == name)
+        )
+        await session.commit()
+
+
+async def run_batch(
+    name: str,
+    query: Select,
+    key,
+    process: ChunkProcessor,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    concurrency: int = BATCH_CONCURRENCY,
+    sessionmaker: async_sessionmaker = AsyncSessionLocal,
+) -> dict[str, Any]:
+    # walks the query in key order (then primary key order, when the key is
+    # another column) one chunk at a time. every chunk is
+    # processed in its own session and committed on its own, and the
+    # checkpoint only moves past a chunk once it and all chunks before it are
+    # committed. a chunk that committed right before a crash is processed
+    # again on resume, so processors must be idempotent
+    checkpoint = await load_checkpoint(name, sessionmaker, key)
+    last_key, done_rows = checkpoint or (None, 0)
+    resumed_from = last_key
+
+    semaphore = asyncio.Semaphore(concurrency)
+    checkpoint_lock = asyncio.Lock()
+    pending: list[tuple[int, Any, int]] = []
+    finished: set[int] = set()
+    errors: list[Exception] = []
+    tasks: list[asyncio.Task] = []
+    chunks = 0
+    rows_processed = 0
+    start = time.perf_counter()
+
+    async def advance():
+        nonlocal done_rows
+        async with checkpoint_lock:
+            moved = None
+            while pending and pending[0][0] in finished:
+                index, moved, count = pending.pop(0)
+                finished.discard(index)
+                done_rows += count
+            if moved is not None:
+                await save_checkpoint(name, moved, done_rows, sessionmaker)
+
+    async def run_chunk(index: int, rows: Sequence[Row]):
+        nonlocal rows_processed
+        try:
+            async with sessionmaker() as session:
+                await process(rows, session)
+                await session.commit()
+            rows_processed += len(rows)
+            finished.add(index)
+            await advance()
+        except Exception as e:
+            logger.exception("[batch : %s]", name)
+            errors.append(e)
+        finally:
+            semaphore.release()
+
+    columns = key_columns(key)
+    names = [column.name for column in columns]
+    missing = [c for c in columns if c.name not in query.selected_columns.keys()]
+    if missing:
+        query = query.add_columns(*missing)
+
+    try:
+        async with sessionmaker() as reader:
+            while not errors:
+                stmt = query.order_by(*columns).limit(chunk_size)
+                if last_key is not None:
+                    values = last_key if len(columns) > 1 else (last_key,)
+                    stmt = stmt.where(seek(columns, values))
+
+                result = await reader.execute(stmt)
+                rows = result.all()
+
+                # end the read transaction instead of holding it while the
+                # chunk is processed
+                await reader.rollback()
+                if not rows:
+                    break
+
+                values = tuple(rows[-1]._mapping[name] for name in names)
+                last_key = values if len(columns) > 1 else values[0]
+                pending.append((chunks, last_key, len(rows)))
+
+                await semaphore.acquire()
+                tasks = [task for task in tasks if not task.done()]
+                tasks.append(asyncio.create_task(run_chunk(chunks, rows)))
+                chunks += 1
+
+                if len(rows) < chunk_size:
+                    break
+
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    if errors:
+        # the checkpoint stays after the last chunk committed in order
+        raise errors[0]
+
+    await clear_checkpoint(name, sessionmaker)
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "name": name,
+        "chunks": chunks,
+        "rows": rows_processed,
+        "seconds": seconds,
+        "rows_per_second": rows_processed / seconds if seconds > 0 else 0.0,
+        "resumed_from": resumed_from,
+    }
+    logger.info(
+        "Batch %s processed %s rows in %s chunks (%.1f rows/s)",
+        name,
+        rows_processed,
+        chunks,
+        stats["rows_per_second"],
+    )
+    return stats
+
+
+def scheduled_batch(
+    name: str,
+    query: Select,
+    key,
+    trigger: str,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    concurrency: int = BATCH_CONCURRENCY,
+    **trigger_args,
+):
+    # registers the decorated chunk processor as a scheduler job, the batch
+    # name doubles as the job id so runs are claimed once across workers
+    def decorator(process: ChunkProcessor) -> ChunkProcessor:
+        async def job():
+            return await run_batch(name, query, key, process, chunk_size, concurrency)
+
+        scheduler.add_job(
+            job, trigger, id=name, name=name, replace_existing=True, **trigger_args
+        )
+        return process
+
+    return decorator
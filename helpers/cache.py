@@ -0,0 +1,238 @@
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_URL = os.environ.get("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "60"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "100000"))
+CACHE_PREFIX = os.environ.get("CACHE_PREFIX", "app:")
+
+
+class Cache(ABC):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        values = await self.get_many([key])
+        return values.get(key)
+
+    @abstractmethod
+    async def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        pass
+
+    @abstractmethod
+    async def clear(self):
+        pass
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "errors": self.errors,
+        }
+
+    def _count(self, requested: int, found: int):
+        self.hits += found
+        self.misses += requested - found
+
+
+class NullCache(Cache):
+    async def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        self._count(len(list(keys)), 0)
+        return {}
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+    async def clear(self):
+        pass
+
+
+class MemoryCache(Cache):
+    # lru ordered, bounded by entry count and by the size of the stored bytes
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL,
+        max_bytes: int = CACHE_MAX_BYTES,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        super().__init__()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        keys = list(keys)
+        now = time.monotonic()
+        values = {}
+
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+
+            expires_at, value = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                continue
+
+            self._entries.move_to_end(key)
+            values[key] = value
+
+        self._count(len(keys), len(values))
+        return values
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if len(value) > self.max_bytes:
+            return
+
+        self._remove(key)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self.size += len(value)
+
+        while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._remove(key)
+
+    async def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict[str, Any]:
+        stats = super().stats()
+        stats.update(
+            {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+        )
+        return stats
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class SharedCache(Cache):
+    # any client with the redis asyncio api subset used here (get, mget, set,
+    # delete, scan_iter) works, so tests and local runs can pass a stand-in.
+    # store failures are logged and treated as misses so reads fall back to
+    # the database
+    def __init__(self, client, ttl: float = CACHE_TTL, prefix: str = CACHE_PREFIX):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get_many(self, keys: Iterable[str]) -> dict[str, bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        try:
+            raw = await self.client.mget([self.prefix + key for key in keys])
+        except Exception:
+            logger.exception("[cache : get many]")
+            self.errors += 1
+            raw = [None] * len(keys)
+
+        values = {key: value for key, value in zip(keys, raw) if value is not None}
+
+        self._count(len(keys), len(values))
+        return values
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        try:
+            await self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+        except Exception:
+            logger.exception("[cache : set]")
+            self.errors += 1
+
+    async def delete(self, *keys: str):
+        if not keys:
+            return
+
+        try:
+            await self.client.delete(*[self.prefix + key for key in keys])
+        except Exception:
+            logger.exception("[cache : delete]")
+            self.errors += 1
+
+    async def clear(self):
+        try:
+            keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+            if keys:
+                await self.client.delete(*keys)
+        except Exception:
+            logger.exception("[cache : clear]")
+            self.errors += 1
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> Cache:
+    if backend == "none":
+        return NullCache()
+
+    if backend == "redis":
+        # optional dependency, only needed when the shared backend is selected
+        from redis import asyncio as redis
+
+        return SharedCache(redis.from_url(CACHE_URL))
+
+    return MemoryCache()
+
+
+_cache = create_cache()
+
+
+def get_cache() -> Cache:
+    return _cache
+
+
+def set_cache(cache: Cache):
+    global _cache
+    _cache = cache
@@ -0,0 +1,285 @@
+import asyncio
+import os
+import zlib
+from typing import Any, Optional
+
+from fastapi import FastAPI
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional, pip install brotli
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, pip install zstandard
+    zstandard = None
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+
+# smaller bodies cost more cpu than the bytes they save
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# content type prefixes worth compressing
+COMPRESSION_TYPES = [
+    content_type.strip()
+    for content_type in os.environ.get(
+        "COMPRESSION_TYPES",
+        "application/json,application/x-ndjson,text/,application/javascript,"
+        "image/svg+xml",
+    ).split(",")
+    if content_type.strip()
+]
+
+# server preference when the client accepts several with the same weight
+COMPRESSION_ENCODINGS = [
+    encoding.strip()
+    for encoding in os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+    if encoding.strip()
+]
+
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3"))
+
+# bodies above this size are compressed in a thread (zlib, brotli and zstd
+# release the gil) so the event loop keeps serving other requests
+COMPRESSION_THREAD_MIN_SIZE = int(
+    os.environ.get("COMPRESSION_THREAD_MIN_SIZE", str(256 * 1024))
+)
+
+
+class Gzip:
+    name = "gzip"
+    max_level = 9
+
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        self.level = level
+
+    def compress(self, data: bytes, level: Optional[int] = None) -> bytes:
+        compressor = zlib.compressobj(
+            self.level if level is None else level, zlib.DEFLATED, 31
+        )
+        return compressor.compress(data) + compressor.flush()
+
+    def compressor(self) -> "StreamCompressor":
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return StreamCompressor(
+            compressor.compress,
+            lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush,
+        )
+
+
+class Brotli:
+    name = "br"
+    max_level = 11
+
+    def __init__(self, level: int = COMPRESSION_BROTLI_QUALITY):
+        self.level = level
+
+    def compress(self, data: bytes, level: Optional[int] = None) -> bytes:
+        return brotli.compress(data, quality=self.level if level is None else level)
+
+    def compressor(self) -> "StreamCompressor":
+        compressor = brotli.Compressor(quality=self.level)
+        return StreamCompressor(compressor.process, compressor.flush, compressor.finish)
+
+
+class Zstd:
+    name = "zstd"
+    max_level = 19
+
+    def __init__(self, level: int = COMPRESSION_ZSTD_LEVEL):
+        self.level = level
+
+    def compress(self, data: bytes, level: Optional[int] = None) -> bytes:
+        return zstandard.ZstdCompressor(
+            level=self.level if level is None else level
+        ).compress(data)
+
+    def compressor(self) -> "StreamCompressor":
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return StreamCompressor(
+            compressor.compress,
+            lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+            compressor.flush,
+        )
+
+
+class StreamCompressor:
+    # every chunk is flushed, so a streamed response reaches the client as it
+    # is produced instead of waiting in the compressor
+    def __init__(self, process, flush, finish):
+        self.process = process
+        self.flush = flush
+        self.finish = finish
+
+    def chunk(self, data: bytes) -> bytes:
+        return self.process(data) + self.flush()
+
+
+# codecs usable in this process, by content-coding name
+CODECS: dict[str, Any] = {"gzip": Gzip()}
+if brotli is not None:
+    CODECS["br"] = Brotli()
+if zstandard is not None:
+    CODECS["zstd"] = Zstd()
+
+
+def accepted_encodings(header: str) -> dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name] = q
+    return accepted
+
+
+def negotiate(header: str, encodings: list[str]) -> Optional[str]:
+    # highest client weight wins, ties go to the first in the server order
+    accepted = accepted_encodings(header)
+    best = None
+    best_q = 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in CODECS and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        min_size: int = COMPRESSION_MIN_SIZE,
+        content_types: Optional[list[str]] = None,
+        encodings: Optional[list[str]] = None,
+        thread_min_size: int = COMPRESSION_THREAD_MIN_SIZE,
+    ):
+        self.app = app
+        self.min_size = min_size
+        self.content_types = tuple(content_types or COMPRESSION_TYPES)
+        self.encodings = [e for e in encodings or COMPRESSION_ENCODINGS if e in CODECS]
+        self.thread_min_size = thread_min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+
+        encoding = (
+            negotiate(accept_encoding, self.encodings) if accept_encoding else None
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(self, send, CODECS[encoding])
+        await self.app(scope, receive, responder.send)
+
+    def is_compressible(self, headers: Headers) -> bool:
+        return (
+            "content-encoding" not in headers
+            and "no-transform" not in headers.get("cache-control", "")
+            and headers.get("content-type", "").startswith(self.content_types)
+        )
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, send: Send, codec):
+        self.middleware = middleware
+        self.upstream = send
+        self.codec = codec
+        self.start: Optional[Message] = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if self.passthrough:
+            await self.upstream(message)
+            return
+
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] in (204, 304) or not self.middleware.is_compressible(
+                headers
+            ):
+                self.passthrough = True
+                await self.upstream(message)
+                return
+
+            # held back until the first body chunk tells the size
+            self.start = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.upstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+
+            if not more_body and len(body) < self.middleware.min_size:
+                self.passthrough = True
+                await self.upstream(start)
+                await self.upstream(message)
+                return
+
+            headers["content-encoding"] = self.codec.name
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # the compressed bytes differ, a strong validator would lie
+                headers["etag"] = f"W/{etag}"
+
+            if not more_body:
+                body = await self.compress(body)
+                headers["content-length"] = str(len(body))
+                await self.upstream(start)
+                await self.upstream({"type": "http.response.body", "body": body})
+                return
+
+            del headers["content-length"]
+            self.compressor = self.codec.compressor()
+            await self.upstream(start)
+
+        chunk = self.compressor.chunk(body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.upstream(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
+
+    async def compress(self, body: bytes) -> bytes:
+        if len(body) >= self.middleware.thread_min_size:
+            return await asyncio.to_thread(self.codec.compress, body)
+        return self.codec.compress(body)
+
+
+def setup(app: FastAPI):
+    if not COMPRESSION_ENABLED:
+        return
+
+    app.add_middleware(CompressionMiddleware)
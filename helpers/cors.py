@@ -1,12 +1,207 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# comma separated origins, "*" for any origin, empty to disable cors
+CORS_ALLOW_ORIGINS = os.environ.get("CORS_ALLOW_ORIGINS", "*")
+
+# only honoured for listed origins, browsers refuse credentials with "*"
+CORS_ALLOW_CREDENTIALS = (
+    os.environ.get("CORS_ALLOW_CREDENTIALS", "false").lower() == "true"
+)
+
+CORS_ALLOW_METHODS = os.environ.get("CORS_ALLOW_METHODS", "*")
+CORS_ALLOW_HEADERS = os.environ.get("CORS_ALLOW_HEADERS", "*")
+CORS_EXPOSE_HEADERS = os.environ.get("CORS_EXPOSE_HEADERS", "")
+
+# how long browsers may reuse a preflight answer
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", "600"))
+
+# preflight answers kept in memory, keyed by origin and requested method and
+# headers, before the least recently used are dropped
+CORS_PREFLIGHT_CACHE_SIZE = int(os.environ.get("CORS_PREFLIGHT_CACHE_SIZE", "1024"))
+
+ALL_METHODS = ("DELETE", "GET", "HEAD", "OPTIONS", "PATCH", "POST", "PUT")
+SAFELISTED_HEADERS = {"accept", "accept-language", "content-language", "content-type"}
+
+Preflight = tuple[int, list[tuple[bytes, bytes]], bytes]
+
+
+def split(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class CORSMiddleware:
+    # every header that does not depend on the request is built once, and
+    # preflight answers are cached, so a cors request costs a dict lookup
+    def __init__(
+        self,
+        app: ASGIApp,
+        allow_origins: Optional[list[str]] = None,
+        allow_credentials: bool = CORS_ALLOW_CREDENTIALS,
+        allow_methods: Optional[list[str]] = None,
+        allow_headers: Optional[list[str]] = None,
+        expose_headers: Optional[list[str]] = None,
+        max_age: int = CORS_MAX_AGE,
+        cache_size: int = CORS_PREFLIGHT_CACHE_SIZE,
+    ):
+        origins = split(CORS_ALLOW_ORIGINS) if allow_origins is None else allow_origins
+        methods = split(CORS_ALLOW_METHODS) if allow_methods is None else allow_methods
+        headers = split(CORS_ALLOW_HEADERS) if allow_headers is None else allow_headers
+        expose = (
+            split(CORS_EXPOSE_HEADERS) if expose_headers is None else expose_headers
+        )
+
+        self.app = app
+        self.allow_all_origins = "*" in origins
+        self.allow_origins = {origin.encode("latin-1") for origin in origins}
+        if allow_credentials and self.allow_all_origins:
+            logger.warning("[cors] credentials are not allowed with origin *")
+            allow_credentials = False
+
+        self.allow_all_headers = "*" in headers
+        self.allow_headers = SAFELISTED_HEADERS | {h.lower() for h in headers}
+        self.allow_methods = ALL_METHODS if "*" in methods else tuple(methods)
+        self.cache_size = cache_size
+        self.preflights: OrderedDict[tuple[bytes, bytes, bytes], Preflight] = (
+            OrderedDict()
+        )
+
+        self.simple_headers: list[tuple[bytes, bytes]] = []
+        self.preflight_headers: list[tuple[bytes, bytes]] = [
+            (b"access-control-allow-methods", ", ".join(self.allow_methods).encode()),
+            (b"access-control-max-age", str(max_age).encode()),
+        ]
+        if allow_credentials:
+            self.simple_headers.append((b"access-control-allow-credentials", b"true"))
+            self.preflight_headers.append(
+                (b"access-control-allow-credentials", b"true")
+            )
+        if expose:
+            self.simple_headers.append(
+                (b"access-control-expose-headers", ", ".join(expose).encode())
+            )
+        if not self.allow_all_origins:
+            # the answer depends on the origin, shared caches must key on it
+            self.preflight_headers.append((b"vary", b"Origin"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        request_method = None
+        request_headers = b""
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        # same origin and non browser requests carry no origin
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self.send_preflight(send, origin, request_method, request_headers)
+            return
+
+        if not self.is_allowed_origin(origin):
+            await self.app(scope, receive, send)
+            return
+
+        allow_origin = b"*" if self.allow_all_origins else origin
+
+        async def send_with_cors(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.raw.append((b"access-control-allow-origin", allow_origin))
+                headers.raw.extend(self.simple_headers)
+                if not self.allow_all_origins:
+                    headers.add_vary_header("Origin")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    def is_allowed_origin(self, origin: bytes) -> bool:
+        return self.allow_all_origins or origin in self.allow_origins
+
+    def preflight(
+        self, origin: bytes, request_method: bytes, request_headers: bytes
+    ) -> Preflight:
+        key = (origin, request_method, request_headers)
+        preflight = self.preflights.get(key)
+        if preflight is not None:
+            self.preflights.move_to_end(key)
+            return preflight
+
+        preflight = self.build_preflight(origin, request_method, request_headers)
+        self.preflights[key] = preflight
+        if len(self.preflights) > self.cache_size:
+            self.preflights.popitem(last=False)
+        return preflight
+
+    def build_preflight(
+        self, origin: bytes, request_method: bytes, request_headers: bytes
+    ) -> Preflight:
+        requested = split(request_headers.decode("latin-1").lower())
+        failures = []
+        if not self.is_allowed_origin(origin):
+            failures.append("origin")
+        if request_method.decode("latin-1") not in self.allow_methods:
+            failures.append("method")
+        if not self.allow_all_headers and not all(
+            header in self.allow_headers for header in requested
+        ):
+            failures.append("headers")
+
+        headers = list(self.preflight_headers)
+        if failures:
+            body = f"Disallowed CORS {', '.join(failures)}".encode()
+            return 400, headers, body
+
+        allow_origin = b"*" if self.allow_all_origins else origin
+        headers.append((b"access-control-allow-origin", allow_origin))
+        if requested:
+            allowed = (
+                requested if self.allow_all_headers else sorted(self.allow_headers)
+            )
+            headers.append(
+                (b"access-control-allow-headers", ", ".join(allowed).encode())
+            )
+        return 200, headers, b"OK"
+
+    async def send_preflight(
+        self, send: Send, origin: bytes, request_method: bytes, request_headers: bytes
+    ):
+        status, headers, body = self.preflight(origin, request_method, request_headers)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": headers
+                + [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
 
 
 def setup(app: FastAPI):
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-    )
+    if not split(CORS_ALLOW_ORIGINS):
+        return
+
+    app.add_middleware(CORSMiddleware)
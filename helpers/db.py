@@ -1,22 +1,166 @@
 import logging
 import os
-from typing import Annotated, AsyncIterator
+import time
+from typing import Annotated, Any, AsyncIterator, Optional
 
 from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import functions
+
+from helpers.metrics import Histogram
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./app.db"
 DATABASE_URL = os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URL)
 
-async_engine = create_async_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    echo=os.environ.get("ECHO_SQL", "false").lower() == "true",
-)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# comma separated replica urls for read only sessions
+READ_DATABASE_URLS = [
+    url.strip()
+    for url in os.environ.get("READ_DATABASE_URL", "").split(",")
+    if url.strip()
+]
+DB_READ_STRATEGY = os.environ.get("DB_READ_STRATEGY", "round-robin")
+DB_READ_RETRY_AFTER = float(os.environ.get("DB_READ_RETRY_AFTER", "30"))
+
+# file backed sqlite: pragmas applied to every new connection
+SQLITE_WAL = os.environ.get("SQLITE_WAL", "true").lower() == "true"
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"))
+
+# sqlite allows one writer at a time: with a single writer connection
+# concurrent writes wait in the pool instead of failing with "database is
+# locked", and read only sessions get their own pool of reader connections
+SQLITE_SINGLE_WRITER = os.environ.get("SQLITE_SINGLE_WRITER", "true").lower() == "true"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # queue pool that records how long callers wait to get a connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.checkout_latency = Histogram()
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 and self.checkedout() >= (
+            self.size() + self._max_overflow
+        )
+        start = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.checkouts += 1
+            self.checkout_latency.observe(elapsed)
+            if exhausted:
+                self.waits += 1
+                self.wait_seconds += elapsed
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_sqlite_file(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database not in (None, "", ":memory:")
+
+
+def engine_options(url: str, read_only: bool = False) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "echo": os.environ.get("ECHO_SQL", "false").lower() == "true",
+    }
+
+    # in memory sqlite keeps its single shared connection (static pool)
+    if is_sqlite(url) and not is_sqlite_file(url):
+        return options
+
+    options.update(
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
+    if is_sqlite_file(url) and SQLITE_SINGLE_WRITER and not read_only:
+        options.update(pool_size=1, max_overflow=0)
+
+    if make_url(url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE
+        }
+
+    return options
+
+
+def sqlite_pragmas(read_only: bool = False) -> list[str]:
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}",
+        f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}",
+    ]
+
+    if SQLITE_WAL:
+        # readers no longer block the writer, and with wal a normal sync only
+        # risks the last commits on power loss, never corruption
+        pragmas += [
+            "PRAGMA journal_mode = WAL",
+            f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}",
+        ]
+
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+
+    return pragmas
+
+
+def create_engine(url: str, read_only: bool = False) -> AsyncEngine:
+    engine = create_async_engine(url, **engine_options(url, read_only))
+
+    if is_sqlite_file(url):
+        pragmas = sqlite_pragmas(read_only)
+
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+        event.listen(engine.sync_engine, "connect", set_pragmas)
+
+    return engine
+
+
+async_engine = create_engine(DATABASE_URL)
 
 AsyncSessionLocal = async_sessionmaker(
     bind=async_engine,
@@ -28,6 +172,14 @@ class Base(DeclarativeBase):
     pass
 
 
+@compiles(functions.now, "sqlite")
+def sqlite_now(element, compiler, **kw):
+    # store server timestamps in the same format sqlalchemy binds datetimes,
+    # so comparisons against timestamp columns (keyset cursors, time ranges)
+    # match instead of comparing "12:00:00" with "12:00:00.000000"
+    return "STRFTIME('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
 async def get_session() -> AsyncIterator[AsyncSession]:
     async with AsyncSessionLocal() as session:
         try:
@@ -39,3 +191,130 @@ async def get_session() -> AsyncIterator[AsyncSession]:
 
 
 DatabaseSession = Annotated[AsyncSession, Depends(get_session)]
+
+
+class ReadReplicas:
+    def __init__(
+        self,
+        urls: list[str],
+        strategy: str = DB_READ_STRATEGY,
+        retry_after: float = DB_READ_RETRY_AFTER,
+    ):
+        if strategy not in ("round-robin", "least-connections"):
+            raise ValueError(f"Unknown read strategy: {strategy}")
+
+        self.urls = urls
+        self.strategy = strategy
+        self.retry_after = retry_after
+        self.engines = [create_engine(url, read_only=True) for url in urls]
+        self.sessionmakers = [
+            async_sessionmaker(bind=engine, autoflush=False) for engine in self.engines
+        ]
+        self.unhealthy_until = [0.0] * len(urls)
+        self.fallbacks = 0
+        self._next = 0
+
+        for index, engine in enumerate(self.engines):
+            event.listen(engine.sync_engine, "handle_error", self._on_error(index))
+
+    def _on_error(self, index: int):
+        def handle_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.mark_unhealthy(index)
+
+        return handle_error
+
+    def mark_unhealthy(self, index: int):
+        self.unhealthy_until[index] = time.monotonic() + self.retry_after
+
+    def healthy(self) -> list[int]:
+        now = time.monotonic()
+        return [i for i, until in enumerate(self.unhealthy_until) if until <= now]
+
+    def pick(self) -> Optional[int]:
+        candidates = self.healthy()
+        if not candidates:
+            return None
+
+        if self.strategy == "least-connections":
+            return min(
+                candidates, key=lambda i: self.engines[i].sync_engine.pool.checkedout()
+            )
+
+        index = candidates[self._next % len(candidates)]
+        self._next += 1
+        return index
+
+    async def session(self) -> AsyncSession:
+        # connect eagerly so an unreachable replica falls back to the primary
+        # inside the same request instead of failing it
+        while (index := self.pick()) is not None:
+            session = self.sessionmakers[index]()
+            try:
+                await session.connection()
+                return session
+            except (SQLAlchemyError, OSError):
+                logger.exception("Read replica unavailable: %s", index)
+                self.mark_unhealthy(index)
+                await session.close()
+
+        if self.engines:
+            self.fallbacks += 1
+
+        return AsyncSessionLocal()
+
+    def stats(self) -> list[dict[str, Any]]:
+        healthy = self.healthy()
+        return [
+            {
+                "url": make_url(url).render_as_string(hide_password=True),
+                "healthy": index in healthy,
+                **pool_stats(self.engines[index]),
+            }
+            for index, url in enumerate(self.urls)
+        ]
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+
+# without replicas, a single writer sqlite database reads through its own pool
+if not READ_DATABASE_URLS and is_sqlite_file(DATABASE_URL) and SQLITE_SINGLE_WRITER:
+    READ_DATABASE_URLS = [DATABASE_URL]
+
+read_replicas = ReadReplicas(READ_DATABASE_URLS)
+
+
+async def get_read_session() -> AsyncIterator[AsyncSession]:
+    async with await read_replicas.session() as session:
+        try:
+            yield session
+        except SQLAlchemyError:
+            logger.exception("Database read session error")
+            await session.rollback()
+            raise
+
+
+ReadOnlyDatabaseSession = Annotated[AsyncSession, Depends(get_read_session)]
+
+
+def pool_stats(engine: Optional[AsyncEngine] = None) -> dict[str, Any]:
+    pool = (engine or async_engine).sync_engine.pool
+
+    if not isinstance(pool, InstrumentedPool):
+        return {"pool": pool.status()}
+
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": pool.checkouts,
+        "waits": pool.waits,
+        "wait_seconds": pool.wait_seconds,
+        "timeouts": pool.timeouts,
+        "checkout_latency": pool.checkout_latency.snapshot(),
+    }
@@ -0,0 +1,169 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from helpers.db import async_engine, read_replicas
+from helpers.instrumentation import instrument_engine, query_log
+
+logger = logging.getLogger(__name__)
+
+# records the statements of every request and reports the ones crossing a
+# threshold, unlike ECHO_SQL which logs every statement
+SQL_DIAGNOSTICS = os.environ.get("SQL_DIAGNOSTICS", "false").lower() == "true"
+SQL_DIAGNOSTICS_SLOW_REQUEST = float(
+    os.environ.get("SQL_DIAGNOSTICS_SLOW_REQUEST", "0.5")
+)
+SQL_DIAGNOSTICS_SLOW_QUERY = float(os.environ.get("SQL_DIAGNOSTICS_SLOW_QUERY", "0.1"))
+SQL_DIAGNOSTICS_MAX_STATEMENTS = int(
+    os.environ.get("SQL_DIAGNOSTICS_MAX_STATEMENTS", "10")
+)
+
+# the same statement this many times in one request looks like an n+1
+SQL_DIAGNOSTICS_REPEAT_THRESHOLD = int(
+    os.environ.get("SQL_DIAGNOSTICS_REPEAT_THRESHOLD", "3")
+)
+
+# longest parameters repr kept per statement
+PARAMETERS_MAX_LENGTH = 200
+
+
+class Statement:
+    def __init__(self, sql: str, parameters: Any, duration: float):
+        self.sql = sql
+        self.parameters = parameters
+        self.duration = duration
+
+    def __repr__(self) -> str:
+        parameters = repr(self.parameters)
+        if len(parameters) > PARAMETERS_MAX_LENGTH:
+            parameters = parameters[:PARAMETERS_MAX_LENGTH] + "..."
+        return f"[{self.duration * 1000:.2f}ms] {self.sql} {parameters}"
+
+
+class QueryLog:
+    def __init__(self):
+        self.statements: list[Statement] = []
+
+    def add(self, sql: str, parameters: Any, duration: float):
+        self.statements.append(Statement(sql, parameters, duration))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def duration(self) -> float:
+        return sum(statement.duration for statement in self.statements)
+
+    def repeated(
+        self, threshold: int = SQL_DIAGNOSTICS_REPEAT_THRESHOLD
+    ) -> dict[str, int]:
+        # statements are compared with their bound parameters left out, a
+        # loop loading rows one by one shows up as one sql run many times
+        counts = Counter(statement.sql for statement in self.statements)
+        return {sql: count for sql, count in counts.items() if count >= threshold}
+
+    def slow(self, threshold: float = SQL_DIAGNOSTICS_SLOW_QUERY) -> list[Statement]:
+        return [s for s in self.statements if s.duration >= threshold]
+
+    def report(self) -> str:
+        lines = [f"{self.count} statements in {self.duration * 1000:.2f}ms"]
+        for sql, count in self.repeated().items():
+            lines.append(f"repeated {count} times: {sql}")
+        lines.extend(repr(statement) for statement in self.statements)
+        return "\n".join(lines)
+
+
+@contextmanager
+def capture() -> Iterator[QueryLog]:
+    # statements run by the current task (and tasks it starts) while inside
+    log = QueryLog()
+    token = query_log.set(log)
+    try:
+        yield log
+    finally:
+        query_log.reset(token)
+
+
+@contextmanager
+def assert_statements(
+    max_count: int, repeat_threshold: Optional[int] = None
+) -> Iterator[QueryLog]:
+    # test helper, fails listing the sql when the block runs more statements
+    # than allowed or repeats one of them repeat_threshold times
+    with capture() as log:
+        yield log
+
+    if log.count > max_count:
+        raise AssertionError(
+            f"expected at most {max_count} statements, got {log.report()}"
+        )
+    if repeat_threshold is not None and log.repeated(repeat_threshold):
+        raise AssertionError(f"repeated statements, got {log.report()}")
+
+
+class DiagnosticsMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        slow_request: float = SQL_DIAGNOSTICS_SLOW_REQUEST,
+        slow_query: float = SQL_DIAGNOSTICS_SLOW_QUERY,
+        max_statements: int = SQL_DIAGNOSTICS_MAX_STATEMENTS,
+        repeat_threshold: int = SQL_DIAGNOSTICS_REPEAT_THRESHOLD,
+    ):
+        self.app = app
+        self.slow_request = slow_request
+        self.slow_query = slow_query
+        self.max_statements = max_statements
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with capture() as log:
+            await self.app(scope, receive, send)
+        elapsed = time.perf_counter() - start
+
+        reasons = self.reasons(log, elapsed)
+        if reasons:
+            logger.warning(
+                "[diagnostics] %s %s took %.2fms (%s): %s",
+                scope["method"],
+                scope["path"],
+                elapsed * 1000,
+                ", ".join(reasons),
+                log.report(),
+            )
+
+    def reasons(self, log: QueryLog, elapsed: float) -> list[str]:
+        reasons = []
+        if elapsed >= self.slow_request:
+            reasons.append("slow request")
+        if log.slow(self.slow_query):
+            reasons.append("slow query")
+        if log.count > self.max_statements:
+            reasons.append("too many statements")
+        if log.repeated(self.repeat_threshold):
+            reasons.append("repeated statements")
+        return reasons
+
+
+def setup(app: FastAPI):
+    if not SQL_DIAGNOSTICS:
+        return
+
+    # the hook of helpers.instrumentation, a no-op when metrics already added it
+    instrument_engine(async_engine)
+    for engine in read_replicas.engines:
+        instrument_engine(engine)
+
+    app.add_middleware(DiagnosticsMiddleware)
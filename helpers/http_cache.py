@@ -0,0 +1,120 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional, Protocol
+
+from fastapi import Request, Response
+
+# Cache-Control for routes without their own policy
+HTTP_CACHE_CONTROL = os.environ.get(
+    "HTTP_CACHE_CONTROL", "public, max-age=0, must-revalidate"
+)
+
+# per route policies as "<route path>=<cache-control>;<route path>=<cache-control>"
+HTTP_CACHE_ROUTES = os.environ.get(
+    "HTTP_CACHE_ROUTES", "/api/my-model/random=private, no-cache"
+)
+
+
+class Versioned(Protocol):
+    id: int
+    updated_at: datetime
+
+
+def parse_routes(value: str) -> dict[str, str]:
+    routes = {}
+    for rule in value.split(";"):
+        if not rule.strip():
+            continue
+
+        path, _, policy = rule.partition("=")
+        routes[path.strip()] = policy.strip()
+
+    return routes
+
+
+cache_policies = parse_routes(HTTP_CACHE_ROUTES)
+
+
+def cache_control(route: str) -> str:
+    return cache_policies.get(route, HTTP_CACHE_CONTROL)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    # weak comparison, as required for If-None-Match
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified_since(header: str, last_modified: float) -> bool:
+    try:
+        return parsedate_to_datetime(header).timestamp() >= int(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[float] = None
+) -> bool:
+    # If-None-Match wins, If-Modified-Since only counts without it
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        return not_modified_since(if_modified_since, last_modified)
+
+    return False
+
+
+def validators(models: Iterable[Versioned]) -> tuple[str, Optional[float]]:
+    # rows only change through updates that bump updated_at, so ids and
+    # update times identify the representation without encoding the body
+    digest = hashlib.sha256()
+    last_modified = None
+    for model in models:
+        updated_at = model.updated_at
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        timestamp = updated_at.timestamp()
+
+        digest.update(f"{model.id}:{timestamp};".encode())
+        if last_modified is None or timestamp > last_modified:
+            last_modified = timestamp
+
+    return f'W/"{digest.hexdigest()[:32]}"', last_modified
+
+
+def conditional(
+    request: Request,
+    response: Response,
+    models: Iterable[Versioned],
+    use_last_modified: bool = True,
+) -> Optional[Response]:
+    # sets the validators and the route policy on the response, and returns a
+    # 304 to send instead when the client copy is still current. routes whose
+    # rows change between requests (random) must skip Last-Modified, an older
+    # row would pass If-Modified-Since for a copy holding other rows
+    etag, last_modified = validators(models)
+    if not use_last_modified:
+        last_modified = None
+
+    route = request.scope.get("route")
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control(getattr(route, "path", request.url.path)),
+    }
+    if last_modified is not None:
+        headers["last-modified"] = format_datetime(
+            datetime.fromtimestamp(int(last_modified), timezone.utc), usegmt=True
+        )
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Optional
+
+from helpers.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+INGEST_ENABLED = os.environ.get("INGEST_ENABLED", "false").lower() == "true"
+INGEST_MAX_BATCH = int(os.environ.get("INGEST_MAX_BATCH", "400"))
+INGEST_MAX_DELAY = float(os.environ.get("INGEST_MAX_DELAY", "0.005"))
+INGEST_MAX_PENDING = int(os.environ.get("INGEST_MAX_PENDING", "10000"))
+INGEST_PUT_TIMEOUT = float(os.environ.get("INGEST_PUT_TIMEOUT", "1"))
+
+# receives the items of one batch and returns one result per item, in order.
+# returns None or raises when the whole batch failed
+Flush = Callable[[list[Any]], Awaitable[Optional[list[Any]]]]
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+queues: list["IngestQueue"] = []
+
+
+class IngestQueue:
+    # callers await a future while a single background task writes whatever
+    # is queued in one batch, as soon as the batch is full or the oldest item
+    # has waited max_delay seconds
+    def __init__(
+        self,
+        flush: Flush,
+        max_batch: int = INGEST_MAX_BATCH,
+        max_delay: float = INGEST_MAX_DELAY,
+        max_pending: int = INGEST_MAX_PENDING,
+        put_timeout: float = INGEST_PUT_TIMEOUT,
+        split_errors: tuple[type[Exception], ...] = (),
+    ):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        # errors caused by one row (constraint, bad value): the batch is split
+        # to find it. anything else (connection lost, timeout) fails the batch
+        self.split_errors = split_errors
+        self.items = 0
+        self.batches = 0
+        self.failures = 0
+        self.rejected = 0
+        self.flush_latency = Histogram()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        queues.append(self)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        # an empty context: the first caller's context vars (request db time,
+        # sql diagnostics log) would otherwise collect every later flush
+        self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def close(self):
+        # flush what is already queued, then stop the background task
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+
+        await self._queue.join()
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+        # callers that were still waiting for room when the task stopped
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._flush(batch)
+
+    async def submit(self, item: Any) -> Any:
+        self.start()
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            # the database cannot keep up, wait a little for room and then
+            # push back on the caller
+            try:
+                await asyncio.wait_for(
+                    self._queue.put((item, future)), timeout=self.put_timeout
+                )
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise IngestQueueFull()
+
+        return await future
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list[tuple[Any, asyncio.Future]]):
+        start = time.perf_counter()
+        results = await self._write([item for item, _ in batch])
+
+        self.flush_latency.observe(time.perf_counter() - start)
+        self.batches += 1
+        self.items += len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _write(self, items: list[Any]) -> list[Any]:
+        # one result per item. a batch failing on a row level error is split
+        # in halves and retried, so one bad row fails alone instead of taking
+        # the others with it
+        try:
+            results = await self.flush(items)
+        except self.split_errors:
+            logger.exception("[ingest : flush]")
+            self.failures += 1
+            if len(items) == 1:
+                return [None]
+
+            middle = len(items) // 2
+            return await self._write(items[:middle]) + await self._write(items[middle:])
+        except Exception:
+            logger.exception("[ingest : flush]")
+            results = None
+
+        if results is None:
+            self.failures += 1
+            return [None] * len(items)
+
+        if len(results) != len(items):
+            # results cannot be matched to items, fail the ones left over
+            # rather than leave their callers waiting
+            logger.error(
+                "[ingest : flush] %s results for %s items", len(results), len(items)
+            )
+            self.failures += 1
+            results = list(results[: len(items)])
+            results += [None] * (len(items) - len(results))
+
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": self.pending(),
+            "items": self.items,
+            "batches": self.batches,
+            "average_batch": self.items / self.batches if self.batches else 0.0,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+
+async def close_all():
+    for queue in queues:
+        await queue.close()
@@ -0,0 +1,251 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import suppress
+from contextvars import ContextVar
+from typing import Any, Optional
+
+from fastapi import FastAPI
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from helpers.db import async_engine, read_replicas
+from helpers.metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+
+# directory shared by the workers of one server, each one writes its own
+# snapshot there so any worker can answer /metrics for all of them
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+registry = Registry()
+registry.counter("http_requests_total", "Requests by method, route and status")
+registry.gauge("http_requests_in_progress", "Requests being served")
+registry.histogram("http_request_duration_seconds", "Request latency")
+registry.histogram(
+    "http_response_size_bytes", "Response body size", buckets=SIZE_BUCKETS
+)
+registry.histogram("http_request_db_seconds", "Database time spent per request")
+registry.counter("http_request_db_queries_total", "Database queries run by requests")
+registry.histogram("db_query_duration_seconds", "Database query latency")
+
+# [seconds, queries] spent in the database by the current request
+request_db_time: ContextVar[Optional[list]] = ContextVar(
+    "request_db_time", default=None
+)
+
+# the QueryLog of an active helpers.diagnostics.capture block
+query_log: ContextVar[Optional[Any]] = ContextVar("query_log", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    registry.observe("db_query_duration_seconds", (), elapsed)
+
+    # sqlalchemy runs the sync side in a greenlet sharing the task context
+    timing = request_db_time.get()
+    if timing is not None:
+        timing[0] += elapsed
+        timing[1] += 1
+
+    log = query_log.get()
+    if log is not None:
+        log.add(statement, parameters, elapsed)
+
+
+def instrument_engine(engine: AsyncEngine | Engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if not event.contains(sync_engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+def route_name(scope: Scope) -> str:
+    # the route template keeps label values bounded, unmatched paths (404s)
+    # share one label. mounts are labelled by their prefix, the catch-all
+    # static mount at "" shares the unmatched label
+    route = scope.get("route")
+    if isinstance(route, Mount):
+        return route.path or "other"
+    return (
+        getattr(route, "path_format", None) or getattr(route, "path", None) or "other"
+    )
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        timing = [0.0, 0]
+        token = request_db_time.set(timing)
+        registry.add("http_requests_in_progress")
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.add("http_requests_in_progress", value=-1)
+            request_db_time.reset(token)
+
+            labels = (("method", method), ("route", route_name(scope)))
+            registry.inc("http_requests_total", labels + (("status", str(status)),))
+            registry.observe("http_request_duration_seconds", labels, elapsed)
+            registry.observe("http_response_size_bytes", labels, size)
+            registry.observe("http_request_db_seconds", labels, timing[0])
+            if timing[1]:
+                registry.inc("http_request_db_queries_total", labels, timing[1])
+
+
+# counters and histograms of exited workers, folded into one file so the
+# directory does not grow with every worker restart
+RETIRED_SNAPSHOT = "retired.json"
+
+
+def snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_json(path: str, snapshot: dict):
+    # write then rename, readers never see a partial file
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(snapshot, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_snapshot(snapshot: Optional[dict] = None):
+    write_json(snapshot_path(os.getpid()), snapshot or registry.snapshot())
+
+
+def read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire(pid: int):
+    # moves the snapshot of an exited worker into the retired snapshot. the
+    # lock keeps two workers from folding the same file twice
+    fd = os.open(os.path.join(METRICS_DIR, "retired.lock"), os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        path = snapshot_path(pid)
+        snapshot = read_json(path)
+        if snapshot is not None:
+            # its gauges (requests in progress) ended with it
+            snapshot["gauges"] = []
+            retired_path = os.path.join(METRICS_DIR, RETIRED_SNAPSHOT)
+            retired = read_json(retired_path) or {}
+            write_json(retired_path, registry.merge([retired, snapshot]).snapshot())
+
+        with suppress(FileNotFoundError):
+            os.remove(path)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def read_snapshots() -> list[dict]:
+    snapshots = []
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return snapshots
+
+    for filename in os.listdir(METRICS_DIR):
+        name, ext = os.path.splitext(filename)
+        if ext != ".json" or not name.isdigit() or int(name) == os.getpid():
+            continue
+
+        if not is_alive(int(name)):
+            try:
+                retire(int(name))
+            except OSError:
+                logger.exception("Failed to retire metrics snapshot")
+            continue
+
+        snapshot = read_json(os.path.join(METRICS_DIR, filename))
+        if snapshot is not None:
+            snapshots.append(snapshot)
+
+    retired = read_json(os.path.join(METRICS_DIR, RETIRED_SNAPSHOT))
+    if retired is not None:
+        snapshots.append(retired)
+
+    return snapshots
+
+
+def clear_snapshots(directory: str):
+    # snapshots left by a previous server in a reused directory
+    for filename in os.listdir(directory):
+        if filename.endswith((".json", ".tmp", ".lock")):
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, filename))
+
+
+def collect() -> Registry:
+    # live numbers of this worker plus the last snapshot of the others
+    return registry.merge([registry.snapshot(), *read_snapshots()])
+
+
+async def flush_loop(interval: float = METRICS_FLUSH_INTERVAL):
+    while True:
+        try:
+            # snapshot on the loop, only the file write leaves it
+            await asyncio.to_thread(write_snapshot, registry.snapshot())
+        except OSError:
+            logger.exception("Failed to write metrics snapshot")
+        await asyncio.sleep(interval)
+
+
+def setup(app: FastAPI):
+    if not METRICS_ENABLED:
+        return
+
+    instrument_engine(async_engine)
+    for engine in read_replicas.engines:
+        instrument_engine(engine)
+
+    app.add_middleware(MetricsMiddleware)
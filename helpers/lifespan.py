@@ -1,16 +1,70 @@
-from contextlib import asynccontextmanager
+import asyncio
+import os
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
-from .scheduler import scheduler
+from . import ingest, instrumentation, migrate
+from .profiler import LOOP_LAG_ENABLED, loop_lag_monitor
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true"
+
+
+async def run_scheduler():
+    # apscheduler is only loaded once the app starts, not by `import main`
+    from .scheduler import scheduler, scheduler_leader, scheduler_lock
+
+    # workers without the lock keep trying, so one of them takes over the
+    # jobs when the worker holding it exits. retried as often as the lease
+    # is renewed
+    while not scheduler_lock.acquire():
+        await asyncio.sleep(scheduler_leader.ttl / 3)
+
+    # job modules are only loaded by the worker that runs them
+    import jobs.my_model  # noqa: F401
+
+    # jobs only fire once this worker holds the cluster wide lease
+    scheduler.start(paused=True)
+    await scheduler_leader.run(scheduler)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # startup
-    scheduler.start()
+    if migrate.MIGRATE_ON_START:
+        await migrate.upgrade()
+
+    if SCHEDULER_ENABLED:
+        scheduler_task = asyncio.create_task(run_scheduler())
+
+    if instrumentation.METRICS_DIR:
+        metrics_task = asyncio.create_task(instrumentation.flush_loop())
+
+    if LOOP_LAG_ENABLED:
+        loop_lag_monitor.start()
 
     yield
 
     # shutdown
-    scheduler.shutdown()
+    if LOOP_LAG_ENABLED:
+        await loop_lag_monitor.stop()
+
+    await ingest.close_all()
+
+    if instrumentation.METRICS_DIR:
+        metrics_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await metrics_task
+        instrumentation.write_snapshot()
+
+    if SCHEDULER_ENABLED:
+        scheduler_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await scheduler_task
+
+        from .scheduler import scheduler, scheduler_leader, scheduler_lock
+
+        if scheduler_lock.held:
+            await scheduler_leader.release()
+            scheduler.shutdown()
+            scheduler_lock.release()
@@ -1,5 +1,10 @@
 import logging
 
+# loggers whose reports are warnings, kept above the root error level
+REPORT_LOGGERS = ("helpers.diagnostics", "helpers.profiler")
+
 
 def setup():
     logging.basicConfig(level=logging.ERROR)
+    for name in REPORT_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
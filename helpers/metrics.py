@@ -0,0 +1,178 @@
+from bisect import bisect_left
+from typing import Any, Iterable
+
+# seconds, from sub millisecond pool checkouts up to slow requests
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        # cumulative counts per upper bound, like prometheus "le" buckets
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = total
+
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+# label pairs in a fixed order, usable as a dict key
+Labels = tuple[tuple[str, str], ...]
+
+
+class Registry:
+    # counters, gauges and histograms by name and labels, plus snapshots that
+    # several worker processes can merge and render in prometheus text format
+    def __init__(self):
+        self.types: dict[str, tuple[str, str]] = {}
+        self.buckets: dict[str, tuple[float, ...]] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def counter(self, name: str, description: str):
+        self.types[name] = ("counter", description)
+
+    def gauge(self, name: str, description: str):
+        self.types[name] = ("gauge", description)
+
+    def histogram(
+        self, name: str, description: str, buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        self.types[name] = ("histogram", description)
+        self.buckets[name] = tuple(sorted(buckets))
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def add(self, name: str, labels: Labels = (), value: float = 1):
+        key = (name, labels)
+        self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = Histogram(self.buckets[name])
+            self.histograms[(name, labels)] = histogram
+        histogram.observe(value)
+
+    def snapshot(self) -> dict[str, Any]:
+        # json friendly, bucket counts are kept per bucket so they can be summed
+        return {
+            "counters": [
+                [name, labels, value] for (name, labels), value in self.counters.items()
+            ],
+            "gauges": [
+                [name, labels, value] for (name, labels), value in self.gauges.items()
+            ],
+            "histograms": [
+                [name, labels, list(histogram.counts), histogram.sum, histogram.count]
+                for (name, labels), histogram in self.histograms.items()
+            ],
+        }
+
+    def merge(self, snapshots: Iterable[dict[str, Any]]) -> "Registry":
+        merged = Registry()
+        merged.types = self.types
+        merged.buckets = self.buckets
+
+        for snapshot in snapshots:
+            for name, labels, value in snapshot.get("counters", []):
+                merged.inc(name, tuple(map(tuple, labels)), value)
+            for name, labels, value in snapshot.get("gauges", []):
+                merged.add(name, tuple(map(tuple, labels)), value)
+            for name, labels, counts, total, count in snapshot.get("histograms", []):
+                if name not in self.buckets:
+                    continue
+                key = (name, tuple(map(tuple, labels)))
+                histogram = merged.histograms.get(key)
+                if histogram is None:
+                    histogram = Histogram(self.buckets[name])
+                    merged.histograms[key] = histogram
+                if len(counts) != len(histogram.counts):
+                    continue
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+        return merged
+
+    def render(self) -> str:
+        series: dict[str, list[str]] = {name: [] for name in self.types}
+
+        for (name, labels), value in sorted(self.counters.items()):
+            series.setdefault(name, []).append(
+                f"{name}{format_labels(labels)} {format_value(value)}"
+            )
+        for (name, labels), value in sorted(self.gauges.items()):
+            series.setdefault(name, []).append(
+                f"{name}{format_labels(labels)} {format_value(value)}"
+            )
+        for (name, labels), histogram in sorted(
+            self.histograms.items(), key=lambda item: item[0]
+        ):
+            lines = series.setdefault(name, [])
+            for bound, count in histogram.snapshot()["buckets"].items():
+                lines.append(
+                    f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}"
+                )
+            lines.append(
+                f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}"
+            )
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        output = []
+        for name, lines in series.items():
+            if name in self.types:
+                kind, description = self.types[name]
+                output.append(f"# HELP {name} {description}")
+                output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+
+        return "\n".join(output) + "\n"
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    pairs = ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for key, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,157 @@
+import asyncio
+import fcntl
+import importlib
+import logging
+import os
+import pkgutil
+from contextlib import asynccontextmanager
+from types import ModuleType
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from helpers.db import async_engine, is_sqlite_file
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_PACKAGE = os.environ.get("MIGRATIONS_PACKAGE", "migrations")
+MIGRATE_ON_START = os.environ.get("MIGRATE_ON_START", "true").lower() == "true"
+
+# postgres advisory lock id held while migrating
+MIGRATE_LOCK_KEY = int(os.environ.get("MIGRATE_LOCK_KEY", "7262837"))
+
+# kept out of Base.metadata, the migrations own the application tables
+metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    metadata,
+    Column("version", String(191), primary_key=True),
+    Column(
+        "applied_at",
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    ),
+)
+
+
+def discover(package: str = MIGRATIONS_PACKAGE) -> list[tuple[str, ModuleType]]:
+    # migrations are modules named with a sortable numeric prefix, each one
+    # exposing upgrade(conn) that runs on a sync connection
+    module = importlib.import_module(package)
+    names = sorted(
+        info.name
+        for info in pkgutil.iter_modules(module.__path__)
+        if info.name[:1].isdigit()
+    )
+    return [(name, importlib.import_module(f"{package}.{name}")) for name in names]
+
+
+async def applied(conn: AsyncConnection) -> set[str]:
+    result = await conn.execute(select(schema_version.c.version))
+    return set(result.scalars())
+
+
+@asynccontextmanager
+async def lock(engine: AsyncEngine) -> AsyncIterator[None]:
+    # workers starting together migrate one after the other, the ones that
+    # wait then find every version applied
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            key = {"key": MIGRATE_LOCK_KEY}
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), key)
+            try:
+                yield
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), key)
+                await conn.commit()
+        return
+
+    url = engine.url.render_as_string(hide_password=False)
+    if not is_sqlite_file(url):
+        yield
+        return
+
+    # a sqlite file is only shared by processes on the same host
+    fd = os.open(f"{engine.url.database}.migrate.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+async def upgrade(
+    engine: Optional[AsyncEngine] = None, package: str = MIGRATIONS_PACKAGE
+) -> list[str]:
+    engine = engine or async_engine
+
+    async with lock(engine):
+        return await _upgrade(engine, package)
+
+
+async def _upgrade(engine: AsyncEngine, package: str) -> list[str]:
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all, checkfirst=True)
+    except Exception:
+        async with engine.connect() as conn:
+            if not await conn.run_sync(
+                lambda sync_conn: inspect(sync_conn).has_table("schema_version")
+            ):
+                raise
+
+    done = []
+    for version, module in discover(package):
+        async with engine.connect() as conn:
+            if version in await applied(conn):
+                continue
+
+        # each migration and its version row commit together where the
+        # database has transactional ddl
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(module.upgrade)
+                await conn.execute(insert(schema_version).values(version=version))
+        except Exception:
+            # another worker starting at the same time may have applied it
+            async with engine.connect() as conn:
+                if version in await applied(conn):
+                    continue
+            raise
+
+        logger.info("Applied migration %s", version)
+        done.append(version)
+
+    return done
+
+
+async def run() -> list[str]:
+    try:
+        return await upgrade()
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    versions = asyncio.run(run())
+    print(f"Applied {len(versions)} migration(s): {', '.join(versions) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import suppress
+from secrets import compare_digest
+from types import FrameType
+from typing import Annotated, Any, Optional
+
+from fastapi import Depends, Header, HTTPException
+
+logger = logging.getLogger(__name__)
+
+# admin routes stay disabled (404) until a token is configured
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+
+LOOP_LAG_ENABLED = os.environ.get("LOOP_LAG_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.1"))
+LOOP_LAG_MAX_INCIDENTS = int(os.environ.get("LOOP_LAG_MAX_INCIDENTS", "100"))
+
+
+def require_admin(
+    authorization: Annotated[Optional[str], Header()] = None,
+    x_admin_token: Annotated[Optional[str], Header()] = None,
+):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    token = x_admin_token or ""
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+
+    if not compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+AdminAccess = Depends(require_admin)
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame: Optional[FrameType]) -> list[str]:
+    # root first, the order flamegraph tools expect
+    stack = []
+    while frame is not None:
+        stack.append(frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+# uvloop waits for events in C, so an idle uvloop thread shows the frame that
+# started the loop on top: asyncio.Runner.run, or uvicorn's asyncio_run on
+# python < 3.11
+LOOP_RUN_FRAMES = {("runners.py", "run"), ("_compat.py", "asyncio_run")}
+
+
+def is_idle(frame: FrameType) -> bool:
+    # an event loop waiting in select has nothing to run
+    filename = os.path.basename(frame.f_code.co_filename)
+    if filename == "selectors.py":
+        return True
+    return (filename, frame.f_code.co_name) in LOOP_RUN_FRAMES
+
+
+def sample(
+    seconds: float, interval: float = 0.005, include_idle: bool = False
+) -> Counter:
+    # stack sampler over every thread but its own, run it in a thread so the
+    # event loop being profiled keeps serving requests
+    own = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (not include_idle and is_idle(frame)):
+                continue
+            thread = names.get(ident, str(ident))
+            stacks[";".join([thread, *collapse(frame)])] += 1
+        time.sleep(interval)
+
+    return stacks
+
+
+def folded(stacks: Counter) -> str:
+    # collapsed stack format: "frame;frame;frame count", one stack per line
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+profile_lock = asyncio.Lock()
+
+
+async def profile(
+    seconds: float, interval: float = 0.005, include_idle: bool = False
+) -> Optional[str]:
+    # one profile at a time per worker, None when one is already running
+    if profile_lock.locked():
+        return None
+
+    async with profile_lock:
+        stacks = await asyncio.to_thread(sample, seconds, interval, include_idle)
+
+    return folded(stacks)
+
+
+class LoopLagMonitor:
+    # a task wakes up every interval and measures how late it is. a watchdog
+    # thread notices when the task stops waking up and records the stack of
+    # the loop thread while it is still blocked
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+        max_incidents: int = LOOP_LAG_MAX_INCIDENTS,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.incidents: deque[dict[str, Any]] = deque(maxlen=max_incidents)
+        self.total_incidents = 0
+        self.max_lag = 0.0
+        self.heartbeat = time.monotonic()
+        self.blocked_stack: Optional[list[str]] = None
+        self.loop_thread: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stopped = threading.Event()
+        self.watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        self.loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.run())
+        self.watchdog = threading.Thread(
+            target=self.watch, name="loop-lag-watchdog", daemon=True
+        )
+        self.watchdog.start()
+
+    async def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+        if self.watchdog:
+            await asyncio.to_thread(self.watchdog.join)
+
+    async def run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.heartbeat = now
+            self.check(now - expected)
+
+    def check(self, lag: float):
+        self.max_lag = max(self.max_lag, lag)
+        stack, self.blocked_stack = self.blocked_stack, None
+        if lag < self.threshold:
+            return
+
+        incident = {"at": time.time(), "lag": lag, "stack": stack}
+        self.incidents.append(incident)
+        self.total_incidents += 1
+        logger.warning(
+            "[loop lag] event loop blocked for %.1fms%s",
+            lag * 1000,
+            "".join(f"\n  {frame}" for frame in stack or []),
+        )
+
+    def watch(self):
+        while not self.stopped.wait(self.interval):
+            late = time.monotonic() - self.heartbeat - self.interval
+            if late < self.threshold or self.blocked_stack is not None:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is not None:
+                self.blocked_stack = collapse(frame)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self.task is not None and not self.task.done(),
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "max_lag": self.max_lag,
+            "total_incidents": self.total_incidents,
+            "incidents": list(self.incidents),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
@@ -1,14 +1,487 @@
+import asyncio
+import errno
+import fcntl
+import hashlib
+import ipaddress
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
 from fastapi import FastAPI
-from starlette.middleware.base import BaseHTTPMiddleware
-from throttled.fastapi import IPLimiter, TotalLimiter
-from throttled.models import Rate
-from throttled.storage.memory import MemoryStorage
+from starlette.types import ASGIApp, Receive, Scope, Send
 
+logger = logging.getLogger(__name__)
 
-def setup(app: FastAPI):
-    memory = MemoryStorage(cache={})
-    total_limiter = TotalLimiter(limit=Rate(1, 1), storage=memory)
-    ip_limiter = IPLimiter(limit=Rate(5, 1), storage=memory)
+# "<limit>/<period>", bursts up to <limit> requests are allowed
+RATE_LIMIT = os.environ.get("RATE_LIMIT", "5/second")
+
+# optional limit shared by all clients, empty to disable
+RATE_LIMIT_TOTAL = os.environ.get("RATE_LIMIT_TOTAL", "")
+
+# per route limits as "<path prefix>=<rate>;<path prefix>=<rate>"
+RATE_LIMIT_ROUTES = os.environ.get("RATE_LIMIT_ROUTES", "")
+
+# peers allowed to set X-Forwarded-For (addresses or networks)
+RATE_LIMIT_TRUSTED_PROXIES = os.environ.get(
+    "RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1,::1"
+)
+
+# tracked clients per limiter before the least recently seen are dropped
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# where limiter state lives: "memory" (per process), "mmap" (shared by the
+# workers of one host) or "redis" (shared by every host)
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_MMAP_PATH = os.environ.get(
+    "RATE_LIMIT_MMAP_PATH",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "fastapi-app-rate-limit",
+    ),
+)
+RATE_LIMIT_MMAP_SLOTS = int(os.environ.get("RATE_LIMIT_MMAP_SLOTS", "262144"))
+RATE_LIMIT_REDIS_URL = os.environ.get(
+    "RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"
+)
+
+# tokens a worker reserves per call to a shared backend and then hands out
+# locally, so the shared state is not touched on every request
+RATE_LIMIT_BATCH = int(os.environ.get("RATE_LIMIT_BATCH", "10"))
+
+# peer addresses whose trusted proxy check is remembered
+TRUSTED_CACHE_SIZE = 4096
+
+PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+class Rate:
+    def __init__(self, limit: int, period: float):
+        if limit < 1 or period <= 0:
+            raise ValueError(f"Invalid rate: {limit}/{period}")
+
+        self.limit = limit
+        self.period = period
+
+        # gcra in integer nanoseconds: one request "costs" the emission
+        # interval, and a client may run ahead of schedule by the tolerance
+        # (a burst of `limit` requests)
+        self.emission_interval = int(period * 1_000_000_000) // limit
+        self.tolerance = self.emission_interval * (limit - 1)
+
+    def __repr__(self) -> str:
+        return f"Rate({self.limit}, {self.period})"
+
+
+def parse_rate(value: str) -> Rate:
+    limit, _, period = value.strip().partition("/")
+    if period not in PERIODS:
+        raise ValueError(f"Invalid rate: {value}")
+
+    return Rate(int(limit), PERIODS[period])
+
+
+def parse_routes(value: str) -> dict[str, Rate]:
+    routes = {}
+    for rule in value.split(";"):
+        if not rule.strip():
+            continue
+
+        prefix, _, rate = rule.partition("=")
+        routes[prefix.strip()] = parse_rate(rate)
+
+    return routes
+
+
+def gcra_take(tat: int, now: int, rate: Rate, tokens: int) -> tuple[int, int, int]:
+    # takes up to `tokens` at once, returns (granted, new tat, ns to wait)
+    if tat > now + rate.tolerance + rate.emission_interval:
+        # more than a full burst ahead can only be stale state from an
+        # older clock (e.g. a shared segment that survived a reboot)
+        tat = now
+
+    tat = max(tat, now)
+    granted = min(tokens, (now + rate.tolerance - tat) // rate.emission_interval + 1)
+    if granted <= 0:
+        return 0, tat, tat - rate.tolerance - now
+
+    return granted, tat + granted * rate.emission_interval, 0
+
+
+class GCRALimiter:
+    # per key theoretical arrival time, kept in least recently seen order so
+    # expired keys are dropped from the front and memory stays bounded
+    def __init__(self, rate: Rate, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._tat: OrderedDict[str, int] = OrderedDict()
+
+    def hit(self, key: str, now: Optional[int] = None) -> float:
+        # returns 0 when allowed, otherwise the seconds to wait before retrying
+        now = time.monotonic_ns() if now is None else now
+        rate = self.rate
+
+        tat = max(self._tat.get(key, now), now)
+        allow_at = tat - rate.tolerance
+        if allow_at > now:
+            return (allow_at - now) / 1_000_000_000
+
+        self._tat[key] = tat + rate.emission_interval
+        self._tat.move_to_end(key)
+        self._expire(now)
+        return 0.0
+
+    async def acquire(self, key: str, now: Optional[int] = None) -> float:
+        return self.hit(key, now)
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def _expire(self, now: int):
+        while self._tat:
+            key, tat = next(iter(self._tat.items()))
+            if tat > now and len(self._tat) <= self.max_keys:
+                break
+
+            del self._tat[key]
+            if tat > now:
+                self.evictions += 1
+
+
+class MmapStore:
+    # fixed size open addressing table in a shared memory file, every slot is
+    # (key hash, tat). workers lock only the probe window of the key they
+    # update (fcntl byte range lock), so different clients rarely contend
+    SLOT = struct.Struct("<Qq")
+    PROBES = 8
+
+    def __init__(
+        self, path: str = RATE_LIMIT_MMAP_PATH, slots: int = RATE_LIMIT_MMAP_SLOTS
+    ):
+        self.path = path
+        self.slots = slots
+        self.size = slots * self.SLOT.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < self.size:
+            os.ftruncate(self.fd, self.size)
+        self.map = mmap.mmap(self.fd, self.size)
+
+    # seconds between attempts to take a probe window another worker holds
+    LOCK_RETRY = 0.0005
+
+    async def _lock(self, length: int, offset: int):
+        # a blocking lockf would stall the whole event loop while another
+        # worker holds the window, the hold itself lasts microseconds
+        while True:
+            try:
+                fcntl.lockf(
+                    self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, length, offset, os.SEEK_SET
+                )
+                return
+            except OSError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+            await asyncio.sleep(self.LOCK_RETRY)
+
+    def _digest(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1
+
+    async def take(
+        self, key: str, rate: Rate, tokens: int, now: int
+    ) -> tuple[int, int]:
+        digest = self._digest(key)
+        offset = (digest % (self.slots - self.PROBES + 1)) * self.SLOT.size
+        length = self.PROBES * self.SLOT.size
+
+        await self._lock(length, offset)
+        try:
+            position = None
+            free = None
+            oldest = None
+            oldest_tat = None
+
+            for i in range(self.PROBES):
+                pos = offset + i * self.SLOT.size
+                slot_digest, slot_tat = self.SLOT.unpack_from(self.map, pos)
+                if slot_digest == digest:
+                    position = pos
+                    tat = slot_tat
+                    break
+                if free is None and (slot_digest == 0 or slot_tat <= now):
+                    free = pos
+                if oldest_tat is None or slot_tat < oldest_tat:
+                    oldest, oldest_tat = pos, slot_tat
+
+            if position is None:
+                # new key: reuse an empty or expired slot, else the oldest one
+                position = free if free is not None else oldest
+                tat = now
 
-    app.add_middleware(BaseHTTPMiddleware, dispatch=total_limiter.dispatch)
-    app.add_middleware(BaseHTTPMiddleware, dispatch=ip_limiter.dispatch)
+            granted, tat, wait = gcra_take(tat, now, rate, tokens)
+            if granted:
+                self.SLOT.pack_into(self.map, position, digest, tat)
+
+            return granted, wait
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset, os.SEEK_SET)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class RedisStore:
+    # gcra in one atomic script, timed by the redis clock (microseconds) so
+    # hosts do not need synchronized clocks
+    SCRIPT = """
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tokens = tonumber(ARGV[3])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local tat = tonumber(redis.call("GET", KEYS[1]) or now)
+if tat > now + tolerance + interval then
+    tat = now
+end
+if tat < now then
+    tat = now
+end
+local granted = math.min(tokens, math.floor((now + tolerance - tat) / interval) + 1)
+if granted <= 0 then
+    return {0, tat - tolerance - now}
+end
+tat = tat + granted * interval
+redis.call("SET", KEYS[1], tat, "PX", math.ceil((tat - now) / 1000))
+return {granted, 0}
+"""
+
+    def __init__(self, client, prefix: str = "rate-limit:"):
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(self.SCRIPT)
+
+    async def take(
+        self, key: str, rate: Rate, tokens: int, now: int
+    ) -> tuple[int, int]:
+        interval = max(1, rate.emission_interval // 1000)
+        granted, wait = await self.script(
+            keys=[self.prefix + key],
+            args=[interval, interval * (rate.limit - 1), tokens],
+        )
+        return int(granted), int(wait) * 1000
+
+
+class SharedLimiter:
+    def __init__(
+        self,
+        store,
+        rate: Rate,
+        name: str,
+        batch: int = RATE_LIMIT_BATCH,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+    ):
+        self.store = store
+        self.rate = rate
+        self.name = name
+        self.batch = max(1, min(batch, rate.limit))
+        self.max_keys = max_keys
+        self.errors = 0
+
+        # tokens reserved from the store and not handed out yet, they expire
+        # when the store would have refilled them anyway
+        self._leases: OrderedDict[str, tuple[int, int]] = OrderedDict()
+
+    async def acquire(self, key: str, now: Optional[int] = None) -> float:
+        now = time.monotonic_ns() if now is None else now
+
+        lease = self._leases.pop(key, None)
+        if lease is not None:
+            tokens, expires_at = lease
+            if expires_at > now:
+                if tokens > 1:
+                    self._leases[key] = (tokens - 1, expires_at)
+                return 0.0
+
+        try:
+            granted, wait = await self.store.take(
+                f"{self.name}:{key}", self.rate, self.batch, now
+            )
+        except Exception:
+            # fail open: an unreachable store must not take the api down
+            logger.exception("[rate limiter : shared store]")
+            self.errors += 1
+            return 0.0
+
+        if not granted:
+            return wait / 1_000_000_000
+
+        if granted > 1:
+            self._leases[key] = (
+                granted - 1,
+                now + granted * self.rate.emission_interval,
+            )
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+
+        return 0.0
+
+
+LimiterFactory = Callable[[Rate, str], object]
+
+
+def create_limiter_factory(
+    backend: str = RATE_LIMIT_BACKEND, max_keys: int = RATE_LIMIT_MAX_KEYS
+) -> LimiterFactory:
+    if backend == "memory":
+        return lambda rate, name: GCRALimiter(rate, max_keys)
+
+    if backend == "mmap":
+        store = MmapStore(RATE_LIMIT_MMAP_PATH, RATE_LIMIT_MMAP_SLOTS)
+    elif backend == "redis":
+        # optional dependency, only needed when the redis backend is selected
+        from redis import asyncio as redis
+
+        store = RedisStore(redis.from_url(RATE_LIMIT_REDIS_URL))
+    else:
+        raise ValueError(f"Unknown rate limit backend: {backend}")
+
+    return lambda rate, name: SharedLimiter(
+        store, rate, name, RATE_LIMIT_BATCH, max_keys
+    )
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        rate: Optional[Rate] = None,
+        total: Optional[Rate] = None,
+        routes: Optional[dict[str, Rate]] = None,
+        trusted_proxies: str = RATE_LIMIT_TRUSTED_PROXIES,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        limiter_factory: Optional[LimiterFactory] = None,
+    ):
+        factory = limiter_factory or create_limiter_factory("memory", max_keys)
+
+        self.app = app
+        self.limiter = factory(rate, "default") if rate else None
+        self.total = factory(total, "total") if total else None
+
+        # longest prefix first so the most specific rule wins
+        self.routes = [
+            (prefix, factory(route_rate, prefix))
+            for prefix, route_rate in sorted(
+                (routes or {}).items(), key=lambda item: len(item[0]), reverse=True
+            )
+        ]
+
+        self.trusted_proxies = [
+            ipaddress.ip_network(proxy.strip(), strict=False)
+            for proxy in trusted_proxies.split(",")
+            if proxy.strip()
+        ]
+        self.trusted: dict[str, bool] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        now = time.monotonic_ns()
+        client = self.client_ip(scope)
+        limiter = self.route_limiter(scope["path"])
+        if limiter is None:
+            limiter = self.limiter
+
+        retry_after = 0.0
+        if limiter is not None:
+            retry_after = await limiter.acquire(client, now)
+        if not retry_after and self.total is not None:
+            retry_after = await self.total.acquire("*", now)
+
+        if retry_after:
+            await self.reject(send, retry_after)
+            return
+
+        await self.app(scope, receive, send)
+
+    def route_limiter(self, path: str):
+        for prefix, limiter in self.routes:
+            if path.startswith(prefix):
+                return limiter
+        return None
+
+    def client_ip(self, scope: Scope) -> str:
+        peer = scope.get("client")
+        ip = peer[0] if peer else ""
+
+        if not self.is_trusted(ip):
+            return ip
+
+        # walk the proxy chain from the nearest hop and take the first address
+        # that is not one of our proxies, client supplied entries are ignored
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                for hop in reversed(value.decode("latin-1").split(",")):
+                    hop = hop.strip()
+                    if hop and not self.is_trusted(hop):
+                        return hop
+                break
+
+        return ip
+
+    def is_trusted(self, ip: str) -> bool:
+        # peers repeat (the proxy, returning clients) and parsing an address
+        # costs more than the limiter itself, so answers are kept per address
+        trusted = self.trusted.get(ip)
+        if trusted is None:
+            if len(self.trusted) >= TRUSTED_CACHE_SIZE:
+                self.trusted.clear()
+            trusted = self.trusted[ip] = self.check_trusted(ip)
+        return trusted
+
+    def check_trusted(self, ip: str) -> bool:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+
+        return any(address in network for network in self.trusted_proxies)
+
+    async def reject(self, send: Send, retry_after: float):
+        body = json.dumps({"detail": "Too Many Requests"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(retry_after)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def setup(app: FastAPI):
+    app.add_middleware(
+        RateLimitMiddleware,
+        rate=parse_rate(RATE_LIMIT) if RATE_LIMIT else None,
+        total=parse_rate(RATE_LIMIT_TOTAL) if RATE_LIMIT_TOTAL else None,
+        routes=parse_routes(RATE_LIMIT_ROUTES),
+        limiter_factory=create_limiter_factory(),
+    )
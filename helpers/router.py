@@ -1,7 +1,17 @@
 from fastapi import FastAPI
 
+from routes.admin import router as router_admin
+from routes.cache import router as router_cache
+from routes.db import router as router_db
+from routes.metrics import router as router_metrics
 from routes.my_model import router as router_my_model
+from routes.scheduler import router as router_scheduler
 
 
 def setup(app: FastAPI):
     app.include_router(router_my_model)
+    app.include_router(router_cache)
+    app.include_router(router_db)
+    app.include_router(router_scheduler)
+    app.include_router(router_metrics)
+    app.include_router(router_admin)
@@ -1,11 +1,394 @@
+import asyncio
+import fcntl
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.base import run_coroutine_job, run_job
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.util import iscoroutinefunction_partial
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from helpers.db import async_engine
+from helpers.metrics import Histogram
+from models.scheduler import SchedulerJob, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LOCK_PATH = os.environ.get(
+    "SCHEDULER_LOCK_PATH",
+    os.path.join(tempfile.gettempdir(), "fastapi-app-scheduler.lock"),
+)
+SCHEDULER_LEASE_NAME = os.environ.get("SCHEDULER_LEASE_NAME", "scheduler")
+SCHEDULER_LEASE_TTL = float(os.environ.get("SCHEDULER_LEASE_TTL", "30"))
+SCHEDULER_COALESCE = os.environ.get("SCHEDULER_COALESCE", "true").lower() == "true"
+SCHEDULER_MISFIRE_GRACE_TIME = int(
+    os.environ.get("SCHEDULER_MISFIRE_GRACE_TIME", "3600")
+)
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value else None
+
+
+class SchedulerLeader:
+    # one row per lease name in the shared database: the worker that owns an
+    # unexpired row is the leader and the only one whose scheduler is resumed,
+    # every other worker keeps its scheduler paused and retries the lease
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        name: str = SCHEDULER_LEASE_NAME,
+        ttl: float = SCHEDULER_LEASE_TTL,
+    ):
+        self.engine = engine
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._tables_ready = False
+
+    def get_engine(self) -> AsyncEngine:
+        return self.engine or async_engine
+
+    async def ensure_tables(self):
+        if self._tables_ready:
+            return
+
+        tables = [SchedulerLease.__table__, SchedulerJob.__table__]
+        async with self.get_engine().begin() as conn:
+            await conn.run_sync(
+                SchedulerLease.metadata.create_all, tables=tables, checkfirst=True
+            )
+        self._tables_ready = True
+
+    async def acquire(self) -> bool:
+        await self.ensure_tables()
+
+        # take over the lease when it is ours or when its owner stopped renewing
+        now = time.time()
+        async with self.get_engine().begin() as conn:
+            result = await conn.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(
+                        SchedulerLease.owner == self.owner,
+                        SchedulerLease.expires_at < now,
+                    ),
+                )
+                .values(owner=self.owner, expires_at=now + self.ttl)
+            )
+            if result.rowcount:
+                return True
+
+        try:
+            async with self.get_engine().begin() as conn:
+                await conn.execute(
+                    insert(SchedulerLease).values(
+                        name=self.name, owner=self.owner, expires_at=now + self.ttl
+                    )
+                )
+            return True
+        except IntegrityError:
+            return False
+
+    async def release(self):
+        self.is_leader = False
+        try:
+            async with self.get_engine().begin() as conn:
+                await conn.execute(
+                    delete(SchedulerLease).where(
+                        SchedulerLease.name == self.name,
+                        SchedulerLease.owner == self.owner,
+                    )
+                )
+        except Exception:
+            logger.exception("[scheduler : release]")
+
+    async def claim(self, job, run_time: datetime) -> bool:
+        # a fire time is claimed by moving last_run_time forward, so a worker
+        # that still believes it leads after its lease expired cannot run the
+        # same occurrence again
+        await self.ensure_tables()
+
+        run_at = run_time.timestamp()
+        next_run_at = _timestamp(job.next_run_time)
+        async with self.get_engine().begin() as conn:
+            result = await conn.execute(
+                update(SchedulerJob)
+                .where(
+                    SchedulerJob.id == job.id,
+                    or_(
+                        SchedulerJob.last_run_time.is_(None),
+                        SchedulerJob.last_run_time < run_at,
+                    ),
+                )
+                .values(last_run_time=run_at, next_run_time=next_run_at)
+            )
+            if result.rowcount:
+                return True
+
+            exists = await conn.scalar(
+                select(SchedulerJob.id).where(SchedulerJob.id == job.id)
+            )
+            if exists is not None:
+                return False
+
+        try:
+            async with self.get_engine().begin() as conn:
+                await conn.execute(
+                    insert(SchedulerJob).values(
+                        id=job.id,
+                        last_run_time=run_at,
+                        next_run_time=next_run_at,
+                        runs=0,
+                    )
+                )
+            return True
+        except IntegrityError:
+            return False
+
+    async def record(self, job_id: str, duration: float, runs: int):
+        async with self.get_engine().begin() as conn:
+            await conn.execute(
+                update(SchedulerJob)
+                .where(SchedulerJob.id == job_id)
+                .values(last_duration=duration, runs=SchedulerJob.runs + runs)
+            )
+
+    async def restore(self, scheduler: AsyncIOScheduler):
+        # runs missed while no worker was leading are rescheduled at their
+        # original fire time, the job misfire and coalesce settings then decide
+        # whether they run late, once, or are dropped
+        await self.ensure_tables()
+
+        async with self.get_engine().begin() as conn:
+            result = await conn.execute(
+                select(SchedulerJob.id, SchedulerJob.next_run_time)
+            )
+            persisted = dict(result.all())
+
+            for job in scheduler.get_jobs():
+                if job.id not in persisted:
+                    try:
+                        async with conn.begin_nested():
+                            await conn.execute(
+                                insert(SchedulerJob).values(
+                                    id=job.id,
+                                    next_run_time=_timestamp(job.next_run_time),
+                                    runs=0,
+                                )
+                            )
+                    except IntegrityError:
+                        pass
+                    continue
+
+                next_run_at = persisted[job.id]
+                if (
+                    next_run_at is not None
+                    and job.next_run_time is not None
+                    and next_run_at < job.next_run_time.timestamp()
+                ):
+                    job.modify(
+                        next_run_time=datetime.fromtimestamp(next_run_at, timezone.utc)
+                    )
+
+    async def step(self, scheduler: AsyncIOScheduler) -> bool:
+        try:
+            leader = await self.acquire()
+        except Exception:
+            logger.exception("[scheduler : lease]")
+            leader = False
+
+        if leader and not self.is_leader:
+            try:
+                await self.restore(scheduler)
+            except Exception:
+                logger.exception("[scheduler : restore]")
+            scheduler.resume()
+            logger.info("Scheduler leader elected: %s", self.owner)
+        elif not leader and self.is_leader:
+            scheduler.pause()
+            logger.info("Scheduler leadership lost: %s", self.owner)
+
+        self.is_leader = leader
+        return leader
+
+    async def run(self, scheduler: AsyncIOScheduler):
+        # renew well before the lease expires so a slow round trip is not
+        # mistaken for a dead leader
+        while True:
+            await self.step(scheduler)
+            await asyncio.sleep(self.ttl / 3)
+
+
+class ClusterExecutor(AsyncIOExecutor):
+    # asyncio executor that claims each fire time in the database before
+    # running it and records how long every job takes
+    def __init__(self, leader: SchedulerLeader):
+        super().__init__()
+        self.leader = leader
+        self.jobs: dict[str, dict[str, Any]] = {}
+
+    def _do_submit_job(self, job, run_times):
+        def callback(f):
+            self._pending_futures.discard(f)
+            try:
+                events = f.result()
+            except BaseException:
+                self._run_job_error(job.id, *sys.exc_info()[1:])
+            else:
+                self._run_job_success(job.id, events)
+
+        f = self._eventloop.create_task(self._run(job, run_times))
+        f.add_done_callback(callback)
+        self._pending_futures.add(f)
+
+    async def _run(self, job, run_times: list[datetime]) -> list:
+        stats = self.stats_for(job.id)
+
+        try:
+            claimed = await self.leader.claim(job, max(run_times))
+        except Exception:
+            logger.exception("[scheduler : claim]")
+            claimed = False
+
+        if not claimed:
+            stats["skipped"] += 1
+            return []
+
+        start = time.perf_counter()
+        if iscoroutinefunction_partial(job.func):
+            events = await run_coroutine_job(
+                job, job._jobstore_alias, run_times, self._logger.name
+            )
+        else:
+            events = await self._eventloop.run_in_executor(
+                None, run_job, job, job._jobstore_alias, run_times, self._logger.name
+            )
+        duration = time.perf_counter() - start
+
+        runs = 0
+        for event in events:
+            if event.code == EVENT_JOB_EXECUTED:
+                runs += 1
+            elif event.code == EVENT_JOB_ERROR:
+                runs += 1
+                stats["failures"] += 1
+            elif event.code == EVENT_JOB_MISSED:
+                stats["missed"] += 1
+
+        if runs:
+            stats["runs"] += runs
+            stats["last_duration"] = duration
+            stats["duration"].observe(duration)
+            try:
+                await self.leader.record(job.id, duration, runs)
+            except Exception:
+                logger.exception("[scheduler : record]")
+
+        return events
+
+    def stats_for(self, job_id: str) -> dict[str, Any]:
+        if job_id not in self.jobs:
+            self.jobs[job_id] = {
+                "runs": 0,
+                "failures": 0,
+                "missed": 0,
+                "skipped": 0,
+                "last_duration": None,
+                "duration": Histogram(),
+            }
+        return self.jobs[job_id]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            job_id: {**stats, "duration": stats["duration"].snapshot()}
+            for job_id, stats in self.jobs.items()
+        }
+
 
 jobstores = {
     "default": MemoryJobStore(),
 }
 
+scheduler_leader = SchedulerLeader()
+executor = ClusterExecutor(scheduler_leader)
+
 scheduler = AsyncIOScheduler(
     jobstores=jobstores,
+    executors={"default": executor},
+    job_defaults={
+        "coalesce": SCHEDULER_COALESCE,
+        "misfire_grace_time": SCHEDULER_MISFIRE_GRACE_TIME,
+        "max_instances": 1,
+    },
     timezone="UTC",
 )
+
+
+def scheduler_stats() -> dict[str, Any]:
+    job_stats = executor.stats()
+    return {
+        "running": scheduler.running,
+        "leader": scheduler_leader.is_leader,
+        "owner": scheduler_leader.owner,
+        "jobs": {
+            job.id: {
+                "next_run_time": (
+                    job.next_run_time.isoformat() if job.next_run_time else None
+                ),
+                **job_stats.get(job.id, {}),
+            }
+            for job in scheduler.get_jobs()
+        },
+    }
+
+
+class SchedulerLock:
+    # with several workers on one host only the process holding this file
+    # lock runs the scheduler, the lock goes away with the process
+    def __init__(self, path: str = SCHEDULER_LOCK_PATH):
+        self.path = path
+        self.fd = None
+
+    def acquire(self) -> bool:
+        if self.fd is not None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        self.fd = fd
+        return True
+
+    @property
+    def held(self) -> bool:
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is None:
+            return
+
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+
+scheduler_lock = SchedulerLock()
@@ -0,0 +1,69 @@
+import os
+import types
+from functools import lru_cache
+from typing import Any, Sequence, Union, get_args, get_origin
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Row
+from typing_extensions import TypedDict
+
+# opt in: endpoints that return many rows encode them straight from the
+# database rows, without building a pydantic model per row first
+FAST_SERIALIZATION = os.environ.get("FAST_SERIALIZATION", "false").lower() == "true"
+
+
+@lru_cache(maxsize=None)
+def typed_dict(model: type[BaseModel]) -> type:
+    # same fields and types as the model, so pydantic core picks the same
+    # serializers and the encoded bytes match the model's own output
+    fields = {
+        name: _plain(field.annotation) for name, field in model.model_fields.items()
+    }
+    return TypedDict(f"{model.__name__}Dict", fields)
+
+
+def _plain(annotation: Any) -> Any:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return typed_dict(annotation)
+
+    args = get_args(annotation)
+    if not args:
+        return annotation
+
+    origin = get_origin(annotation)
+    plain = tuple(_plain(arg) for arg in args)
+    if origin in (Union, types.UnionType):
+        return Union[plain]
+
+    return origin[plain]
+
+
+@lru_cache(maxsize=None)
+def serializer(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(typed_dict(model))
+
+
+def as_dicts(rows: Sequence[Row]) -> list[dict[str, Any]]:
+    # every row of a result shares the same keys, read them once
+    if not rows:
+        return []
+
+    fields = rows[0]._fields
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def dump_json(response_model: type[BaseModel], /, **data: Any) -> bytes:
+    # data is not validated, it must already hold every field with the type
+    # the model declares
+    return serializer(response_model).dump_json(data)
+
+
+def json_response(
+    response_model: type[BaseModel], status_code: int = 200, /, **data: Any
+) -> Response:
+    return Response(
+        content=dump_json(response_model, **data),
+        status_code=status_code,
+        media_type="application/json",
+    )
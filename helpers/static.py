@@ -1,6 +1,269 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+from typing import Optional
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
+from starlette.responses import FileResponse
+from starlette.routing import get_route_path
+from starlette.types import Receive, Scope, Send
+
+from helpers.compression import CODECS, COMPRESSION_ENCODINGS, negotiate
+from helpers.http_cache import etag_matches, not_modified_since
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIRECTORY = os.environ.get("STATIC_DIRECTORY", "public")
+
+# "cache" serves public/ from memory, "files" reads it from disk on every
+# request, "none" leaves it to a proxy (see nginx.conf)
+STATIC_MODE = os.environ.get("STATIC_MODE", "cache").lower()
+
+# files above this size are served from disk instead of memory
+STATIC_CACHE_MAX_FILE_SIZE = int(
+    os.environ.get("STATIC_CACHE_MAX_FILE_SIZE", str(1024 * 1024))
+)
+STATIC_COMPRESS_MIN_SIZE = int(os.environ.get("STATIC_COMPRESS_MIN_SIZE", "512"))
+
+# files without a content hash in their name must be revalidated
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", "0"))
+STATIC_IMMUTABLE_MAX_AGE = 31536000
+
+# build tools put a content hash in names like app.3f2a9c1b.js
+HASHED_NAME = re.compile(r"[.-][0-9a-fA-F]{8,}\.[^.]+$")
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/manifest+json",
+    "image/svg+xml",
+)
+
+# files already compressed next to the original, like app.js.gz
+PRECOMPRESSED_SUFFIXES = {"zstd": ".zst", "br": ".br", "gzip": ".gz"}
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class StaticAsset:
+    def __init__(self, path: str, name: str, data: bytes, mtime: float):
+        content_type, _ = mimetypes.guess_type(name)
+        self.path = path
+        self.content_type = content_type or "application/octet-stream"
+        if self.content_type.startswith("text/"):
+            self.content_type += "; charset=utf-8"
+        self.mtime = int(mtime)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+
+        if HASHED_NAME.search(name):
+            self.cache_control = (
+                f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+            )
+        else:
+            self.cache_control = f"public, max-age={STATIC_MAX_AGE}, must-revalidate"
+
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        # encoding -> (body, strong etag), each encoding is its own
+        # representation with its own etag
+        self.variants: dict[str, tuple[bytes, str]] = {
+            "identity": (data, f'"{digest}"')
+        }
+
+        if is_compressible(self.content_type) and len(data) >= STATIC_COMPRESS_MIN_SIZE:
+            for encoding, codec in CODECS.items():
+                precompressed = path + PRECOMPRESSED_SUFFIXES[encoding]
+                if os.path.isfile(precompressed):
+                    with open(precompressed, "rb") as file:
+                        body = file.read()
+                else:
+                    # compressed once at startup, so at the highest level
+                    body = codec.compress(data, codec.max_level)
+                if len(body) < len(data):
+                    self.variants[encoding] = (body, f'"{digest}-{encoding}"')
+
+        self.encodings = [e for e in COMPRESSION_ENCODINGS if e in self.variants]
+
+    def select(self, accept_encoding: str) -> tuple[str, bytes, str]:
+        encoding = negotiate(accept_encoding, self.encodings) or "identity"
+
+        body, etag = self.variants[encoding]
+        return encoding, body, etag
+
+
+class StaticCache:
+    # asgi app serving a directory scanned once at startup: a lookup is a dict
+    # access, unmatched paths never touch the filesystem
+    def __init__(
+        self,
+        directory: str = STATIC_DIRECTORY,
+        max_file_size: int = STATIC_CACHE_MAX_FILE_SIZE,
+    ):
+        self.directory = directory
+        self.max_file_size = max_file_size
+        self.assets: dict[str, StaticAsset] = {}
+        self.large_files: dict[str, str] = {}
+        self.scan()
+
+    def scan(self):
+        skip = tuple(PRECOMPRESSED_SUFFIXES.values())
+        for root, _, files in os.walk(self.directory):
+            relative_root = os.path.relpath(root, self.directory)
+            prefix = "/" if relative_root == "." else f"/{relative_root}/"
+
+            for name in files:
+                path = os.path.join(root, name)
+                url = prefix + name
+                if name.endswith(skip) and os.path.isfile(os.path.splitext(path)[0]):
+                    continue
+
+                stat = os.stat(path)
+                if stat.st_size > self.max_file_size:
+                    self.large_files[url] = path
+                    continue
+
+                with open(path, "rb") as file:
+                    self.assets[url] = StaticAsset(
+                        path, name, file.read(), stat.st_mtime
+                    )
+
+        logger.info(
+            "Static cache: %s files in memory, %s from disk",
+            len(self.assets),
+            len(self.large_files),
+        )
+
+    def lookup(self, path: str) -> tuple[Optional[str], int]:
+        # html mode like StaticFiles: directories serve their index.html
+        if path.endswith("/"):
+            index = path + "index.html"
+            return (index, 200) if index in self.assets else (None, 404)
+        if path in self.assets or path in self.large_files:
+            return path, 200
+        if path + "/index.html" in self.assets:
+            return None, 307
+        return None, 404
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        assert scope["type"] == "http"
+
+        if scope["method"] not in ("GET", "HEAD"):
+            await self.send_error(send, 405, "Method Not Allowed")
+            return
+
+        url, status = self.lookup(get_route_path(scope) or "/")
+
+        if status == 307:
+            location = scope["path"] + "/"
+            if scope.get("query_string"):
+                location += "?" + scope["query_string"].decode("latin-1")
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 307,
+                    "headers": [(b"location", location.encode("latin-1"))],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if url in self.large_files:
+            response = FileResponse(self.large_files[url])
+            await response(scope, receive, send)
+            return
+
+        if url is None:
+            if "/404.html" not in self.assets:
+                await self.send_error(send, 404, "Not Found")
+                return
+            url = "/404.html"
+
+        await self.send_asset(scope, send, self.assets[url], status)
+
+    async def send_asset(self, scope: Scope, send: Send, asset: StaticAsset, status):
+        headers = {}
+        for name, value in scope["headers"]:
+            if name in (b"accept-encoding", b"if-none-match", b"if-modified-since"):
+                headers[name] = value.decode("latin-1")
+
+        encoding, body, etag = asset.select(headers.get(b"accept-encoding", ""))
+        response_headers = [
+            (b"etag", etag.encode()),
+            (b"last-modified", asset.last_modified.encode()),
+            (b"cache-control", asset.cache_control.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+
+        # If-None-Match wins, If-Modified-Since only counts without it
+        if b"if-none-match" in headers:
+            not_modified = etag_matches(headers[b"if-none-match"], etag)
+        else:
+            not_modified = not_modified_since(
+                headers.get(b"if-modified-since", ""), asset.mtime
+            )
+
+        if status == 200 and not_modified:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": response_headers,
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        response_headers += [
+            (b"content-type", asset.content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if encoding != "identity":
+            response_headers.append((b"content-encoding", encoding.encode()))
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": response_headers,
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": b"" if scope["method"] == "HEAD" else body,
+            }
+        )
+
+    async def send_error(self, send: Send, status: int, detail: str):
+        body = json.dumps({"detail": detail}, separators=(",", ":")).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
 
 
 def setup(app: FastAPI):
-    app.mount("/", StaticFiles(directory="public", html=True), name="public")
+    if STATIC_MODE == "none":
+        return
+
+    if STATIC_MODE == "files":
+        static_app = StaticFiles(directory=STATIC_DIRECTORY, html=True)
+    else:
+        static_app = StaticCache(STATIC_DIRECTORY)
+
+    app.mount("/", static_app, name="public")
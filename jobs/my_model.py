@@ -8,7 +8,7 @@ from services import my_model as service_my_model
 logger = logging.getLogger(__name__)
 
 
-@scheduler.scheduled_job("cron", hour=0, minute=1)
+@scheduler.scheduled_job("cron", id="create_my_model", hour=0, minute=1)
 async def job_create_my_model():
     async with AsyncSessionLocal() as session:
         data = {"field1": "Test Job", "field2": False}
@@ -1,6 +1,15 @@
 from fastapi import FastAPI
 
-from helpers import cors, log, rate_limiter, router, static
+from helpers import (
+    compression,
+    cors,
+    diagnostics,
+    instrumentation,
+    log,
+    rate_limiter,
+    router,
+    static,
+)
 from helpers.lifespan import lifespan
 
 # log
@@ -10,10 +19,11 @@ log.setup()
 app = FastAPI(lifespan=lifespan)
 rate_limiter.setup(app)
 cors.setup(app)
+# inside the metrics middleware, so response sizes are the bytes sent
+compression.setup(app)
+instrumentation.setup(app)
+diagnostics.setup(app)
 
 # routes
 router.setup(app)
 static.setup(app)
-
-# scheduled jobs
-import jobs.my_model  # noqa: F401
@@ -0,0 +1,38 @@
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+)
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection):
+    metadata = MetaData()
+
+    Table(
+        "my_model",
+        metadata,
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("field1", String(255), nullable=False),
+        Column("field2", Boolean, nullable=False),
+        Column(
+            "created_at",
+            DateTime(timezone=True),
+            server_default=func.now(),
+            nullable=False,
+        ),
+        Column(
+            "updated_at",
+            DateTime(timezone=True),
+            server_default=func.now(),
+            nullable=False,
+        ),
+    )
+
+    # databases created before migrations existed already have the table
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,51 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    func,
+)
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection):
+    metadata = MetaData()
+
+    Table(
+        "scheduler_lease",
+        metadata,
+        Column("name", String(64), primary_key=True),
+        Column("owner", String(255), nullable=False),
+        Column("expires_at", Float, nullable=False),
+    )
+
+    Table(
+        "scheduler_job",
+        metadata,
+        Column("id", String(191), primary_key=True),
+        Column("next_run_time", Float, nullable=True),
+        Column("last_run_time", Float, nullable=True),
+        Column("last_duration", Float, nullable=True),
+        Column("runs", Integer, nullable=False),
+    )
+
+    Table(
+        "batch_checkpoint",
+        metadata,
+        Column("name", String(191), primary_key=True),
+        Column("last_key", Text, nullable=True),
+        Column("rows", Integer, nullable=False),
+        Column(
+            "updated_at",
+            DateTime(timezone=True),
+            server_default=func.now(),
+            nullable=False,
+        ),
+    )
+
+    # the scheduler and batch helpers may have created them on first use
+    metadata.create_all(conn, checkfirst=True)
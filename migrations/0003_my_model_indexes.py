@@ -0,0 +1,30 @@
+from sqlalchemy import Index, MetaData, Table, text
+from sqlalchemy.engine import Connection
+
+
+def upgrade(conn: Connection):
+    table = Table("my_model", MetaData(), autoload_with=conn)
+
+    indexes = [
+        Index("ix_my_model_created_at_id", table.c.created_at, table.c.id),
+        Index("ix_my_model_field2_id", table.c.field2, table.c.id),
+    ]
+
+    if conn.dialect.name == "postgresql":
+        indexes += [
+            Index(
+                "ix_my_model_field2_created_at_id",
+                table.c.created_at,
+                table.c.id,
+                postgresql_where=text("field2"),
+            ),
+            Index(
+                "ix_my_model_not_field2_created_at_id",
+                table.c.created_at,
+                table.c.id,
+                postgresql_where=text("NOT field2"),
+            ),
+        ]
+
+    for index in indexes:
+        index.create(conn, checkfirst=True)
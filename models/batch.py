@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, Integer, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from helpers.db import Base
+
+
+class BatchCheckpoint(Base):
+    __tablename__ = "batch_checkpoint"
+
+    name: Mapped[str] = mapped_column(String(191), primary_key=True)
+
+    # json encoded key of the last row of the last fully committed chunk
+    last_key: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    rows: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
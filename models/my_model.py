@@ -1,8 +1,8 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy import Boolean, DateTime, String, func
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import Boolean, DateTime, Index, String, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from helpers.db import Base
@@ -10,6 +10,27 @@ from helpers.db import Base
 
 class MyModel(Base):
     __tablename__ = "my_model"
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # keyset pages and time ranges ordered by created_at
+        Index("ix_my_model_created_at_id", "created_at", "id"),
+        # filtering on field2, paged by id
+        Index("ix_my_model_field2_id", "field2", "id"),
+        # field2 rows over a time range: postgres keeps one partial index per
+        # value, each only as large as the rows it matches
+        Index(
+            "ix_my_model_field2_created_at_id",
+            "created_at",
+            "id",
+            postgresql_where=text("field2"),
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_my_model_not_field2_created_at_id",
+            "created_at",
+            "id",
+            postgresql_where=text("NOT field2"),
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
@@ -41,10 +62,22 @@ class MyModelSchema(BaseModel):
 
 
 class MyModelRequest(BaseModel):
-    field1: str
+    # the column is varchar(255)
+    field1: str = Field(max_length=255)
     field2: bool
 
 
 class MyModelResponse(BaseModel):
     message: str
     model: Optional[MyModelSchema] = None
+
+
+class MyModelBulkResponse(BaseModel):
+    message: str
+    models: list[MyModelSchema] = []
+
+
+class MyModelListResponse(BaseModel):
+    message: str
+    models: list[MyModelSchema] = []
+    next_cursor: Optional[str] = None
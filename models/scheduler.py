@@ -0,0 +1,26 @@
+from typing import Optional
+
+from sqlalchemy import Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from helpers.db import Base
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_lease"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(255), nullable=False)
+
+    # epoch seconds, compared across workers so no timezone handling is needed
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class SchedulerJob(Base):
+    __tablename__ = "scheduler_job"
+
+    id: Mapped[str] = mapped_column(String(191), primary_key=True)
+    next_run_time: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    last_run_time: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    last_duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
@@ -0,0 +1,30 @@
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from helpers.profiler import PROFILE_MAX_SECONDS, AdminAccess, loop_lag_monitor, profile
+
+router = APIRouter(prefix="/api/admin", dependencies=[AdminAccess])
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def admin_profile(
+    seconds: Annotated[float, Query(gt=0, le=PROFILE_MAX_SECONDS)] = 5,
+    interval: Annotated[float, Query(ge=0.001, le=1)] = 0.005,
+    idle: bool = False,
+):
+    stacks = await profile(seconds, interval, idle)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    # collapsed stacks, ready for flamegraph.pl or speedscope
+    return PlainTextResponse(
+        stacks,
+        headers={"content-disposition": 'attachment; filename="profile.folded"'},
+    )
+
+
+@router.get("/loop-lag")
+async def admin_loop_lag():
+    return loop_lag_monitor.stats()
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from helpers.cache import get_cache
+from helpers.profiler import AdminAccess
+
+router = APIRouter()
+
+
+@router.get("/api/cache/stats", dependencies=[AdminAccess])
+async def cache_stats():
+    return get_cache().stats()
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+
+from helpers.db import pool_stats, read_replicas
+from helpers.profiler import AdminAccess
+
+router = APIRouter()
+
+
+@router.get("/api/db/pool/stats", dependencies=[AdminAccess])
+async def db_pool_stats():
+    return {
+        **pool_stats(),
+        "replicas": read_replicas.stats(),
+        "replica_fallbacks": read_replicas.fallbacks,
+    }
@@ -1,32 +1,243 @@
-from fastapi import APIRouter, HTTPException
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Annotated, AsyncIterator, Literal, Optional, Union
 
-from helpers.db import DatabaseSession
-from models.my_model import MyModel, MyModelRequest, MyModelResponse
+from fastapi import APIRouter, Body, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import http_cache, ingest, serialization
+from helpers.db import DatabaseSession, ReadOnlyDatabaseSession
+from models.my_model import (
+    MyModel,
+    MyModelBulkResponse,
+    MyModelListResponse,
+    MyModelRequest,
+    MyModelSchema,
+    MyModelResponse,
+)
 from services import my_model as service_my_model
 
 router = APIRouter()
 
+RANDOM_MAX_COUNT = 100
+
+LIST_MAX_LIMIT = 1000
+
+# rows accepted by one bulk create, lists from the copy threshold of
+# services.my_model up to this size are written with copy on postgres
+BULK_CREATE_MAX_ITEMS = int(os.environ.get("BULK_CREATE_MAX_ITEMS", "10000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
 
 @router.post("/api/my-model/create", response_model=MyModelResponse, status_code=201)
 async def my_model_create(request: MyModelRequest, db: DatabaseSession):
-    obj = MyModel(**request.model_dump())
+    if ingest.INGEST_ENABLED:
+        try:
+            model = await service_my_model.create_queued(request)
+        except ingest.IngestQueueFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many pending creates",
+                headers={"Retry-After": "1"},
+            )
+    else:
+        obj = MyModel(**request.model_dump())
+        model = await service_my_model.create_returning(obj, db)
 
-    id = await service_my_model.create(obj, db)
-    if id is None:
+    if model is None:
         raise HTTPException(status_code=400, detail="Failed to create MyModel")
 
-    obj = await service_my_model.find_by_id(id, db)
-    if obj is None:
-        raise HTTPException(status_code=404, detail="MyModel not found after creation")
+    return MyModelResponse(message="created", model=model)
+
+
+@router.post(
+    "/api/my-model/bulk-create", response_model=MyModelBulkResponse, status_code=201
+)
+async def my_model_bulk_create(
+    request: Annotated[list[MyModelRequest], Body(max_length=BULK_CREATE_MAX_ITEMS)],
+    db: DatabaseSession,
+):
+    models = await service_my_model.bulk_create(request, db)
+    if models is None:
+        raise HTTPException(status_code=400, detail="Failed to bulk create MyModel")
+
+    return MyModelBulkResponse(message="created", models=models)
+
 
-    return MyModelResponse(message="created", model=obj)
+@router.get(
+    "/api/my-model/random",
+    response_model=Union[MyModelResponse, MyModelBulkResponse],
+)
+async def my_model_random(
+    request: Request,
+    response: Response,
+    db: ReadOnlyDatabaseSession,
+    count: Annotated[int, Query(ge=1, le=RANDOM_MAX_COUNT)] = 1,
+):
+    if count > 1:
+        models = await service_my_model.get_random_rows(db, count)
+        if not models:
+            return MyModelBulkResponse(message="not-found")
 
+        not_modified = http_cache.conditional(
+            request, response, models, use_last_modified=False
+        )
+        if not_modified:
+            return not_modified
+
+        return MyModelBulkResponse(message="random", models=models)
 
-@router.get("/api/my-model/random", response_model=MyModelResponse)
-async def my_model_random(db: DatabaseSession):
     obj = await service_my_model.get_random_row(db)
 
     if obj is None:
         return MyModelResponse(message="not-found")
 
+    not_modified = http_cache.conditional(
+        request, response, [obj], use_last_modified=False
+    )
+    if not_modified:
+        return not_modified
+
     return MyModelResponse(message="random", model=obj)
+
+
+@router.get("/api/my-model/list", response_model=MyModelListResponse)
+async def my_model_list(
+    db: ReadOnlyDatabaseSession,
+    limit: Annotated[int, Query(ge=1, le=LIST_MAX_LIMIT)] = 100,
+    cursor: Optional[str] = None,
+    order_by: Literal["id", "created_at"] = "id",
+):
+    return await list_response(db, limit, cursor, order_by)
+
+
+@router.get("/api/my-model", response_model=MyModelListResponse)
+async def my_model_query(
+    db: ReadOnlyDatabaseSession,
+    field2: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: Annotated[int, Query(ge=1, le=LIST_MAX_LIMIT)] = 100,
+    cursor: Optional[str] = None,
+    order_by: Literal["id", "created_at"] = "id",
+):
+    return await list_response(
+        db,
+        limit,
+        cursor,
+        order_by,
+        field2=field2,
+        created_after=created_after,
+        created_before=created_before,
+    )
+
+
+async def list_response(
+    db: AsyncSession,
+    limit: int,
+    cursor: Optional[str],
+    order_by: str,
+    **filters,
+):
+    after = None
+    if cursor:
+        try:
+            after = service_my_model.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    fast = serialization.FAST_SERIALIZATION
+    list_page = service_my_model.list_rows if fast else service_my_model.list_page
+
+    page = await list_page(db, limit, after, order_by, **filters)
+    if page is None:
+        raise HTTPException(status_code=400, detail="Failed to list MyModel")
+
+    models, next_cursor = page
+    if fast:
+        return serialization.json_response(
+            MyModelListResponse,
+            message="list",
+            models=serialization.as_dicts(models),
+            next_cursor=next_cursor,
+        )
+
+    return MyModelListResponse(message="list", models=models, next_cursor=next_cursor)
+
+
+@router.get("/api/my-model/export")
+async def my_model_export(
+    db: ReadOnlyDatabaseSession,
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    if format == "ndjson" and serialization.FAST_SERIALIZATION:
+        content = export_ndjson_rows(service_my_model.stream_rows(db))
+    else:
+        batches = service_my_model.stream_all(db)
+        content = export_csv(batches) if format == "csv" else export_ndjson(batches)
+
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=my_model.{format}"},
+    )
+
+
+async def export_ndjson(
+    batches: AsyncIterator[list[MyModelSchema]],
+) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield b"".join(item.model_dump_json().encode() + b"\n" for item in batch)
+
+
+async def export_ndjson_rows(batches: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    adapter = serialization.serializer(MyModelSchema)
+    async for rows in batches:
+        yield b"".join(
+            adapter.dump_json(item) + b"\n" for item in serialization.as_dicts(rows)
+        )
+
+
+async def export_csv(
+    batches: AsyncIterator[list[MyModelSchema]],
+) -> AsyncIterator[bytes]:
+    fields = list(MyModelSchema.model_fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    async for batch in batches:
+        for item in batch:
+            data = item.model_dump(mode="json")
+            writer.writerow([data[field] for field in fields])
+
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # header only when the table is empty
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+# declared last so the fixed paths above match before the id parameter
+@router.get("/api/my-model/{id}", response_model=MyModelResponse)
+async def my_model_get(
+    id: int, request: Request, response: Response, db: ReadOnlyDatabaseSession
+):
+    obj = await service_my_model.find_by_id(id, db)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="MyModel not found")
+
+    not_modified = http_cache.conditional(request, response, [obj])
+    if not_modified:
+        return not_modified
+
+    return MyModelResponse(message="found", model=obj)
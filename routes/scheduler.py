@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+
+from helpers.profiler import AdminAccess
+
+router = APIRouter()
+
+
+@router.get("/api/scheduler/stats", dependencies=[AdminAccess])
+async def scheduler_job_stats():
+    # imported here so `import main` does not load apscheduler
+    from helpers.scheduler import scheduler_stats
+
+    return scheduler_stats()
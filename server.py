@@ -0,0 +1,103 @@
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any
+
+import uvicorn
+
+from helpers.db import DATABASE_URL, is_sqlite_file
+from helpers.instrumentation import clear_snapshots
+
+logger = logging.getLogger(__name__)
+
+WEB_HOST = os.environ.get("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.environ.get("WEB_PORT", "8000"))
+
+# 0 means one worker per available cpu
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "0"))
+
+WEB_BACKLOG = int(os.environ.get("WEB_BACKLOG", "2048"))
+WEB_KEEP_ALIVE = int(os.environ.get("WEB_KEEP_ALIVE", "5"))
+
+# 0 disables the limit
+WEB_LIMIT_CONCURRENCY = int(os.environ.get("WEB_LIMIT_CONCURRENCY", "0"))
+WEB_LIMIT_MAX_REQUESTS = int(os.environ.get("WEB_LIMIT_MAX_REQUESTS", "0"))
+
+WEB_LOG_LEVEL = os.environ.get("WEB_LOG_LEVEL", "warning")
+WEB_ACCESS_LOG = os.environ.get("WEB_ACCESS_LOG", "false").lower() == "true"
+WEB_FORWARDED_ALLOW_IPS = os.environ.get("WEB_FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def cpu_count() -> int:
+    # respect cpu affinity (containers, taskset) when the platform exposes it
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def options() -> dict[str, Any]:
+    return {
+        "host": WEB_HOST,
+        "port": WEB_PORT,
+        "workers": WEB_WORKERS or cpu_count(),
+        "loop": "uvloop" if available("uvloop") else "asyncio",
+        "http": "httptools" if available("httptools") else "h11",
+        "backlog": WEB_BACKLOG,
+        "timeout_keep_alive": WEB_KEEP_ALIVE,
+        "limit_concurrency": WEB_LIMIT_CONCURRENCY or None,
+        "limit_max_requests": WEB_LIMIT_MAX_REQUESTS or None,
+        "log_level": WEB_LOG_LEVEL,
+        "access_log": WEB_ACCESS_LOG,
+        "proxy_headers": True,
+        "forwarded_allow_ips": WEB_FORWARDED_ALLOW_IPS,
+    }
+
+
+def main():
+    run_options = options()
+
+    # the single sqlite writer is a lock inside one process, workers would
+    # each open their own and fail with "database is locked" under writes
+    if run_options["workers"] > 1 and is_sqlite_file(DATABASE_URL):
+        logger.warning(
+            "DATABASE_URL is a sqlite file, running 1 worker instead of %s",
+            run_options["workers"],
+        )
+        run_options["workers"] = 1
+
+    # workers publish metrics snapshots to a directory only this server uses
+    metrics_dir = None
+    if run_options["workers"] > 1 and not os.environ.get("METRICS_DIR"):
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        metrics_dir = tempfile.mkdtemp(prefix="fastapi-app-metrics-", dir=shm)
+        os.environ["METRICS_DIR"] = metrics_dir
+    elif run_options["workers"] > 1 and os.path.isdir(os.environ["METRICS_DIR"]):
+        # a configured directory may hold the snapshots of a previous run
+        clear_snapshots(os.environ["METRICS_DIR"])
+
+    # a memory cache is private to its worker and would keep serving rows
+    # that another worker changed until they expire, workers need redis
+    cache_backend = os.environ.get("CACHE_BACKEND", "memory").lower()
+    if run_options["workers"] > 1 and cache_backend == "memory":
+        logger.warning(
+            "CACHE_BACKEND=memory is per worker, the cache is disabled with %s "
+            "workers, set CACHE_BACKEND=redis to share one",
+            run_options["workers"],
+        )
+        os.environ["CACHE_BACKEND"] = "none"
+
+    try:
+        uvicorn.run("main:app", **run_options)
+    finally:
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
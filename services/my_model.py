@@ -1,19 +1,84 @@
+import base64
+import json
 import logging
-from typing import Optional
+import random
+from datetime import datetime
+from typing import AsyncIterator, Optional, Union
 
-from sqlalchemy import select
+from sqlalchemy import (
+    Row,
+    Select,
+    and_,
+    bindparam,
+    false,
+    func,
+    insert,
+    or_,
+    select,
+    text,
+    true,
+)
+from sqlalchemy import update as sql_update
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.my_model import MyModel
+from helpers.cache import get_cache
+from helpers.db import AsyncSessionLocal
+from helpers.ingest import IngestQueue
+from models.my_model import MyModel, MyModelRequest, MyModelSchema
 
 logger = logging.getLogger(__name__)
 
+# older sqlite builds cap a statement at 999 bound parameters (2 per row here)
+BULK_CREATE_CHUNK_SIZE = 400
+
+# below this size a few multi-row inserts are cheaper than the copy round trips
+BULK_CREATE_COPY_THRESHOLD = 1000
+
+# id probes per random sample before falling back to a pivot scan
+RANDOM_MAX_ATTEMPTS = 5
+
+# new rows only become candidates for random sampling once the bounds expire
+RANDOM_BOUNDS_TTL = 5
+
+CACHE_KEY_BOUNDS = "my_model:bounds"
+
+# rows fetched per round trip while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+RETURNING_COLUMNS = (
+    MyModel.id,
+    MyModel.field1,
+    MyModel.field2,
+    MyModel.created_at,
+    MyModel.updated_at,
+)
+
+# reads use the table columns instead of the orm attributes: statements skip
+# the orm compile step and the identity map, and the fixed ones below are
+# built once with bind parameters, so only the cached compiled form is reused
+COLUMNS = MyModel.__table__.c
+READ_COLUMNS = tuple(COLUMNS[column.key] for column in RETURNING_COLUMNS)
+
+SELECT_BY_ID = select(*READ_COLUMNS).where(COLUMNS.id == bindparam("id"))
+
+SELECT_BY_IDS = select(*READ_COLUMNS).where(
+    COLUMNS.id.in_(bindparam("ids", expanding=True))
+)
+
+# min and max are separate subqueries so each one is a single index seek
+SELECT_BOUNDS = select(
+    select(func.min(COLUMNS.id)).scalar_subquery(),
+    select(func.max(COLUMNS.id)).scalar_subquery(),
+)
+
 
 async def create(obj: MyModel, db: AsyncSession) -> Optional[int]:
     try:
         db.add(obj)
         await db.commit()
         await db.refresh(obj)
+        await get_cache().delete(CACHE_KEY_BOUNDS)
         return obj.id
     except Exception:
         logger.exception("[my model : create]")
@@ -21,16 +86,323 @@ async def create(obj: MyModel, db: AsyncSession) -> Optional[int]:
         return None
 
 
-async def get_random_row(db: AsyncSession) -> Optional[MyModel]:
+async def create_returning(obj: MyModel, db: AsyncSession) -> Optional[MyModelSchema]:
     try:
-        stmt = select(MyModel).order_by(MyModel.id.desc()).limit(1)
-        result = await db.execute(stmt)
-        return result.scalar_one_or_none()
+        # eager defaults bring id and timestamps back in the insert itself
+        db.add(obj)
+        await db.flush()
+        schema = MyModelSchema.model_validate(obj)
+        await db.commit()
+        await _cache_set(schema)
+        await get_cache().delete(CACHE_KEY_BOUNDS)
+        return schema
+    except Exception:
+        logger.exception("[my model : create returning]")
+        await db.rollback()
+        return None
+
+
+async def bulk_create(
+    items: list[MyModelRequest],
+    db: AsyncSession,
+    chunk_size: int = BULK_CREATE_CHUNK_SIZE,
+) -> Optional[list[MyModelSchema]]:
+    try:
+        return await _bulk_create(items, db, chunk_size)
+    except Exception:
+        logger.exception("[my model : bulk create]")
+        await db.rollback()
+        return None
+
+
+async def _bulk_create(
+    items: list[MyModelRequest],
+    db: AsyncSession,
+    chunk_size: int = BULK_CREATE_CHUNK_SIZE,
+) -> list[MyModelSchema]:
+    rows = [item.model_dump() for item in items]
+
+    if _can_copy(db) and len(rows) >= BULK_CREATE_COPY_THRESHOLD:
+        created = await _bulk_create_copy(rows, db)
+    else:
+        created = []
+        for start in range(0, len(rows), chunk_size):
+            stmt = (
+                insert(MyModel)
+                .values(rows[start : start + chunk_size])
+                .returning(*RETURNING_COLUMNS)
+            )
+            result = await db.execute(stmt)
+            created.extend(sorted(result.all(), key=lambda row: row.id))
+
+    await db.commit()
+    await get_cache().delete(CACHE_KEY_BOUNDS)
+    return [MyModelSchema.model_validate(row) for row in created]
+
+
+async def _ingest_flush(items: list[MyModelRequest]) -> list[MyModelSchema]:
+    # raises, so the queue can tell a bad row from a failing database. the
+    # session rolls back when it closes
+    async with AsyncSessionLocal() as db:
+        return await _bulk_create(items, db)
+
+
+# optional ingest mode: concurrent creates share one multi-row insert and
+# one commit, each caller gets back its own row
+create_queue = IngestQueue(_ingest_flush, split_errors=(IntegrityError, DataError))
+
+
+async def create_queued(item: MyModelRequest) -> Optional[MyModelSchema]:
+    return await create_queue.submit(item)
+
+
+def _can_copy(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.driver == "asyncpg"
+
+
+async def _bulk_create_copy(rows: list[dict], db: AsyncSession) -> list:
+    # copy into a transaction scoped staging table, then move rows with one insert
+    await db.execute(
+        text(
+            "CREATE TEMP TABLE my_model_copy "
+            "(ord integer, field1 varchar(255), field2 boolean) ON COMMIT DROP"
+        )
+    )
+
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "my_model_copy",
+        records=[(i, row["field1"], row["field2"]) for i, row in enumerate(rows)],
+        columns=["ord", "field1", "field2"],
+    )
+
+    result = await db.execute(
+        text(
+            "WITH inserted AS ("
+            "INSERT INTO my_model (field1, field2) "
+            "SELECT field1, field2 FROM my_model_copy ORDER BY ord "
+            "RETURNING id, field1, field2, created_at, updated_at"
+            ") SELECT * FROM inserted ORDER BY id"
+        )
+    )
+    return result.all()
+
+
+async def get_random_row(db: AsyncSession) -> Optional[MyModelSchema]:
+    items = await get_random_rows(db, 1)
+    if items:
+        return items[0]
+    return None
+
+
+async def get_random_rows(
+    db: AsyncSession, count: int = 1
+) -> Optional[list[MyModelSchema]]:
+    try:
+        bounds = await _get_bounds(db)
+        if bounds is None:
+            return []
+
+        # probe random ids in the range and keep exact hits, so every row has
+        # the same chance no matter how many gaps deleted rows have left
+        low, high = bounds
+        found: dict[int, MyModelSchema] = {}
+        ids = range(low, high + 1)
+        for _ in range(RANDOM_MAX_ATTEMPTS):
+            missing = count - len(found)
+            if missing <= 0:
+                break
+
+            probes = [
+                id
+                for id in random.sample(ids, min(len(ids), missing * 2))
+                if id not in found
+            ]
+            hits = await _find_many(probes, db)
+            random.shuffle(hits)
+            for item in hits[:missing]:
+                found[item.id] = item
+
+        # mostly gaps or fewer rows than requested: take the rows that follow a
+        # random pivot, wrapping around to the start of the table
+        pivot = random.randint(low, high)
+        for clause in (COLUMNS.id >= pivot, COLUMNS.id < pivot):
+            missing = count - len(found)
+            if missing <= 0:
+                break
+
+            stmt = (
+                select(*READ_COLUMNS)
+                .where(clause, COLUMNS.id.not_in(list(found)))
+                .order_by(COLUMNS.id)
+                .limit(missing)
+            )
+            result = await db.execute(stmt)
+            for row in result:
+                found[row.id] = MyModelSchema.model_validate(row)
+
+        return list(found.values())
+    except Exception:
+        logger.exception("[my model : get random rows]")
+        return None
+
+
+async def _get_bounds(db: AsyncSession) -> Optional[tuple[int, int]]:
+    cached = await get_cache().get(CACHE_KEY_BOUNDS)
+    if cached is not None:
+        low, high = json.loads(cached)
+        return low, high
+
+    result = await db.execute(SELECT_BOUNDS)
+    low, high = result.one()
+    if low is None:
+        return None
+
+    await get_cache().set(
+        CACHE_KEY_BOUNDS, json.dumps([low, high]).encode(), ttl=RANDOM_BOUNDS_TTL
+    )
+    return low, high
+
+
+async def _find_many(ids: list[int], db: AsyncSession) -> list[MyModelSchema]:
+    cached = await get_cache().get_many(_cache_key(id) for id in ids)
+    items = [MyModelSchema.model_validate_json(value) for value in cached.values()]
+
+    pending = [id for id in ids if _cache_key(id) not in cached]
+    if pending:
+        result = await db.execute(SELECT_BY_IDS, {"ids": pending})
+        for row in result:
+            schema = MyModelSchema.model_validate(row)
+            await _cache_set(schema)
+            items.append(schema)
+
+    return items
+
+
+def _cache_key(id: int) -> str:
+    return f"my_model:{id}"
+
+
+async def _cache_set(schema: MyModelSchema):
+    await get_cache().set(_cache_key(schema.id), schema.model_dump_json().encode())
+
+
+def encode_cursor(item: Union[MyModelSchema, Row]) -> str:
+    data = {"id": item.id, "created_at": item.created_at.isoformat()}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, datetime]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(data["id"]), datetime.fromisoformat(data["created_at"])
+    except Exception as e:
+        raise ValueError("invalid cursor") from e
+
+
+async def list_page(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[tuple[int, datetime]] = None,
+    order_by: str = "id",
+    **filters,
+) -> Optional[tuple[list[MyModelSchema], Optional[str]]]:
+    page = await list_rows(db, limit, after, order_by, **filters)
+    if page is None:
+        return None
+
+    rows, next_cursor = page
+    return [MyModelSchema.model_validate(row) for row in rows], next_cursor
+
+
+def list_query(
+    limit: int,
+    after: Optional[tuple[int, datetime]] = None,
+    order_by: str = "id",
+    field2: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+) -> Select:
+    # keyset pagination: seek past the last row seen instead of using an
+    # offset, so every page costs the same no matter how deep it is. each
+    # filter and order combination is served by an index on my_model
+    stmt = select(*READ_COLUMNS)
+
+    if field2 is not None:
+        # a literal, not a bound parameter: postgres can only pick a partial
+        # index when the predicate is known while planning
+        stmt = stmt.where(COLUMNS.field2 == (true() if field2 else false()))
+    if created_after is not None:
+        stmt = stmt.where(COLUMNS.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(COLUMNS.created_at < created_before)
+
+    if order_by == "created_at":
+        stmt = stmt.order_by(COLUMNS.created_at, COLUMNS.id)
+        if after:
+            after_id, after_created_at = after
+            stmt = stmt.where(
+                or_(
+                    COLUMNS.created_at > after_created_at,
+                    and_(
+                        COLUMNS.created_at == after_created_at,
+                        COLUMNS.id > after_id,
+                    ),
+                )
+            )
+    else:
+        stmt = stmt.order_by(COLUMNS.id)
+        if after:
+            stmt = stmt.where(COLUMNS.id > after[0])
+
+    # one extra row tells whether there is a next page
+    return stmt.limit(limit + 1)
+
+
+async def list_rows(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[tuple[int, datetime]] = None,
+    order_by: str = "id",
+    **filters,
+) -> Optional[tuple[list[Row], Optional[str]]]:
+    try:
+        result = await db.execute(list_query(limit, after, order_by, **filters))
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1])
+
+        return rows, next_cursor
     except Exception:
-        logger.exception("[my model : get random row]")
+        logger.exception("[my model : list rows]")
         return None
 
 
+async def stream_all(
+    db: AsyncSession, batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[list[MyModelSchema]]:
+    async for rows in stream_rows(db, batch_size):
+        yield [MyModelSchema.model_validate(row) for row in rows]
+
+
+async def stream_rows(
+    db: AsyncSession, batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[list[Row]]:
+    # server side cursor, only one batch of plain rows is held at a time
+    stmt = (
+        select(*READ_COLUMNS)
+        .order_by(COLUMNS.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
+
+
 async def update(id: int, obj: MyModel, db: AsyncSession) -> Optional[MyModel]:
     try:
         stmt = select(MyModel).where(MyModel.id == id)
@@ -41,6 +413,7 @@ async def update(id: int, obj: MyModel, db: AsyncSession) -> Optional[MyModel]:
             item.field2 = obj.field2
             await db.commit()
             await db.refresh(item)
+            await _cache_set(MyModelSchema.model_validate(item))
             return item
         return None
     except Exception:
@@ -49,6 +422,31 @@ async def update(id: int, obj: MyModel, db: AsyncSession) -> Optional[MyModel]:
         return None
 
 
+async def update_returning(
+    id: int, obj: MyModel, db: AsyncSession
+) -> Optional[MyModelSchema]:
+    try:
+        stmt = (
+            sql_update(MyModel)
+            .where(MyModel.id == id)
+            .values(field1=obj.field1, field2=obj.field2)
+            .returning(*RETURNING_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+        result = await db.execute(stmt)
+        row = result.one_or_none()
+        await db.commit()
+        if row:
+            schema = MyModelSchema.model_validate(row)
+            await _cache_set(schema)
+            return schema
+        return None
+    except Exception:
+        logger.exception("[my model : update returning]")
+        await db.rollback()
+        return None
+
+
 async def delete(id: int, db: AsyncSession) -> bool:
     try:
         stmt = select(MyModel).where(MyModel.id == id)
@@ -57,6 +455,7 @@ async def delete(id: int, db: AsyncSession) -> bool:
         if item:
             await db.delete(item)
             await db.commit()
+            await get_cache().delete(_cache_key(id), CACHE_KEY_BOUNDS)
             return True
         return False
     except Exception:
@@ -65,11 +464,20 @@ async def delete(id: int, db: AsyncSession) -> bool:
         return False
 
 
-async def find_by_id(id: int, db: AsyncSession) -> Optional[MyModel]:
+async def find_by_id(id: int, db: AsyncSession) -> Optional[MyModelSchema]:
     try:
-        stmt = select(MyModel).where(MyModel.id == id)
-        result = await db.execute(stmt)
-        return result.scalar_one_or_none()
+        cached = await get_cache().get(_cache_key(id))
+        if cached is not None:
+            return MyModelSchema.model_validate_json(cached)
+
+        result = await db.execute(SELECT_BY_ID, {"id": id})
+        row = result.one_or_none()
+        if row is None:
+            return None
+
+        schema = MyModelSchema.model_validate(row)
+        await _cache_set(schema)
+        return schema
     except Exception:
         logger.exception("[my model : find by id]")
         return None
@@ -6,7 +6,8 @@ from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from helpers import router
-from helpers.db import Base, get_session
+from helpers.cache import get_cache
+from helpers.db import Base, get_read_session, get_session
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -23,6 +24,15 @@ TestingAsyncSessionLocal = async_sessionmaker(
 )
 
 
+@pytest_asyncio.fixture(autouse=True)
+async def clear_cache():
+    # tables are recreated per test, so cached rows must not leak between tests
+    await get_cache().clear()
+    get_cache().reset_stats()
+    yield
+    await get_cache().clear()
+
+
 @pytest_asyncio.fixture(scope="function")
 async def db():
     async with async_engine.begin() as conn:
@@ -48,6 +58,7 @@ async def app(db) -> FastAPI:
             yield session
 
     app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_session
     return app
 
 
@@ -0,0 +1,205 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers.batch import load_checkpoint, run_batch, scheduled_batch
+from helpers.scheduler import scheduler
+from models.my_model import MyModel
+from tests.conftest import TestingAsyncSessionLocal
+
+
+async def create_rows(db: AsyncSession, count: int):
+    await db.execute(
+        insert(MyModel),
+        [{"field1": f"Test {i}", "field2": False} for i in range(count)],
+    )
+    await db.commit()
+
+
+async def mark(rows, session: AsyncSession):
+    ids = [row.id for row in rows]
+    await session.execute(
+        update(MyModel).where(MyModel.id.in_(ids)).values(field2=True)
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_batch(db: AsyncSession):
+    await create_rows(db, 25)
+
+    stats = await run_batch(
+        "test",
+        select(MyModel.id),
+        MyModel.id,
+        mark,
+        chunk_size=10,
+        sessionmaker=TestingAsyncSessionLocal,
+    )
+
+    assert stats["rows"] == 25
+    assert stats["chunks"] == 3
+    assert stats["rows_per_second"] > 0
+    assert stats["resumed_from"] is None
+    assert await load_checkpoint("test", TestingAsyncSessionLocal) is None
+
+    result = await db.execute(select(MyModel.id).where(MyModel.field2 == False))
+    assert result.all() == []
+
+
+@pytest.mark.asyncio
+async def test_run_batch_resumes_after_failure(db: AsyncSession):
+    await create_rows(db, 30)
+    seen = []
+
+    async def fail_on_third_chunk(rows, session: AsyncSession):
+        if len(seen) == 2:
+            raise RuntimeError("boom")
+        seen.append([row.id for row in rows])
+        await mark(rows, session)
+
+    with pytest.raises(RuntimeError):
+        await run_batch(
+            "test",
+            select(MyModel.id),
+            MyModel.id,
+            fail_on_third_chunk,
+            chunk_size=10,
+            concurrency=1,
+            sessionmaker=TestingAsyncSessionLocal,
+        )
+
+    last_key, rows = await load_checkpoint("test", TestingAsyncSessionLocal)
+    assert last_key == seen[1][-1]
+    assert rows == 20
+
+    stats = await run_batch(
+        "test",
+        select(MyModel.id),
+        MyModel.id,
+        mark,
+        chunk_size=10,
+        sessionmaker=TestingAsyncSessionLocal,
+    )
+    assert stats["resumed_from"] == last_key
+    assert stats["rows"] == 10
+
+    result = await db.execute(select(MyModel.id).where(MyModel.field2 == False))
+    assert result.all() == []
+
+
+@pytest.mark.asyncio
+async def test_run_batch_duplicate_key(db: AsyncSession):
+    # every row gets the same server side created_at
+    await create_rows(db, 25)
+
+    stats = await run_batch(
+        "test",
+        select(MyModel.id),
+        MyModel.created_at,
+        mark,
+        chunk_size=10,
+        sessionmaker=TestingAsyncSessionLocal,
+    )
+
+    assert stats["rows"] == 25
+    result = await db.execute(select(MyModel.id).where(MyModel.field2 == False))
+    assert result.all() == []
+
+
+@pytest.mark.asyncio
+async def test_run_batch_resumes_datetime_key(db: AsyncSession):
+    # three rows per timestamp, the first chunk ends inside a group
+    start = datetime(2024, 1, 1)
+    await db.execute(
+        insert(MyModel),
+        [
+            {
+                "field1": f"Test {i}",
+                "field2": False,
+                "created_at": start + timedelta(i // 3),
+            }
+            for i in range(20)
+        ],
+    )
+    await db.commit()
+    seen = []
+
+    async def fail_on_second_chunk(rows, session: AsyncSession):
+        if seen:
+            raise RuntimeError("boom")
+        seen.append([row.id for row in rows])
+        await mark(rows, session)
+
+    query = select(MyModel.created_at)
+    with pytest.raises(RuntimeError):
+        await run_batch(
+            "test",
+            query,
+            MyModel.created_at,
+            fail_on_second_chunk,
+            chunk_size=10,
+            concurrency=1,
+            sessionmaker=TestingAsyncSessionLocal,
+        )
+
+    last_key, rows = await load_checkpoint(
+        "test", TestingAsyncSessionLocal, MyModel.created_at
+    )
+    assert last_key == (start + timedelta(3), seen[0][-1])
+    assert rows == 10
+
+    stats = await run_batch(
+        "test",
+        query,
+        MyModel.created_at,
+        mark,
+        chunk_size=10,
+        sessionmaker=TestingAsyncSessionLocal,
+    )
+    assert stats["resumed_from"] == last_key
+    assert stats["rows"] == 10
+
+    result = await db.execute(select(MyModel.id).where(MyModel.field2 == False))
+    assert result.all() == []
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounded_concurrency(db: AsyncSession):
+    await create_rows(db, 50)
+    running = 0
+    peak = 0
+
+    async def slow(rows, session: AsyncSession):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    stats = await run_batch(
+        "test",
+        select(MyModel.id),
+        MyModel.id,
+        slow,
+        chunk_size=5,
+        concurrency=3,
+        sessionmaker=TestingAsyncSessionLocal,
+    )
+
+    assert stats["chunks"] == 10
+    assert 1 < peak <= 3
+
+
+def test_scheduled_batch():
+    @scheduled_batch("test_batch", select(MyModel.id), MyModel.id, "cron", hour=1)
+    async def process(rows, session: AsyncSession):
+        pass
+
+    job = scheduler.get_job("test_batch")
+    assert job is not None
+    assert str(job.trigger.fields[5]) == "1"
+
+    scheduler.remove_job("test_batch")
@@ -0,0 +1,174 @@
+import fnmatch
+from unittest.mock import patch
+
+import pytest
+
+from helpers.cache import Cache, MemoryCache, NullCache, SharedCache, create_cache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, px=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+
+class BrokenRedis(FakeRedis):
+    async def mget(self, keys):
+        raise ConnectionError("down")
+
+    async def set(self, key, value, px=None):
+        raise ConnectionError("down")
+
+    async def scan_iter(self, match):
+        raise ConnectionError("down")
+        yield
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_get_set():
+    cache = MemoryCache()
+
+    assert await cache.get("a") is None
+    await cache.set("a", b"1")
+    assert await cache.get("a") == b"1"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["bytes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_ttl():
+    cache = MemoryCache(ttl=10)
+
+    with patch("helpers.cache.time.monotonic", return_value=100):
+        await cache.set("a", b"1")
+
+    with patch("helpers.cache.time.monotonic", return_value=111):
+        assert await cache.get("a") is None
+
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_least_recently_used_by_bytes():
+    cache = MemoryCache(max_bytes=4)
+
+    await cache.set("a", b"11")
+    await cache.set("b", b"22")
+    await cache.get("a")
+    await cache.set("c", b"33")
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") == b"11"
+    assert await cache.get("c") == b"33"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 4
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_evicts_by_entries():
+    cache = MemoryCache(max_entries=2)
+
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    await cache.set("c", b"3")
+
+    assert await cache.get_many(["a", "b", "c"]) == {"b": b"2", "c": b"3"}
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_skips_values_over_cap():
+    cache = MemoryCache(max_bytes=2)
+
+    await cache.set("a", b"123")
+
+    assert await cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_delete_and_clear():
+    cache = MemoryCache()
+
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    await cache.delete("a")
+    assert await cache.get("a") is None
+
+    await cache.clear()
+    assert await cache.get("b") is None
+    assert cache.stats()["bytes"] == 0
+
+
+@pytest.mark.asyncio
+async def test_null_cache():
+    cache = NullCache()
+
+    await cache.set("a", b"1")
+
+    assert await cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_cache():
+    client = FakeRedis()
+    cache = SharedCache(client, prefix="test:")
+
+    await cache.set("a", b"1")
+    await cache.set("b", b"2")
+    assert client.data == {"test:a": b"1", "test:b": b"2"}
+    assert await cache.get_many(["a", "b", "c"]) == {"a": b"1", "b": b"2"}
+
+    await cache.delete("a")
+    assert await cache.get("a") is None
+
+    await cache.clear()
+    assert client.data == {}
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_errors_are_misses():
+    cache = SharedCache(BrokenRedis())
+
+    await cache.set("a", b"1")
+
+    assert await cache.get("a") is None
+    assert cache.stats()["errors"] == 2
+    assert cache.stats()["misses"] == 1
+
+    await cache.clear()
+    assert cache.stats()["errors"] == 3
+
+
+def test_cache_is_abstract():
+    with pytest.raises(TypeError):
+        Cache()
+
+
+def test_create_cache():
+    assert isinstance(create_cache("none"), NullCache)
+    assert isinstance(create_cache("memory"), MemoryCache)
@@ -0,0 +1,264 @@
+import gzip
+import json
+import zlib
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from helpers import compression
+from helpers.compression import (
+    Brotli,
+    CompressionMiddleware,
+    Gzip,
+    Zstd,
+    accepted_encodings,
+    negotiate,
+)
+
+PAYLOAD = [{"id": i, "field1": f"Test {i}", "field2": True} for i in range(100)]
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, min_size=1024)
+
+    @app.get("/list")
+    async def list_items():
+        return PAYLOAD
+
+    @app.get("/small")
+    async def small():
+        return {"message": "ok"}
+
+    @app.get("/image")
+    async def image():
+        return Response(bytes(4096), media_type="image/png")
+
+    @app.get("/tagged")
+    async def tagged():
+        return JSONResponse(PAYLOAD, headers={"etag": '"abc"'})
+
+    @app.get("/not-modified")
+    async def not_modified():
+        return Response(status_code=304, headers={"etag": '"abc"'})
+
+    @app.get("/no-transform")
+    async def no_transform():
+        return PlainTextResponse("x" * 4096, headers={"cache-control": "no-transform"})
+
+    @app.get("/export")
+    async def export():
+        async def rows():
+            for item in PAYLOAD:
+                yield json.dumps(item) + "\n"
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br;q=0.5") == {
+        "gzip": 1.0,
+        "deflate": 1.0,
+        "br": 0.5,
+    }
+    assert accepted_encodings("gzip;q=0, br") == {"gzip": 0.0, "br": 1.0}
+    assert accepted_encodings("gzip;q=x") == {"gzip": 0.0}
+    assert accepted_encodings("") == {}
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate", ["zstd", "br", "gzip"]) == "gzip"
+    assert negotiate("gzip;q=0", ["gzip"]) is None
+    assert negotiate("*", ["gzip"]) == "gzip"
+    assert negotiate("*, gzip;q=0", ["gzip"]) is None
+    assert negotiate("deflate", ["gzip"]) is None
+    assert negotiate("", ["gzip"]) is None
+
+
+def test_negotiate_weights():
+    with patch.dict(compression.CODECS, {"br": Gzip(), "zstd": Gzip()}):
+        # server order breaks ties, client weights win otherwise
+        assert negotiate("gzip, br, zstd", ["zstd", "br", "gzip"]) == "zstd"
+        assert negotiate("gzip, br;q=0.5", ["zstd", "br", "gzip"]) == "gzip"
+        assert negotiate("br", ["zstd", "gzip"]) is None
+
+
+def test_gzip(client: TestClient):
+    response = client.get("/list", headers={"accept-encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(json.dumps(PAYLOAD))
+    assert response.json() == PAYLOAD
+
+
+def test_not_accepted(client: TestClient):
+    response = client.get("/list", headers={"accept-encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == PAYLOAD
+
+
+def test_below_min_size(client: TestClient):
+    response = client.get("/small", headers={"accept-encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == {"message": "ok"}
+
+
+@pytest.mark.parametrize("path", ["/image", "/no-transform", "/not-modified"])
+def test_skipped(client: TestClient, path):
+    response = client.get(path, headers={"accept-encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+def test_head(client: TestClient):
+    response = client.head("/list", headers={"accept-encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+
+
+def test_weakens_etag(client: TestClient):
+    response = client.get("/tagged", headers={"accept-encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+
+
+def test_streaming(client: TestClient):
+    with client.stream(
+        "GET", "/export", headers={"accept-encoding": "gzip"}
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        body = response.read().decode()
+
+    assert [json.loads(line) for line in body.splitlines()] == PAYLOAD
+
+
+@pytest.mark.asyncio
+async def test_streaming_flushes_chunks():
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+        for item in PAYLOAD[:3]:
+            body = (json.dumps(item) + "\n").encode()
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    await CompressionMiddleware(app)(scope, None, send)
+
+    # every row reaches the client on its own and decodes without the rest
+    chunks = [message["body"] for message in messages[1:]]
+    decompressor = zlib.decompressobj(31)
+    for item, chunk in zip(PAYLOAD[:3], chunks):
+        assert json.loads(decompressor.decompress(chunk)) == item
+    assert len(chunks) == 4
+    assert gzip.decompress(b"".join(chunks)).count(b"\n") == 3
+
+
+def test_large_body_in_thread():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, thread_min_size=1)
+
+    @app.get("/list")
+    async def list_items():
+        return PAYLOAD
+
+    with patch("asyncio.to_thread", wraps=compression.asyncio.to_thread) as to_thread:
+        response = TestClient(app).get("/list", headers={"accept-encoding": "gzip"})
+
+    assert response.json() == PAYLOAD
+    assert to_thread.called
+
+
+def test_gzip_level():
+    data = json.dumps(PAYLOAD * 10).encode()
+
+    assert len(Gzip(9).compress(data)) <= len(Gzip(1).compress(data))
+    assert gzip.decompress(Gzip(1).compress(data, 9)) == data
+
+    # level 0 stores the data instead of falling back to the default level
+    assert len(Gzip(9).compress(data, 0)) > len(data)
+
+
+def test_brotli():
+    brotli = pytest.importorskip("brotli")
+    data = json.dumps(PAYLOAD).encode()
+
+    assert brotli.decompress(Brotli().compress(data)) == data
+    assert brotli.decompress(Brotli(11).compress(data, 0)) == data
+
+    # flushed chunks decode on their own, finish ends the stream
+    compressor = Brotli().compressor()
+    decompressor = brotli.Decompressor()
+    for item in PAYLOAD[:3]:
+        line = (json.dumps(item) + "\n").encode()
+        assert decompressor.process(compressor.chunk(line)) == line
+    assert decompressor.process(compressor.finish()) == b""
+    assert decompressor.is_finished()
+
+
+def test_zstd():
+    zstandard = pytest.importorskip("zstandard")
+    data = json.dumps(PAYLOAD).encode()
+
+    assert zstandard.ZstdDecompressor().decompress(Zstd().compress(data)) == data
+    assert zstandard.ZstdDecompressor().decompress(Zstd(19).compress(data, 0)) == data
+
+    # flushed chunks decode on their own, finish ends the frame
+    compressor = Zstd().compressor()
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    for item in PAYLOAD[:3]:
+        line = (json.dumps(item) + "\n").encode()
+        assert decompressor.decompress(compressor.chunk(line)) == line
+    assert decompressor.decompress(compressor.finish()) == b""
+    assert decompressor.eof
+
+
+@pytest.mark.parametrize("encoding", ["br", "zstd"])
+def test_streaming_optional_codecs(client: TestClient, encoding):
+    pytest.importorskip({"br": "brotli", "zstd": "zstandard"}[encoding])
+
+    with client.stream(
+        "GET", "/export", headers={"accept-encoding": encoding}
+    ) as response:
+        assert response.headers["content-encoding"] == encoding
+        body = response.read().decode()
+
+    assert [json.loads(line) for line in body.splitlines()] == PAYLOAD
+
+
+def test_setup():
+    app = FastAPI()
+    with patch.object(compression, "COMPRESSION_ENABLED", False):
+        compression.setup(app)
+    assert app.user_middleware == []
+
+    compression.setup(app)
+    assert app.user_middleware[0].cls is CompressionMiddleware
@@ -1,7 +1,28 @@
+from unittest.mock import patch
+
+import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 from helpers import cors
+from helpers.cors import CORSMiddleware
+
+PREFLIGHT = {
+    "Origin": "http://myhost.com",
+    "Access-Control-Request-Method": "POST",
+    "Access-Control-Request-Headers": "content-type, x-token",
+}
+
+
+def cors_client(**options) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CORSMiddleware, **options)
+
+    @app.get("/")
+    def read_root():
+        return {"Hello": "World"}
+
+    return TestClient(app)
 
 
 def test_no_cors(app: FastAPI, client: TestClient):
@@ -23,4 +44,94 @@ def test_with_cors():
         return {"Hello": "World"}
 
     response = client.get("/", headers={"Origin": "http://myhost.com"})
-    assert response.headers.get("access-control-allow-origin") == "http://myhost.com"
+    assert response.headers.get("access-control-allow-origin") == "*"
+    assert "access-control-allow-credentials" not in response.headers
+
+
+def test_without_origin():
+    response = cors_client().get("/")
+
+    assert "access-control-allow-origin" not in response.headers
+    assert "vary" not in response.headers
+
+
+def test_listed_origins():
+    client = cors_client(
+        allow_origins=["http://myhost.com"],
+        allow_credentials=True,
+        expose_headers=["x-total"],
+    )
+
+    response = client.get("/", headers={"Origin": "http://myhost.com"})
+    assert response.headers["access-control-allow-origin"] == "http://myhost.com"
+    assert response.headers["access-control-allow-credentials"] == "true"
+    assert response.headers["access-control-expose-headers"] == "x-total"
+    assert response.headers["vary"] == "Origin"
+
+    response = client.get("/", headers={"Origin": "http://other.com"})
+    assert response.status_code == 200
+    assert "access-control-allow-origin" not in response.headers
+
+
+def test_credentials_with_any_origin(caplog):
+    middleware = CORSMiddleware(None, allow_origins=["*"], allow_credentials=True)
+
+    assert middleware.simple_headers == []
+    assert "credentials are not allowed" in caplog.text
+
+
+def test_preflight():
+    client = cors_client(allow_origins=["*"])
+
+    response = client.options("/", headers=PREFLIGHT)
+
+    assert response.status_code == 200
+    assert response.text == "OK"
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert response.headers["access-control-allow-headers"] == "content-type, x-token"
+    assert "POST" in response.headers["access-control-allow-methods"]
+    assert response.headers["access-control-max-age"] == "600"
+
+
+@pytest.mark.parametrize(
+    "options, failure",
+    [
+        ({"allow_origins": ["http://other.com"]}, "origin"),
+        ({"allow_methods": ["GET"]}, "method"),
+        ({"allow_headers": ["x-other"]}, "headers"),
+    ],
+)
+def test_preflight_disallowed(options, failure):
+    client = cors_client(**{"allow_origins": ["*"], **options})
+
+    response = client.options("/", headers=PREFLIGHT)
+
+    assert response.status_code == 400
+    assert response.text == f"Disallowed CORS {failure}"
+    assert "access-control-allow-origin" not in response.headers
+
+
+def test_preflight_cache():
+    middleware = CORSMiddleware(None, allow_origins=["*"], cache_size=2)
+
+    first = middleware.preflight(b"http://a.com", b"GET", b"")
+    assert middleware.preflight(b"http://a.com", b"GET", b"") is first
+
+    with patch.object(middleware, "build_preflight", wraps=middleware.build_preflight):
+        middleware.preflight(b"http://a.com", b"GET", b"")
+        middleware.preflight(b"http://b.com", b"GET", b"")
+        middleware.preflight(b"http://c.com", b"GET", b"")
+        assert middleware.build_preflight.call_count == 2
+
+    assert list(middleware.preflights) == [
+        (b"http://b.com", b"GET", b""),
+        (b"http://c.com", b"GET", b""),
+    ]
+
+
+def test_setup_disabled():
+    app = FastAPI()
+    with patch.object(cors, "CORS_ALLOW_ORIGINS", ""):
+        cors.setup(app)
+
+    assert app.user_middleware == []
@@ -0,0 +1,119 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import diagnostics
+from helpers.diagnostics import DiagnosticsMiddleware, QueryLog, Statement
+from models.my_model import MyModel, MyModelRequest
+from services import my_model as service_my_model
+from tests.conftest import TestingAsyncSessionLocal, async_engine
+
+
+@pytest.fixture(autouse=True)
+def instrument():
+    diagnostics.instrument_engine(async_engine)
+
+
+@pytest.mark.asyncio
+async def test_capture(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(3)]
+    created = await service_my_model.bulk_create(items, db)
+
+    with diagnostics.capture() as log:
+        for item in created:
+            await db.execute(select(MyModel).where(MyModel.id == item.id))
+
+    assert log.count == 3
+    assert log.duration > 0
+    assert [statement.parameters for statement in log.statements] == [
+        (item.id,) for item in created
+    ]
+    assert list(log.repeated(3).values()) == [3]
+    assert log.repeated(4) == {}
+
+
+@pytest.mark.asyncio
+async def test_capture_outside_block(db: AsyncSession):
+    with diagnostics.capture() as log:
+        pass
+
+    await db.execute(select(MyModel))
+    assert log.count == 0
+
+
+@pytest.mark.asyncio
+async def test_assert_statements(db: AsyncSession):
+    with diagnostics.assert_statements(1):
+        await db.execute(select(MyModel))
+
+    with pytest.raises(AssertionError, match="expected at most 1 statements"):
+        with diagnostics.assert_statements(1):
+            await db.execute(select(MyModel))
+            await db.execute(select(MyModel.id))
+
+    with pytest.raises(AssertionError, match="repeated statements"):
+        with diagnostics.assert_statements(10, repeat_threshold=2):
+            await db.execute(select(MyModel))
+            await db.execute(select(MyModel))
+
+
+def test_statement_repr_truncates_parameters():
+    statement = Statement("INSERT", [("x" * 1000,)], 0.001)
+
+    assert repr(statement).startswith("[1.00ms] INSERT [('xxx")
+    assert repr(statement).endswith("...")
+    assert len(repr(statement)) < 300
+
+
+def test_reasons():
+    middleware = DiagnosticsMiddleware(
+        None, slow_request=1, slow_query=0.1, max_statements=2, repeat_threshold=2
+    )
+    log = QueryLog()
+    assert middleware.reasons(log, 0.01) == []
+
+    log.statements = [Statement("SELECT 1", (), 0.2), Statement("SELECT 1", (), 0)]
+    log.statements.append(Statement("SELECT 2", (), 0))
+    assert middleware.reasons(log, 2) == [
+        "slow request",
+        "slow query",
+        "too many statements",
+        "repeated statements",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_middleware_reports_repeated_statements(db: AsyncSession, caplog):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(3)]
+    created = await service_my_model.bulk_create(items, db)
+
+    app = FastAPI()
+    app.add_middleware(DiagnosticsMiddleware, repeat_threshold=3)
+
+    @app.get("/one-by-one")
+    async def one_by_one():
+        async with TestingAsyncSessionLocal() as session:
+            for item in created:
+                await session.execute(select(MyModel).where(MyModel.id == item.id))
+
+    @app.get("/all")
+    async def all_rows():
+        async with TestingAsyncSessionLocal() as session:
+            await session.execute(select(MyModel))
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+    with caplog.at_level(logging.WARNING, logger="helpers.diagnostics"):
+        await client.get("/all")
+        assert caplog.records == []
+
+        await client.get("/one-by-one")
+
+    assert len(caplog.records) == 1
+    assert "GET /one-by-one" in caplog.text
+    assert "repeated statements" in caplog.text
+    assert "repeated 3 times: SELECT my_model.id" in caplog.text
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from starlette.requests import Request
+
+from helpers import http_cache
+
+
+def make_request(headers: dict[str, str]) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+def test_parse_routes():
+    routes = http_cache.parse_routes("/api/a=public, max-age=60; /api/b=no-store;")
+    assert routes == {"/api/a": "public, max-age=60", "/api/b": "no-store"}
+
+
+def test_validators():
+    now = datetime(2024, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    first = SimpleNamespace(id=1, updated_at=now)
+    second = SimpleNamespace(id=2, updated_at=now + timedelta(seconds=5))
+
+    etag, last_modified = http_cache.validators([first, second])
+    assert etag.startswith('W/"')
+    assert last_modified == (now + timedelta(seconds=5)).timestamp()
+
+    # any update changes the etag, even within the same second
+    updated = SimpleNamespace(id=1, updated_at=now + timedelta(microseconds=1))
+    assert http_cache.validators([updated, second])[0] != etag
+    assert http_cache.validators([second, first])[0] != etag
+
+    # naive datetimes (sqlite) are read as utc
+    naive = SimpleNamespace(id=1, updated_at=now.replace(tzinfo=None))
+    assert http_cache.validators([naive])[0] == http_cache.validators([first])[0]
+
+
+def test_is_not_modified():
+    etag = 'W/"abc"'
+    last_modified = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+    assert http_cache.is_not_modified(make_request({"if-none-match": etag}), etag)
+    assert http_cache.is_not_modified(make_request({"if-none-match": '"abc"'}), etag)
+    assert http_cache.is_not_modified(make_request({"if-none-match": "*"}), etag)
+    assert not http_cache.is_not_modified(
+        make_request({"if-none-match": '"other"'}), etag
+    )
+    assert not http_cache.is_not_modified(make_request({}), etag, last_modified)
+
+    since = {"if-modified-since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert http_cache.is_not_modified(make_request(since), etag, last_modified)
+    assert not http_cache.is_not_modified(make_request(since), etag, last_modified + 1)
+    assert not http_cache.is_not_modified(
+        make_request({"if-modified-since": "garbage"}), etag, last_modified
+    )
+
+    # If-None-Match takes precedence over If-Modified-Since
+    both = {"if-none-match": '"other"', **since}
+    assert not http_cache.is_not_modified(make_request(both), etag, last_modified)
@@ -0,0 +1,186 @@
+import asyncio
+from contextvars import ContextVar
+
+import pytest
+
+from helpers.ingest import IngestQueue, IngestQueueFull
+
+
+class Recorder:
+    def __init__(self, delay: float = 0):
+        self.batches = []
+        self.delay = delay
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self.delay)
+        return [item * 10 for item in items]
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_batches_concurrent_items():
+    flush = Recorder()
+    queue = IngestQueue(flush, max_batch=100, max_delay=0.01)
+
+    results = await asyncio.gather(*[queue.submit(i) for i in range(10)])
+
+    assert results == [i * 10 for i in range(10)]
+    assert flush.batches == [list(range(10))]
+    assert queue.stats()["batches"] == 1
+    assert queue.stats()["average_batch"] == 10
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_max_batch():
+    flush = Recorder()
+    queue = IngestQueue(flush, max_batch=4, max_delay=0.01)
+
+    results = await asyncio.gather(*[queue.submit(i) for i in range(10)])
+
+    assert results == [i * 10 for i in range(10)]
+    assert [len(batch) for batch in flush.batches] == [4, 4, 2]
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_flushes_after_delay():
+    flush = Recorder()
+    queue = IngestQueue(flush, max_batch=100, max_delay=0.001)
+
+    assert await queue.submit(1) == 10
+    assert await queue.submit(2) == 20
+    assert flush.batches == [[1], [2]]
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_flushes_outside_caller_context():
+    request_id: ContextVar = ContextVar("request_id", default=None)
+    seen = []
+
+    async def flush(items):
+        seen.append(request_id.get())
+        return items
+
+    queue = IngestQueue(flush, max_delay=0)
+
+    request_id.set("first")
+    await queue.submit(1)
+    assert seen == [None]
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_failed_flush():
+    async def fail(items):
+        raise RuntimeError("boom")
+
+    queue = IngestQueue(fail, max_delay=0)
+
+    assert await queue.submit(1) is None
+    assert queue.stats()["failures"] == 1
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_isolates_bad_item():
+    batches = []
+
+    async def flush(items):
+        batches.append(list(items))
+        if -1 in items:
+            raise ValueError("bad row")
+        return [item * 10 for item in items]
+
+    queue = IngestQueue(
+        flush, max_batch=100, max_delay=0.01, split_errors=(ValueError,)
+    )
+
+    results = await asyncio.gather(*[queue.submit(i) for i in [1, 2, -1, 3]])
+
+    assert results == [10, 20, None, 30]
+    assert batches[0] == [1, 2, -1, 3]
+    assert [-1] in batches
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_fails_batch_on_other_errors():
+    batches = []
+
+    async def flush(items):
+        batches.append(list(items))
+        raise ConnectionError("database down")
+
+    queue = IngestQueue(
+        flush, max_batch=100, max_delay=0.01, split_errors=(ValueError,)
+    )
+
+    results = await asyncio.gather(*[queue.submit(i) for i in range(8)])
+
+    # one attempt, not one per split
+    assert results == [None] * 8
+    assert batches == [list(range(8))]
+    assert queue.stats()["failures"] == 1
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_missing_results():
+    async def flush(items):
+        return [item * 10 for item in items][:1]
+
+    queue = IngestQueue(flush, max_batch=100, max_delay=0.01)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*[queue.submit(i) for i in range(3)]), timeout=1
+    )
+
+    assert results == [0, None, None]
+    assert queue.stats()["failures"] == 1
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_backpressure():
+    flush = Recorder(delay=0.05)
+    queue = IngestQueue(
+        flush, max_batch=1, max_delay=0, max_pending=1, put_timeout=0.01
+    )
+
+    # one item is being flushed and one waits in the queue
+    first = asyncio.create_task(queue.submit(1))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(queue.submit(2))
+    await asyncio.sleep(0)
+
+    with pytest.raises(IngestQueueFull):
+        await queue.submit(3)
+
+    assert await first == 10
+    assert await second == 20
+    assert queue.stats()["rejected"] == 1
+
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_ingest_queue_close_flushes_pending():
+    flush = Recorder(delay=0.01)
+    queue = IngestQueue(flush, max_batch=2, max_delay=0)
+
+    tasks = [asyncio.create_task(queue.submit(i)) for i in range(5)]
+    await asyncio.sleep(0)
+    await queue.close()
+
+    assert queue.pending() == 0
+    assert await asyncio.gather(*tasks) == [i * 10 for i in range(5)]
@@ -0,0 +1,159 @@
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from httpx import ASGITransport, AsyncClient
+
+from helpers import instrumentation
+from helpers.instrumentation import MetricsMiddleware, registry, route_name
+from helpers.metrics import Registry
+from tests.conftest import async_engine
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    with (
+        patch.object(registry, "counters", {}),
+        patch.object(registry, "gauges", {}),
+        patch.object(registry, "histograms", {}),
+    ):
+        yield
+
+
+@pytest.fixture
+def metrics_app(app: FastAPI) -> FastAPI:
+    instrumentation.instrument_engine(async_engine)
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+@pytest.fixture
+def metrics_client(metrics_app: FastAPI) -> AsyncClient:
+    return AsyncClient(transport=ASGITransport(app=metrics_app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_middleware_records_requests(metrics_client: AsyncClient):
+    response = await metrics_client.post(
+        "/api/my-model/create", json={"field1": "Test 1", "field2": True}
+    )
+    assert response.status_code == 201
+    listed = await metrics_client.get("/api/my-model/list")
+    assert listed.status_code == 200
+    invalid = await metrics_client.get("/api/my-model/list", params={"limit": 0})
+    assert invalid.status_code == 422
+
+    labels = (("method", "GET"), ("route", "/api/my-model/list"))
+    assert registry.counters[("http_requests_total", labels + (("status", "200"),))]
+    assert registry.counters[("http_requests_total", labels + (("status", "422"),))]
+    assert registry.histograms[("http_request_duration_seconds", labels)].count == 2
+
+    size = registry.histograms[("http_response_size_bytes", labels)]
+    assert size.sum == len(listed.content) + len(invalid.content)
+
+    # only the request that reached the database spent time there
+    create = (("method", "POST"), ("route", "/api/my-model/create"))
+    assert registry.histograms[("http_request_db_seconds", create)].sum > 0
+    assert registry.counters[("http_request_db_queries_total", create)] >= 1
+    assert registry.histograms[("db_query_duration_seconds", ())].count >= 1
+    assert registry.gauges[("http_requests_in_progress", ())] == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_unmatched_route(metrics_client: AsyncClient):
+    response = await metrics_client.get("/missing/123")
+    assert response.status_code == 404
+
+    labels = (("method", "GET"), ("route", "other"), ("status", "404"))
+    assert registry.counters[("http_requests_total", labels)] == 1
+
+
+@pytest.mark.asyncio
+async def test_middleware_catch_all_mount():
+    # app.mount("/") for static files leaves the mount with an empty path
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.mount("/", PlainTextResponse("static"), name="public")
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/index.html")
+    assert response.status_code == 200
+
+    labels = (("method", "GET"), ("route", "other"), ("status", "200"))
+    assert registry.counters[("http_requests_total", labels)] == 1
+
+
+def test_route_name():
+    app = FastAPI()
+    app.mount("/", PlainTextResponse("static"))
+    app.mount("/assets", PlainTextResponse("assets"))
+    catch_all, assets = app.routes[-2:]
+
+    assert route_name({"route": catch_all}) == "other"
+    assert route_name({"route": assets}) == "/assets"
+    assert route_name({}) == "other"
+
+
+def test_collect_merges_workers(tmp_path):
+    other = Registry()
+    other.types, other.buckets = registry.types, registry.buckets
+    other.inc("http_requests_total", (("method", "GET"),), 2)
+    other.add("http_requests_in_progress", (), 3)
+
+    exited = Registry()
+    exited.inc("http_requests_total", (("method", "GET"),), 5)
+    exited.add("http_requests_in_progress", (), 7)
+
+    # the parent process stands in for a live worker, a huge pid for one
+    # that has exited
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(other.snapshot()))
+    (tmp_path / "999999999.json").write_text(json.dumps(exited.snapshot()))
+    (tmp_path / "garbage.json").write_text("{")
+
+    registry.inc("http_requests_total", (("method", "GET"),))
+
+    with patch.object(instrumentation, "METRICS_DIR", str(tmp_path)):
+        instrumentation.write_snapshot()
+        merged = instrumentation.collect()
+
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+    assert merged.counters[("http_requests_total", (("method", "GET"),))] == 8
+    assert merged.gauges[("http_requests_in_progress", ())] == 3
+
+    # the exited worker is folded into the retired snapshot, once
+    assert not (tmp_path / "999999999.json").exists()
+    assert (tmp_path / instrumentation.RETIRED_SNAPSHOT).exists()
+
+    with patch.object(instrumentation, "METRICS_DIR", str(tmp_path)):
+        merged = instrumentation.collect()
+
+    assert merged.counters[("http_requests_total", (("method", "GET"),))] == 8
+
+
+def test_retired_snapshots_accumulate(tmp_path):
+    for pid in (999999998, 999999999):
+        exited = Registry()
+        exited.inc("http_requests_total", (("method", "GET"),), 5)
+        (tmp_path / f"{pid}.json").write_text(json.dumps(exited.snapshot()))
+
+    with patch.object(instrumentation, "METRICS_DIR", str(tmp_path)):
+        merged = instrumentation.collect()
+
+    assert merged.counters[("http_requests_total", (("method", "GET"),))] == 10
+    assert sorted(os.listdir(tmp_path)) == [
+        instrumentation.RETIRED_SNAPSHOT,
+        "retired.lock",
+    ]
+
+
+def test_clear_snapshots(tmp_path):
+    for filename in ("123.json", "123.json.tmp", "retired.json", "keep.txt"):
+        (tmp_path / filename).write_text("{}")
+
+    instrumentation.clear_snapshots(str(tmp_path))
+
+    assert os.listdir(tmp_path) == ["keep.txt"]
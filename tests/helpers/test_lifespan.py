@@ -1,20 +1,117 @@
-from unittest.mock import patch
+import asyncio
+import os
+from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi import FastAPI
 
+from helpers import instrumentation, migrate
 from helpers.lifespan import lifespan
-from helpers.scheduler import scheduler
+from helpers.profiler import loop_lag_monitor
+from helpers.scheduler import SchedulerLock, scheduler, scheduler_leader, scheduler_lock
+
+
+@pytest.fixture(autouse=True)
+def mock_upgrade():
+    with patch.object(migrate, "upgrade", new_callable=AsyncMock) as mock_upgrade:
+        yield mock_upgrade
 
 
 @pytest.mark.asyncio
+@patch.object(scheduler_leader, "release", new_callable=AsyncMock)
+@patch.object(scheduler_leader, "run", new_callable=AsyncMock)
 @patch.object(scheduler, "shutdown")
 @patch.object(scheduler, "start")
-async def test_lifespan(mock_start, mock_shutdown):
-    # verify lifespan starts and stops scheduler
+async def test_lifespan(
+    mock_start, mock_shutdown, mock_run, mock_release, mock_upgrade
+):
+    # verify lifespan migrates the database, then starts and stops scheduler
     app = FastAPI()
 
     async with lifespan(app):
-        mock_start.assert_called_once()
+        await asyncio.sleep(0)
+        mock_upgrade.assert_called_once()
+        mock_start.assert_called_once_with(paused=True)
+        assert scheduler.get_job("create_my_model") is not None
 
+    mock_run.assert_called_once_with(scheduler)
+    mock_release.assert_called_once()
     mock_shutdown.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch.object(scheduler_leader, "run", new_callable=AsyncMock)
+@patch.object(scheduler, "shutdown")
+@patch.object(scheduler, "start")
+async def test_lifespan_other_worker_runs_jobs(
+    mock_start, mock_shutdown, mock_run, tmp_path
+):
+    # verify only the worker holding the lock starts the scheduler
+    other_worker = SchedulerLock(str(tmp_path / "scheduler.lock"))
+    assert other_worker.acquire()
+
+    app = FastAPI()
+
+    with patch.object(scheduler_lock, "path", other_worker.path):
+        async with lifespan(app):
+            await asyncio.sleep(0)
+            mock_start.assert_not_called()
+
+    mock_run.assert_not_called()
+    mock_shutdown.assert_not_called()
+    other_worker.release()
+
+
+@pytest.mark.asyncio
+@patch.object(scheduler_leader, "release", new_callable=AsyncMock)
+@patch.object(scheduler_leader, "run", new_callable=AsyncMock)
+@patch.object(scheduler_leader, "ttl", 0.03)
+@patch.object(scheduler, "shutdown")
+@patch.object(scheduler, "start")
+async def test_lifespan_takes_over_scheduler(
+    mock_start, mock_shutdown, mock_run, mock_release, tmp_path
+):
+    # verify a waiting worker runs the jobs once the lock holder exits
+    other_worker = SchedulerLock(str(tmp_path / "scheduler.lock"))
+    assert other_worker.acquire()
+
+    app = FastAPI()
+
+    with patch.object(scheduler_lock, "path", other_worker.path):
+        async with lifespan(app):
+            await asyncio.sleep(0.02)
+            mock_start.assert_not_called()
+
+            other_worker.release()
+            await asyncio.sleep(0.05)
+            mock_start.assert_called_once_with(paused=True)
+
+    mock_run.assert_called_once_with(scheduler)
+    mock_release.assert_called_once()
+    mock_shutdown.assert_called_once()
+    assert not scheduler_lock.held
+
+
+@pytest.mark.asyncio
+@patch("helpers.lifespan.SCHEDULER_ENABLED", False)
+async def test_lifespan_writes_metrics_snapshot(tmp_path):
+    # verify each worker publishes its metrics for the others to merge
+    app = FastAPI()
+
+    with patch.object(instrumentation, "METRICS_DIR", str(tmp_path)):
+        async with lifespan(app):
+            pass
+
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+@pytest.mark.asyncio
+@patch("helpers.lifespan.SCHEDULER_ENABLED", False)
+async def test_lifespan_loop_lag_monitor():
+    # verify the event loop is watched while the app is running
+    app = FastAPI()
+
+    async with lifespan(app):
+        assert loop_lag_monitor.stats()["running"] is True
+
+    assert loop_lag_monitor.stats()["running"] is False
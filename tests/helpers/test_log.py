@@ -8,3 +8,6 @@ def test_log_setup():
     with patch("logging.basicConfig") as mock_basicConfig:
         log.setup()
         mock_basicConfig.assert_called_once_with(level=logging.ERROR)
+
+    for name in log.REPORT_LOGGERS:
+        assert logging.getLogger(name).level == logging.WARNING
@@ -0,0 +1,73 @@
+import json
+
+from helpers.metrics import Histogram, Registry
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.1": 2, "1.0": 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == 2.65
+
+
+def test_registry_render():
+    registry = Registry()
+    registry.counter("requests_total", "Requests")
+    registry.gauge("in_progress", "In progress")
+    registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    registry.inc("requests_total", (("route", "/a"), ("status", "200")))
+    registry.inc("requests_total", (("route", '/"b"'), ("status", "500")), 2)
+    registry.add("in_progress")
+    registry.observe("latency_seconds", (("route", "/a"),), 0.5)
+
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/\\"b\\"",status="500"} 2\n'
+        'requests_total{route="/a",status="200"} 1\n'
+        "# HELP in_progress In progress\n"
+        "# TYPE in_progress gauge\n"
+        "in_progress 1\n"
+        "# HELP latency_seconds Latency\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{route="/a",le="0.1"} 0\n'
+        'latency_seconds_bucket{route="/a",le="1.0"} 1\n'
+        'latency_seconds_bucket{route="/a",le="+Inf"} 1\n'
+        'latency_seconds_sum{route="/a"} 0.5\n'
+        'latency_seconds_count{route="/a"} 1\n'
+    )
+
+
+def test_registry_merge():
+    worker1 = Registry()
+    worker1.counter("requests_total", "Requests")
+    worker1.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    worker2 = Registry()
+    worker2.types, worker2.buckets = worker1.types, worker1.buckets
+
+    worker1.inc("requests_total", (("route", "/a"),))
+    worker1.observe("latency_seconds", (), 0.05)
+    worker2.inc("requests_total", (("route", "/a"),), 2)
+    worker2.inc("requests_total", (("route", "/b"),))
+    worker2.observe("latency_seconds", (), 0.5)
+
+    # snapshots go through json between workers
+    snapshots = [json.loads(json.dumps(w.snapshot())) for w in (worker1, worker2)]
+    merged = worker1.merge(snapshots)
+
+    assert merged.counters == {
+        ("requests_total", (("route", "/a"),)): 3,
+        ("requests_total", (("route", "/b"),)): 1,
+    }
+    histogram = merged.histograms[("latency_seconds", ())]
+    assert histogram.counts == [1, 1, 0]
+    assert histogram.count == 2
+    assert histogram.sum == 0.55
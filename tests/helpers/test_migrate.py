@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import models.batch  # noqa: F401
+import models.scheduler  # noqa: F401
+from helpers import migrate
+from helpers.db import Base
+from models.my_model import MyModel
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    yield engine
+    await engine.dispose()
+
+
+def schema(conn):
+    inspector = inspect(conn)
+    return {
+        table: sorted(index["name"] for index in inspector.get_indexes(table))
+        for table in inspector.get_table_names()
+        if table != "schema_version"
+    }
+
+
+@pytest.mark.asyncio
+async def test_upgrade(engine):
+    versions = [version for version, _ in migrate.discover()]
+    assert versions == sorted(versions)
+
+    assert await migrate.upgrade(engine) == versions
+    assert await migrate.upgrade(engine) == []
+
+    async with engine.connect() as conn:
+        assert await migrate.applied(conn) == set(versions)
+        assert "ix_my_model_field2_id" in (await conn.run_sync(schema))["my_model"]
+
+
+@pytest.mark.asyncio
+async def test_upgrade_matches_models(engine, tmp_path):
+    # the migrations must build the same schema the models declare
+    await migrate.upgrade(engine)
+    async with engine.connect() as conn:
+        migrated = await conn.run_sync(schema)
+
+    models = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'models.db'}")
+    async with models.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        declared = await conn.run_sync(schema)
+    await models.dispose()
+
+    assert migrated == declared
+
+
+@pytest.mark.asyncio
+async def test_upgrade_existing_database(engine):
+    # databases created before migrations already have the base table
+    async with engine.begin() as conn:
+        await conn.run_sync(MyModel.__table__.create)
+
+    assert len(await migrate.upgrade(engine)) == len(migrate.discover())
+
+
+@pytest.mark.asyncio
+async def test_upgrade_concurrent_workers(engine):
+    results = await asyncio.gather(migrate.upgrade(engine), migrate.upgrade(engine))
+
+    applied = sorted(results[0] + results[1])
+    assert applied == [version for version, _ in migrate.discover()]
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from helpers import profiler
+from helpers.profiler import LoopLagMonitor
+
+
+def busy_work(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sample():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_work, args=(stop,), name="busy")
+    worker.start()
+    try:
+        stacks = profiler.sample(0.05, interval=0.001)
+    finally:
+        stop.set()
+        worker.join()
+
+    busy = [stack for stack in stacks if stack.startswith("busy;")]
+    assert busy
+    assert any("busy_work (test_profiler.py:" in stack for stack in busy)
+    # the sampler leaves its own thread out
+    assert not any("sample (profiler.py:" in stack for stack in stacks)
+
+
+def idle_loop(loop_factory, stop: threading.Event):
+    async def wait():
+        # the loop sleeps until the executor thread sees stop
+        await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(wait())
+
+
+@pytest.mark.parametrize("loop", ["asyncio", "uvloop"])
+def test_sample_skips_idle_loops(loop):
+    if loop == "uvloop":
+        loop_factory = pytest.importorskip("uvloop").new_event_loop
+    else:
+        loop_factory = asyncio.new_event_loop
+
+    stop = threading.Event()
+    worker = threading.Thread(target=idle_loop, args=(loop_factory, stop), name="idle")
+    worker.start()
+    try:
+        time.sleep(0.01)
+        idle = profiler.sample(0.05, interval=0.001)
+        everything = profiler.sample(0.02, interval=0.001, include_idle=True)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert not any(stack.startswith("idle;") for stack in idle)
+    assert any(stack.startswith("idle;") for stack in everything)
+
+
+def test_folded():
+    stacks = Counter({"main;a (x.py:1);b (x.py:5)": 3, "main;a (x.py:1)": 7})
+
+    assert profiler.folded(stacks) == (
+        "main;a (x.py:1) 7\nmain;a (x.py:1);b (x.py:5) 3\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_profile_one_at_a_time():
+    first = asyncio.create_task(profiler.profile(0.05, interval=0.01))
+    await asyncio.sleep(0)
+
+    assert await profiler.profile(0.01) is None
+    assert isinstance(await first, str)
+
+
+def block_loop(seconds: float):
+    time.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor():
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        assert monitor.total_incidents == 0
+
+        block_loop(0.2)
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["running"] is False
+    assert stats["total_incidents"] == 1
+    assert stats["max_lag"] >= 0.15
+
+    # the watchdog caught the loop while it was blocked
+    incident = stats["incidents"][0]
+    assert incident["lag"] >= 0.15
+    assert incident["stack"][-1].startswith("block_loop (test_profiler.py:")
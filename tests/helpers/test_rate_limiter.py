@@ -0,0 +1,382 @@
+import asyncio
+import errno
+import fcntl
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from helpers import rate_limiter
+from helpers.rate_limiter import (
+    GCRALimiter,
+    MmapStore,
+    Rate,
+    RateLimitMiddleware,
+    RedisStore,
+    SharedLimiter,
+    create_limiter_factory,
+    gcra_take,
+    parse_rate,
+    parse_routes,
+)
+
+SECOND = 1_000_000_000
+
+
+def limited_client(**kwargs) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, **kwargs)
+
+    @app.get("/")
+    def read_root():
+        return {"Hello": "World"}
+
+    @app.get("/api/slow")
+    def read_slow():
+        return {"Hello": "Slow"}
+
+    return TestClient(app)
+
+
+def test_parse_rate():
+    rate = parse_rate("10/minute")
+
+    assert rate.limit == 10
+    assert rate.period == 60
+    assert rate.emission_interval == 6 * SECOND
+
+
+def test_parse_rate_invalid():
+    with pytest.raises(ValueError):
+        parse_rate("10/fortnight")
+
+    with pytest.raises(ValueError):
+        parse_rate("0/second")
+
+
+def test_parse_routes():
+    routes = parse_routes("/api/a=1/second; /api/b=2/minute")
+
+    assert set(routes) == {"/api/a", "/api/b"}
+    assert routes["/api/b"].limit == 2
+
+
+def test_gcra_burst_then_steady_rate():
+    limiter = GCRALimiter(Rate(5, 1))
+
+    now = 100 * SECOND
+    assert [limiter.hit("a", now) for _ in range(5)] == [0.0] * 5
+    assert limiter.hit("a", now) == pytest.approx(0.2)
+    assert limiter.hit("a", now + SECOND // 5) == 0.0
+    assert limiter.hit("a", now + SECOND // 5) > 0
+
+    # other keys are independent
+    assert limiter.hit("b", now) == 0.0
+
+
+def test_gcra_expires_idle_keys():
+    limiter = GCRALimiter(Rate(5, 1))
+
+    limiter.hit("a", 100 * SECOND)
+    limiter.hit("b", 100 * SECOND)
+    assert len(limiter) == 2
+
+    limiter.hit("c", 101 * SECOND)
+    assert len(limiter) == 1
+    assert limiter.evictions == 0
+
+
+def test_gcra_bounded_keys():
+    limiter = GCRALimiter(Rate(5, 1), max_keys=2)
+
+    for key in ("a", "b", "c"):
+        limiter.hit(key, 100 * SECOND)
+
+    assert len(limiter) == 2
+    assert limiter.evictions == 1
+
+
+def test_middleware_rejects_over_limit():
+    client = limited_client(rate=Rate(2, 60))
+
+    assert client.get("/").status_code == 200
+    assert client.get("/").status_code == 200
+
+    response = client.get("/")
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Too Many Requests"}
+    assert response.headers["retry-after"] == "30"
+
+
+def test_middleware_route_limits():
+    client = limited_client(rate=Rate(100, 1), routes={"/api/slow": Rate(1, 60)})
+
+    assert client.get("/api/slow").status_code == 200
+    assert client.get("/api/slow").status_code == 429
+    assert client.get("/").status_code == 200
+
+
+def test_middleware_total_limit():
+    client = limited_client(total=Rate(1, 60))
+
+    assert client.get("/").status_code == 200
+    assert client.get("/api/slow").status_code == 429
+
+
+def test_middleware_no_limits():
+    client = limited_client()
+
+    for _ in range(10):
+        assert client.get("/").status_code == 200
+
+
+def test_client_ip_forwarded_by_trusted_proxy():
+    middleware = RateLimitMiddleware(None, trusted_proxies="10.0.0.0/8")
+
+    scope = {
+        "client": ("10.0.0.2", 1234),
+        "headers": [(b"x-forwarded-for", b"6.6.6.6, 1.2.3.4, 10.0.0.3")],
+    }
+    assert middleware.client_ip(scope) == "1.2.3.4"
+
+
+def test_client_ip_ignores_untrusted_forwarded_for():
+    middleware = RateLimitMiddleware(None, trusted_proxies="10.0.0.0/8")
+
+    scope = {
+        "client": ("1.2.3.4", 1234),
+        "headers": [(b"x-forwarded-for", b"6.6.6.6")],
+    }
+    assert middleware.client_ip(scope) == "1.2.3.4"
+
+
+def test_client_ip_without_forwarded_for():
+    middleware = RateLimitMiddleware(None, trusted_proxies="10.0.0.0/8")
+
+    scope = {"client": ("10.0.0.2", 1234), "headers": []}
+    assert middleware.client_ip(scope) == "10.0.0.2"
+
+
+def test_is_trusted_cached():
+    middleware = RateLimitMiddleware(None, trusted_proxies="10.0.0.0/8")
+
+    assert middleware.is_trusted("10.0.0.2")
+    assert not middleware.is_trusted("1.2.3.4")
+    assert not middleware.is_trusted("not an address")
+    assert middleware.trusted == {
+        "10.0.0.2": True,
+        "1.2.3.4": False,
+        "not an address": False,
+    }
+
+    with patch.object(rate_limiter, "TRUSTED_CACHE_SIZE", 3):
+        middleware.is_trusted("10.0.0.3")
+    assert middleware.trusted == {"10.0.0.3": True}
+
+
+def test_setup():
+    app = FastAPI()
+    rate_limiter.setup(app)
+
+    assert app.user_middleware[0].cls is RateLimitMiddleware
+
+
+class FakeStore:
+    def __init__(self):
+        self.limiter_tat = {}
+        self.calls = 0
+
+    async def take(self, key, rate, tokens, now):
+        self.calls += 1
+        granted, tat, wait = gcra_take(
+            self.limiter_tat.get(key, now), now, rate, tokens
+        )
+        if granted:
+            self.limiter_tat[key] = tat
+        return granted, wait
+
+
+class FakeRedis:
+    # stand-in for the redis script: same gcra, in microseconds
+    def __init__(self):
+        self.data = {}
+        self.now = 100_000_000
+
+    def register_script(self, script):
+        async def run(keys, args):
+            interval, tolerance, tokens = args
+            rate = Rate(tolerance // interval + 1, 1)
+            rate.emission_interval = interval
+            rate.tolerance = tolerance
+            granted, tat, wait = gcra_take(
+                self.data.get(keys[0], self.now), self.now, rate, tokens
+            )
+            if granted:
+                self.data[keys[0]] = tat
+            return [granted, wait]
+
+        return run
+
+
+class BrokenStore:
+    async def take(self, key, rate, tokens, now):
+        raise ConnectionError("down")
+
+
+def test_gcra_take():
+    rate = Rate(5, 1)
+    now = 100 * SECOND
+
+    assert gcra_take(now, now, rate, 3) == (3, now + 3 * SECOND // 5, 0)
+    assert gcra_take(now + 3 * SECOND // 5, now, rate, 3) == (2, now + SECOND, 0)
+    assert gcra_take(now + SECOND, now, rate, 1) == (0, now + SECOND, SECOND // 5)
+
+
+def test_gcra_take_resets_stale_state():
+    rate = Rate(5, 1)
+    now = 100 * SECOND
+
+    assert gcra_take(now + 3600 * SECOND, now, rate, 1)[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_mmap_store_shared_between_workers(tmp_path):
+    path = str(tmp_path / "rate-limit")
+    worker1 = MmapStore(path, slots=64)
+    worker2 = MmapStore(path, slots=64)
+    rate = Rate(3, 60)
+    now = 100 * SECOND
+
+    assert await worker1.take("a", rate, 1, now) == (1, 0)
+    assert await worker2.take("a", rate, 1, now) == (1, 0)
+    assert await worker1.take("a", rate, 1, now) == (1, 0)
+
+    granted, wait = await worker2.take("a", rate, 1, now)
+    assert granted == 0
+    assert wait == 20 * SECOND
+
+    # other keys are independent
+    assert await worker2.take("b", rate, 1, now) == (1, 0)
+
+    worker1.close()
+    worker2.close()
+
+
+@pytest.mark.asyncio
+async def test_mmap_store_reuses_slots(tmp_path):
+    store = MmapStore(str(tmp_path / "rate-limit"), slots=MmapStore.PROBES)
+    rate = Rate(1, 1)
+    now = 100 * SECOND
+
+    for i in range(MmapStore.PROBES * 3):
+        assert (await store.take(f"key-{i}", rate, 1, now))[0] == 1
+
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_mmap_store_lock_does_not_block_loop(tmp_path):
+    store = MmapStore(str(tmp_path / "rate-limit"), slots=64)
+    lockf = fcntl.lockf
+    attempts = 0
+    ticks = 0
+
+    def busy_then_free(fd, cmd, *args):
+        # another worker holds the window for the first attempts
+        nonlocal attempts
+        if cmd & fcntl.LOCK_NB:
+            attempts += 1
+            if attempts < 3:
+                raise OSError(errno.EAGAIN, "busy")
+        return lockf(fd, cmd, *args)
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    ticker = asyncio.create_task(tick())
+    with patch("fcntl.lockf", side_effect=busy_then_free):
+        assert await store.take("a", Rate(1, 1), 1, 100 * SECOND) == (1, 0)
+    ticker.cancel()
+
+    assert attempts == 3
+    assert ticks > 0
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_limiter_batches_store_calls():
+    store = FakeStore()
+    limiter = SharedLimiter(store, Rate(10, 1), "default", batch=5)
+    now = 100 * SECOND
+
+    for _ in range(10):
+        assert await limiter.acquire("a", now) == 0.0
+
+    assert store.calls == 2
+    assert await limiter.acquire("a", now) > 0
+
+
+@pytest.mark.asyncio
+async def test_shared_limiter_lease_expires():
+    store = FakeStore()
+    limiter = SharedLimiter(store, Rate(10, 1), "default", batch=5)
+    now = 100 * SECOND
+
+    assert await limiter.acquire("a", now) == 0.0
+    assert await limiter.acquire("a", now + 2 * SECOND) == 0.0
+
+    assert store.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_limiter_fails_open():
+    limiter = SharedLimiter(BrokenStore(), Rate(1, 60), "default")
+
+    assert await limiter.acquire("a") == 0.0
+    assert limiter.errors == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_store():
+    store = RedisStore(FakeRedis())
+    rate = Rate(2, 1)
+
+    assert await store.take("a", rate, 5, 0) == (2, 0)
+
+    granted, wait = await store.take("a", rate, 1, 0)
+    assert granted == 0
+    assert wait == SECOND // 2
+
+
+def test_middleware_shared_backend(tmp_path):
+    store = MmapStore(str(tmp_path / "rate-limit"), slots=64)
+
+    def factory(rate, name):
+        # no local reservations, every request goes to the shared store
+        return SharedLimiter(store, rate, name, batch=1)
+
+    worker1 = limited_client(rate=Rate(2, 60), limiter_factory=factory)
+    worker2 = limited_client(rate=Rate(2, 60), limiter_factory=factory)
+
+    assert worker1.get("/").status_code == 200
+    assert worker2.get("/").status_code == 200
+    assert worker1.get("/").status_code == 429
+    assert worker2.get("/").status_code == 429
+
+    store.close()
+
+
+def test_create_limiter_factory(tmp_path):
+    assert isinstance(create_limiter_factory("memory")(Rate(1, 1), "a"), GCRALimiter)
+
+    with patch("helpers.rate_limiter.RATE_LIMIT_MMAP_PATH", str(tmp_path / "rl")):
+        limiter = create_limiter_factory("mmap")(Rate(1, 1), "a")
+    assert isinstance(limiter, SharedLimiter)
+    assert isinstance(limiter.store, MmapStore)
+
+    with pytest.raises(ValueError):
+        create_limiter_factory("carrier-pigeon")
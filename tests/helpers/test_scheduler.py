@@ -1,6 +1,21 @@
-from unittest.mock import patch
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 
-from helpers.scheduler import scheduler
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from helpers.scheduler import (
+    ClusterExecutor,
+    SchedulerLeader,
+    SchedulerLock,
+    scheduler,
+)
+from models.scheduler import SchedulerJob, SchedulerLease
 
 
 @patch.object(scheduler, "start")
@@ -43,3 +58,178 @@ def test_scheduler_can_add_job():
 
     # verify job was removed
     assert scheduler.get_job("test_job") is None
+
+
+def test_scheduler_lock(tmp_path):
+    # verify only one worker can hold the scheduler lock at a time
+    path = str(tmp_path / "scheduler.lock")
+    worker1 = SchedulerLock(path)
+    worker2 = SchedulerLock(path)
+
+    assert worker1.acquire()
+    assert worker1.acquire()
+    assert not worker2.acquire()
+
+    worker1.release()
+    assert worker2.acquire()
+
+    worker2.release()
+    worker2.release()
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    yield engine
+    await engine.dispose()
+
+
+def make_job(id: str, next_run_time=None):
+    return SimpleNamespace(id=id, next_run_time=next_run_time)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_leader_lease(engine):
+    # verify only one worker holds the lease until it is released or expires
+    worker1 = SchedulerLeader(engine, ttl=30)
+    worker2 = SchedulerLeader(engine, ttl=30)
+
+    assert await worker1.acquire()
+    assert await worker1.acquire()
+    assert not await worker2.acquire()
+
+    await worker1.release()
+    assert await worker2.acquire()
+    assert not await worker1.acquire()
+
+    async with engine.begin() as conn:
+        await conn.execute(update(SchedulerLease).values(expires_at=time.time() - 1))
+
+    assert await worker1.acquire()
+    assert not await worker2.acquire()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_leader_claim_once(engine):
+    # verify each fire time is claimed by a single worker
+    worker1 = SchedulerLeader(engine)
+    worker2 = SchedulerLeader(engine)
+    run_time = datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)
+    job = make_job("job", run_time + timedelta(days=1))
+
+    assert await worker1.claim(job, run_time)
+    assert not await worker2.claim(job, run_time)
+    assert not await worker1.claim(job, run_time)
+    assert await worker2.claim(job, run_time + timedelta(days=1))
+
+
+@pytest.mark.asyncio
+async def test_scheduler_leader_step(engine):
+    # verify the scheduler is resumed on election and paused when the lease is lost
+    worker1 = SchedulerLeader(engine, ttl=30)
+    worker2 = SchedulerLeader(engine, ttl=30)
+    scheduler1 = MagicMock()
+    scheduler1.get_jobs.return_value = []
+    scheduler2 = MagicMock()
+    scheduler2.get_jobs.return_value = []
+
+    assert await worker1.step(scheduler1)
+    scheduler1.resume.assert_called_once()
+
+    assert not await worker2.step(scheduler2)
+    scheduler2.resume.assert_not_called()
+
+    async with engine.begin() as conn:
+        await conn.execute(update(SchedulerLease).values(expires_at=time.time() - 1))
+
+    assert await worker2.step(scheduler2)
+    scheduler2.resume.assert_called_once()
+
+    assert not await worker1.step(scheduler1)
+    scheduler1.pause.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_leader_restores_missed_run(engine):
+    # verify a run missed while no worker was leading is rescheduled
+    leader = SchedulerLeader(engine)
+    missed = datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)
+    upcoming = missed + timedelta(days=3)
+
+    await leader.ensure_tables()
+    async with engine.begin() as conn:
+        await conn.execute(
+            insert(SchedulerJob).values(
+                id="job", next_run_time=missed.timestamp(), runs=1
+            )
+        )
+
+    job = MagicMock(id="job", next_run_time=upcoming)
+    new_job = MagicMock(id="new", next_run_time=upcoming)
+    scheduler = MagicMock()
+    scheduler.get_jobs.return_value = [job, new_job]
+
+    await leader.restore(scheduler)
+
+    job.modify.assert_called_once_with(next_run_time=missed)
+    new_job.modify.assert_not_called()
+
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            select(SchedulerJob.next_run_time).where(SchedulerJob.id == "new")
+        )
+        assert result.scalar_one() == upcoming.timestamp()
+
+
+@pytest.mark.asyncio
+async def test_cluster_executor_runs_claimed_jobs(engine):
+    # verify a fire time runs once across executors and its timing is recorded
+    calls = []
+
+    async def job_func():
+        calls.append(1)
+        return "done"
+
+    run_time = datetime.now(timezone.utc)
+    job = MagicMock(
+        id="job",
+        func=job_func,
+        args=(),
+        kwargs={},
+        misfire_grace_time=60,
+        next_run_time=None,
+        _jobstore_alias="default",
+    )
+
+    executor1 = ClusterExecutor(SchedulerLeader(engine))
+    executor2 = ClusterExecutor(SchedulerLeader(engine))
+    executor1._logger = executor2._logger = logging.getLogger(__name__)
+
+    events = await executor1._run(job, [run_time])
+    assert [event.retval for event in events] == ["done"]
+
+    events = await executor2._run(job, [run_time])
+    assert events == []
+    assert calls == [1]
+
+    stats = executor1.stats()["job"]
+    assert stats["runs"] == 1
+    assert stats["failures"] == 0
+    assert stats["duration"]["count"] == 1
+    assert stats["last_duration"] is not None
+    assert executor2.stats()["job"]["skipped"] == 1
+
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            select(SchedulerJob.runs, SchedulerJob.last_duration)
+        )
+        runs, last_duration = result.one()
+        assert runs == 1
+        assert last_duration is not None
+
+
+def test_scheduler_job_defaults():
+    # verify misfire and coalesce policies apply to every job
+    assert scheduler._job_defaults["coalesce"] is True
+    assert scheduler._job_defaults["misfire_grace_time"] == 3600
+    assert scheduler._job_defaults["max_instances"] == 1
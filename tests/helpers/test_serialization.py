@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers.serialization import as_dicts, dump_json, json_response
+from models.my_model import MyModelListResponse, MyModelResponse, MyModelSchema
+
+
+class Item(BaseModel):
+    name: str
+    tags: list[str] = []
+
+
+class Wrapper(BaseModel):
+    item: Optional[Item] = None
+    items: list[Item] = []
+    count: int | None = None
+
+
+def test_dump_json_matches_model():
+    created_at = datetime(2024, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+    schema = MyModelSchema(
+        id=1,
+        field1='Ünïcode "quoted"',
+        field2=True,
+        created_at=created_at,
+        updated_at=created_at.replace(tzinfo=None),
+    )
+
+    for model, data in (
+        (MyModelResponse, {"message": "random", "model": schema}),
+        (MyModelResponse, {"message": "not-found", "model": None}),
+        (
+            MyModelListResponse,
+            {"message": "list", "models": [schema], "next_cursor": "abc"},
+        ),
+    ):
+        plain = {
+            key: (
+                value.model_dump()
+                if isinstance(value, BaseModel)
+                else (
+                    [item.model_dump() for item in value]
+                    if isinstance(value, list)
+                    else value
+                )
+            )
+            for key, value in data.items()
+        }
+        assert dump_json(model, **plain) == model(**data).model_dump_json().encode()
+
+
+def test_dump_json_nested_types():
+    data = {
+        "item": {"name": "a", "tags": ["x"]},
+        "items": [{"name": "b", "tags": []}],
+        "count": None,
+    }
+    assert dump_json(Wrapper, **data) == Wrapper(**data).model_dump_json().encode()
+
+
+async def test_as_dicts(db: AsyncSession):
+    result = await db.execute(
+        select(literal(1).label("id"), literal("a").label("name"))
+    )
+    assert as_dicts(result.all()) == [{"id": 1, "name": "a"}]
+    assert as_dicts([]) == []
+
+
+def test_json_response():
+    response = json_response(MyModelResponse, 201, message="not-found", model=None)
+    assert response.status_code == 201
+    assert response.media_type == "application/json"
+    assert response.body == b'{"message":"not-found","model":null}'
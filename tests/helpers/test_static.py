@@ -1,7 +1,13 @@
+import gzip
+from unittest.mock import patch
+
+import pytest
 from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
 from fastapi.testclient import TestClient
 
 from helpers import static
+from helpers.static import StaticCache
 
 
 def test_static_files():
@@ -13,3 +19,129 @@ def test_static_files():
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]
     assert "FastAPI App" in response.text
+
+
+@pytest.fixture
+def public(tmp_path):
+    (tmp_path / "index.html").write_text("<html>" + "hello " * 200 + "</html>")
+    (tmp_path / "app.0123abcd.js").write_text("console.log('x');" * 100)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + bytes(2000))
+    (tmp_path / "guide").mkdir()
+    (tmp_path / "guide" / "index.html").write_text("<html>guide</html>")
+    (tmp_path / "big.txt").write_text("x" * 5000)
+    return tmp_path
+
+
+@pytest.fixture
+def cache_client(public) -> TestClient:
+    app = FastAPI()
+    app.mount("/", StaticCache(str(public), max_file_size=4096))
+    return TestClient(app)
+
+
+def test_static_cache_encodings(cache_client: TestClient):
+    response = cache_client.get("/", headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-type"] == "text/html; charset=utf-8"
+    assert int(response.headers["content-length"]) < 1200
+    assert response.text.startswith("<html>hello")
+    gzip_etag = response.headers["etag"]
+
+    response = cache_client.get("/", headers={"accept-encoding": "gzip;q=0"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-length"] == str(len(response.content))
+    assert response.headers["etag"] != gzip_etag
+
+    # already compressed formats are sent as they are
+    response = cache_client.get("/logo.png", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-type"] == "image/png"
+
+
+def test_static_cache_precompressed(public):
+    (public / "index.html.gz").write_bytes(gzip.compress(b"<html>precompressed</html>"))
+    client = TestClient(StaticCache(str(public)))
+
+    response = client.get("/index.html", headers={"accept-encoding": "gzip"})
+    assert response.text == "<html>precompressed</html>"
+    assert client.get("/index.html.gz").status_code == 404
+
+
+def test_static_cache_conditional(cache_client: TestClient):
+    response = cache_client.get("/app.0123abcd.js")
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    response = cache_client.get("/app.0123abcd.js", headers={"if-none-match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = cache_client.get(
+        "/app.0123abcd.js", headers={"if-none-match": f'"other", W/{etag}'}
+    )
+    assert response.status_code == 304
+
+    response = cache_client.get(
+        "/app.0123abcd.js", headers={"if-modified-since": last_modified}
+    )
+    assert response.status_code == 304
+
+    # If-None-Match takes precedence over If-Modified-Since
+    response = cache_client.get(
+        "/app.0123abcd.js",
+        headers={"if-none-match": '"other"', "if-modified-since": last_modified},
+    )
+    assert response.status_code == 200
+
+    response = cache_client.get("/")
+    assert response.headers["cache-control"] == "public, max-age=0, must-revalidate"
+
+
+def test_static_cache_paths(cache_client: TestClient):
+    response = cache_client.get("/guide", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "/guide/"
+
+    response = cache_client.get("/guide/")
+    assert response.text == "<html>guide</html>"
+
+    response = cache_client.get("/missing")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Not Found"}
+
+    response = cache_client.head("/")
+    assert response.status_code == 200
+    assert response.content == b""
+
+    response = cache_client.post("/")
+    assert response.status_code == 405
+
+    # large files stay on disk
+    response = cache_client.get("/big.txt")
+    assert response.status_code == 200
+    assert response.text == "x" * 5000
+
+
+def test_static_cache_not_found_page(public):
+    (public / "404.html").write_text("<html>gone</html>")
+    client = TestClient(StaticCache(str(public)))
+
+    response = client.get("/missing")
+    assert response.status_code == 404
+    assert response.text == "<html>gone</html>"
+
+
+def test_static_modes():
+    with patch.object(static, "STATIC_MODE", "none"):
+        app = FastAPI()
+        static.setup(app)
+    assert app.routes[-1].name != "public"
+
+    with patch.object(static, "STATIC_MODE", "files"):
+        app = FastAPI()
+        static.setup(app)
+    assert isinstance(app.routes[-1].app, StaticFiles)
@@ -0,0 +1,74 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from httpx import AsyncClient
+
+from helpers import profiler
+
+HEADERS = {"authorization": "Bearer secret"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token():
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_admin_disabled_without_token(async_client: AsyncClient):
+    with patch.object(profiler, "ADMIN_TOKEN", ""):
+        response = await async_client.get("/api/admin/loop-lag", headers=HEADERS)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_admin_wrong_token(async_client: AsyncClient):
+    response = await async_client.get("/api/admin/loop-lag")
+    assert response.status_code == 403
+
+    response = await async_client.get(
+        "/api/admin/loop-lag", headers={"x-admin-token": "wrong"}
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_admin_profile(async_client: AsyncClient):
+    response = await async_client.get(
+        "/api/admin/profile",
+        params={"seconds": 0.05, "interval": 0.001, "idle": True},
+        headers={"x-admin-token": "secret"},
+    )
+
+    assert response.status_code == 200
+    assert "profile.folded" in response.headers["content-disposition"]
+    lines = response.text.splitlines()
+    assert lines
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_admin_profile_busy(async_client: AsyncClient):
+    with patch("routes.admin.profile", new_callable=AsyncMock, return_value=None):
+        response = await async_client.get(
+            "/api/admin/profile", params={"seconds": 1}, headers=HEADERS
+        )
+    assert response.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_admin_profile_invalid(async_client: AsyncClient):
+    response = await async_client.get(
+        "/api/admin/profile", params={"seconds": 3600}, headers=HEADERS
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_admin_loop_lag(async_client: AsyncClient):
+    response = await async_client.get("/api/admin/loop-lag", headers=HEADERS)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_incidents"] == 0
+    assert data["incidents"] == []
@@ -0,0 +1,41 @@
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from helpers import profiler
+from models.my_model import MyModelRequest
+
+
+@pytest.mark.asyncio
+async def test_cache_stats(async_client: AsyncClient):
+    request = MyModelRequest(field1="Test 1", field2=True)
+    response = await async_client.post(
+        "/api/my-model/create", json=request.model_dump()
+    )
+    assert response.status_code == 201
+
+    response = await async_client.get("/api/my-model/random")
+    assert response.status_code == 200
+
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        response = await async_client.get(
+            "/api/cache/stats", headers={"x-admin-token": "secret"}
+        )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["backend"] == "MemoryCache"
+    assert data["hits"] >= 1
+    assert data["entries"] >= 1
+    assert "misses" in data
+    assert "evictions" in data
+
+
+@pytest.mark.asyncio
+async def test_cache_stats_admin_only(async_client: AsyncClient):
+    response = await async_client.get("/api/cache/stats")
+    assert response.status_code == 404
+
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        response = await async_client.get("/api/cache/stats")
+    assert response.status_code == 403
@@ -0,0 +1,30 @@
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from helpers import profiler
+
+
+@pytest.mark.asyncio
+async def test_db_pool_stats(async_client: AsyncClient):
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        response = await async_client.get(
+            "/api/db/pool/stats", headers={"x-admin-token": "secret"}
+        )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["pool"] == "InstrumentedPool"
+    assert "checked_out" in data
+    assert "overflow" in data
+    assert "+Inf" in data["checkout_latency"]["buckets"]
+
+
+@pytest.mark.asyncio
+async def test_db_pool_stats_admin_only(async_client: AsyncClient):
+    response = await async_client.get("/api/db/pool/stats")
+    assert response.status_code == 404
+
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        response = await async_client.get("/api/db/pool/stats")
+    assert response.status_code == 403
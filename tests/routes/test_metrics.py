@@ -0,0 +1,22 @@
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from helpers.instrumentation import registry
+
+
+@pytest.mark.asyncio
+async def test_metrics(async_client: AsyncClient):
+    labels = (("method", "GET"), ("route", "/api/my-model/list"), ("status", "200"))
+
+    with patch.object(registry, "counters", {("http_requests_total", labels): 3}):
+        response = await async_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert (
+        'http_requests_total{method="GET",route="/api/my-model/list",status="200"} 3'
+        in response.text
+    )
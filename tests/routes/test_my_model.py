@@ -1,9 +1,19 @@
+import asyncio
+import csv
+import io
+import json
 from unittest.mock import patch
 
 import pytest
+from fastapi import FastAPI
 from httpx import AsyncClient
 
-from models.my_model import MyModelRequest
+from helpers import diagnostics, ingest, serialization
+from helpers.compression import CompressionMiddleware
+from models.my_model import MyModel, MyModelRequest
+from routes.my_model import BULK_CREATE_MAX_ITEMS
+from services import my_model as service_my_model
+from tests.conftest import TestingAsyncSessionLocal, async_engine
 
 
 @pytest.mark.asyncio
@@ -23,6 +33,31 @@ async def test_my_model_create(async_client: AsyncClient):
     assert data["message"] == "created"
 
 
+@pytest.mark.asyncio
+async def test_my_model_create_field1_too_long(async_client: AsyncClient):
+    response = await async_client.post(
+        "/api/my-model/create", json={"field1": "x" * 256, "field2": True}
+    )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_my_model_create_statements(async_client: AsyncClient):
+    diagnostics.instrument_engine(async_engine)
+    request = MyModelRequest(field1="Test 1", field2=True)
+
+    with diagnostics.assert_statements(2):
+        response = await async_client.post(
+            "/api/my-model/create", json=request.model_dump()
+        )
+    assert response.status_code == 201
+
+    with diagnostics.assert_statements(1):
+        response = await async_client.get("/api/my-model/list")
+    assert response.status_code == 200
+
+
 @pytest.mark.asyncio
 async def test_my_model_random(async_client: AsyncClient):
     # create a record
@@ -46,7 +81,7 @@ async def test_my_model_random(async_client: AsyncClient):
 async def test_my_model_create_fail_create(async_client: AsyncClient):
     request = MyModelRequest(field1="Test 1", field2=True)
 
-    with patch("services.my_model.create", return_value=None):
+    with patch("services.my_model.create_returning", return_value=None):
         response = await async_client.post(
             "/api/my-model/create", json=request.model_dump()
         )
@@ -55,17 +90,89 @@ async def test_my_model_create_fail_create(async_client: AsyncClient):
 
 
 @pytest.mark.asyncio
-async def test_my_model_create_fail_find_by_id(async_client: AsyncClient):
+async def test_my_model_create_skips_find_by_id(async_client: AsyncClient):
     request = MyModelRequest(field1="Test 1", field2=True)
 
-    with patch("services.my_model.create", return_value=1), patch(
-        "services.my_model.find_by_id", return_value=None
-    ):
+    with patch("services.my_model.find_by_id") as mock_find_by_id:
         response = await async_client.post(
             "/api/my-model/create", json=request.model_dump()
         )
-        assert response.status_code == 404
-        assert response.json() == {"detail": "MyModel not found after creation"}
+        assert response.status_code == 201
+        assert response.json()["model"]["id"] is not None
+        mock_find_by_id.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_my_model_get(async_client: AsyncClient):
+    created = (await create_many(async_client, 1))[0]
+
+    response = await async_client.get(f"/api/my-model/{created['id']}")
+    assert response.status_code == 200
+    assert response.json() == {"message": "found", "model": created}
+    assert response.headers["cache-control"] == "public, max-age=0, must-revalidate"
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response = await async_client.get(
+        f"/api/my-model/{created['id']}", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = await async_client.get(
+        f"/api/my-model/{created['id']}",
+        headers={"if-modified-since": last_modified},
+    )
+    assert response.status_code == 304
+
+    # an update bumps updated_at, the old copy is stale
+    async with TestingAsyncSessionLocal() as db:
+        await service_my_model.update_returning(
+            created["id"], MyModel(field1="Changed", field2=False), db
+        )
+
+    response = await async_client.get(
+        f"/api/my-model/{created['id']}", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["model"]["field1"] == "Changed"
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_my_model_get_not_found(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model/999")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "MyModel not found"}
+
+    response = await async_client.get("/api/my-model/not-an-id")
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_my_model_random_conditional(async_client: AsyncClient):
+    await create_many(async_client, 1)
+
+    response = await async_client.get("/api/my-model/random")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert "last-modified" not in response.headers
+
+    response = await async_client.get(
+        "/api/my-model/random", headers={"if-none-match": response.headers["etag"]}
+    )
+    assert response.status_code == 304
+
+    # only the etag validates, a date would match a copy holding another row
+    response = await async_client.get(
+        "/api/my-model/random",
+        headers={"if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"},
+    )
+    assert response.status_code == 200
+
+    response = await async_client.get("/api/my-model/random", params={"count": 2})
+    assert "last-modified" not in response.headers
 
 
 @pytest.mark.asyncio
@@ -76,3 +183,306 @@ async def test_my_model_random_not_found(async_client: AsyncClient):
         data = response.json()
         assert data["message"] == "not-found"
         assert data["model"] is None
+
+
+@pytest.mark.asyncio
+async def test_my_model_bulk_create(async_client: AsyncClient):
+    requests = [
+        MyModelRequest(field1=f"Test {i}", field2=True).model_dump() for i in range(3)
+    ]
+
+    response = await async_client.post("/api/my-model/bulk-create", json=requests)
+
+    assert response.status_code == 201
+
+    data = response.json()
+    assert data["message"] == "created"
+    assert len(data["models"]) == 3
+    assert [model["field1"] for model in data["models"]] == [
+        "Test 0",
+        "Test 1",
+        "Test 2",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_my_model_bulk_create_fail(async_client: AsyncClient):
+    requests = [MyModelRequest(field1="Test 1", field2=True).model_dump()]
+
+    with patch("services.my_model.bulk_create", return_value=None):
+        response = await async_client.post("/api/my-model/bulk-create", json=requests)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Failed to bulk create MyModel"}
+
+
+@pytest.mark.asyncio
+async def test_my_model_bulk_create_too_many(async_client: AsyncClient):
+    request = MyModelRequest(field1="Test", field2=True).model_dump()
+
+    with patch("services.my_model.bulk_create") as mock_bulk_create:
+        response = await async_client.post(
+            "/api/my-model/bulk-create", json=[request] * (BULK_CREATE_MAX_ITEMS + 1)
+        )
+    assert response.status_code == 422
+    mock_bulk_create.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_my_model_random_count(async_client: AsyncClient):
+    requests = [
+        MyModelRequest(field1=f"Test {i}", field2=True).model_dump() for i in range(5)
+    ]
+    response = await async_client.post("/api/my-model/bulk-create", json=requests)
+    assert response.status_code == 201
+
+    response = await async_client.get("/api/my-model/random", params={"count": 3})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "random"
+    assert len(data["models"]) == 3
+    assert len({model["id"] for model in data["models"]}) == 3
+
+
+@pytest.mark.asyncio
+async def test_my_model_random_count_not_found(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model/random", params={"count": 3})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "not-found"
+    assert data["models"] == []
+
+
+@pytest.mark.asyncio
+async def test_my_model_random_count_invalid(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model/random", params={"count": 0})
+    assert response.status_code == 422
+
+
+async def create_many(async_client: AsyncClient, count: int):
+    requests = [
+        MyModelRequest(field1=f"Test {i}", field2=i % 2 == 0).model_dump()
+        for i in range(count)
+    ]
+    response = await async_client.post("/api/my-model/bulk-create", json=requests)
+    assert response.status_code == 201
+    return response.json()["models"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("order_by", ["id", "created_at"])
+async def test_my_model_list_pages(async_client: AsyncClient, order_by: str):
+    created = await create_many(async_client, 5)
+
+    ids = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 2, "order_by": order_by}
+        if cursor:
+            params["cursor"] = cursor
+
+        response = await async_client.get("/api/my-model/list", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["message"] == "list"
+        ids.extend(model["id"] for model in data["models"])
+        pages += 1
+
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert ids == [model["id"] for model in created]
+
+
+@pytest.mark.asyncio
+async def test_my_model_list_empty(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model/list")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["models"] == []
+    assert data["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_my_model_list_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model/list", params={"cursor": "bad"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.asyncio
+async def test_my_model_list_fail(async_client: AsyncClient):
+    with patch("services.my_model.list_page", return_value=None):
+        response = await async_client.get("/api/my-model/list")
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Failed to list MyModel"}
+
+
+@pytest.mark.asyncio
+async def test_my_model_query_field2(async_client: AsyncClient):
+    created = await create_many(async_client, 5)
+
+    response = await async_client.get(
+        "/api/my-model", params={"field2": "true", "limit": 2}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [model["id"] for model in data["models"]] == [
+        created[0]["id"],
+        created[2]["id"],
+    ]
+
+    response = await async_client.get(
+        "/api/my-model",
+        params={"field2": "true", "limit": 2, "cursor": data["next_cursor"]},
+    )
+    data = response.json()
+    assert [model["id"] for model in data["models"]] == [created[4]["id"]]
+    assert data["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_my_model_query_created_range(async_client: AsyncClient):
+    created = await create_many(async_client, 3)
+
+    params = {"created_after": created[0]["created_at"], "order_by": "created_at"}
+    response = await async_client.get("/api/my-model", params=params)
+    assert response.status_code == 200
+    assert response.json()["models"] == created
+
+    params = {"created_before": created[0]["created_at"]}
+    response = await async_client.get("/api/my-model", params=params)
+    assert response.status_code == 200
+    assert response.json()["models"] == []
+
+
+@pytest.mark.asyncio
+async def test_my_model_query_invalid(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model", params={"order_by": "field1"})
+    assert response.status_code == 422
+
+    response = await async_client.get("/api/my-model", params={"cursor": "bad"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_my_model_export_ndjson(async_client: AsyncClient):
+    created = await create_many(async_client, 3)
+
+    response = await async_client.get("/api/my-model/export")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == created
+
+
+@pytest.mark.asyncio
+async def test_my_model_export_compressed(app: FastAPI, async_client: AsyncClient):
+    app.add_middleware(CompressionMiddleware, min_size=0)
+    created = await create_many(async_client, 3)
+
+    response = await async_client.get(
+        "/api/my-model/export", headers={"accept-encoding": "gzip"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == created
+
+
+@pytest.mark.asyncio
+async def test_my_model_export_csv(async_client: AsyncClient):
+    created = await create_many(async_client, 3)
+
+    response = await async_client.get("/api/my-model/export", params={"format": "csv"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == [model["id"] for model in created]
+    assert [row["field1"] for row in rows] == [model["field1"] for model in created]
+
+
+@pytest.mark.asyncio
+async def test_my_model_export_csv_empty(async_client: AsyncClient):
+    response = await async_client.get("/api/my-model/export", params={"format": "csv"})
+
+    assert response.status_code == 200
+    assert response.text.strip() == "id,field1,field2,created_at,updated_at"
+
+
+@pytest.mark.asyncio
+async def test_my_model_fast_serialization_same_bytes(async_client: AsyncClient):
+    # verify the fast path returns exactly what fastapi would have encoded
+    request = [MyModelRequest(field1=f"Tést {i}", field2=i % 2 == 0) for i in range(3)]
+    response = await async_client.post(
+        "/api/my-model/bulk-create",
+        json=[item.model_dump() for item in request],
+    )
+    assert response.status_code == 201
+
+    paths = [
+        "/api/my-model/list?limit=2",
+        "/api/my-model/list?limit=5&order_by=created_at",
+        "/api/my-model/export",
+    ]
+
+    for path in paths:
+        default = await async_client.get(path)
+
+        with patch.object(serialization, "FAST_SERIALIZATION", True):
+            fast = await async_client.get(path)
+
+        assert fast.status_code == default.status_code == 200
+        assert fast.headers["content-type"] == default.headers["content-type"]
+        assert fast.content == default.content
+
+
+@pytest.mark.asyncio
+async def test_my_model_fast_serialization_list_empty(async_client: AsyncClient):
+    default = await async_client.get("/api/my-model/list")
+
+    with patch.object(serialization, "FAST_SERIALIZATION", True):
+        fast = await async_client.get("/api/my-model/list")
+
+    assert fast.content == default.content
+
+
+@pytest.mark.asyncio
+async def test_my_model_create_ingest(async_client: AsyncClient):
+    with patch.object(ingest, "INGEST_ENABLED", True), patch(
+        "services.my_model.AsyncSessionLocal", TestingAsyncSessionLocal
+    ):
+        responses = await asyncio.gather(
+            *[
+                async_client.post(
+                    "/api/my-model/create",
+                    json={"field1": f"Test {i}", "field2": True},
+                )
+                for i in range(5)
+            ]
+        )
+        await service_my_model.create_queue.close()
+
+    assert [response.status_code for response in responses] == [201] * 5
+    models = [response.json()["model"] for response in responses]
+    assert [model["field1"] for model in models] == [f"Test {i}" for i in range(5)]
+    assert len({model["id"] for model in models}) == 5
+    assert all(model["created_at"] for model in models)
+
+
+@pytest.mark.asyncio
+async def test_my_model_create_ingest_full(async_client: AsyncClient):
+    with patch.object(ingest, "INGEST_ENABLED", True), patch(
+        "services.my_model.create_queued", side_effect=ingest.IngestQueueFull()
+    ):
+        response = await async_client.post(
+            "/api/my-model/create", json={"field1": "Test", "field2": True}
+        )
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
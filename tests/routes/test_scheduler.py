@@ -0,0 +1,29 @@
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from helpers import profiler
+
+
+@pytest.mark.asyncio
+async def test_scheduler_stats(async_client: AsyncClient):
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        response = await async_client.get(
+            "/api/scheduler/stats", headers={"x-admin-token": "secret"}
+        )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["leader"] is False
+    assert "owner" in data
+    assert "jobs" in data
+
+
+@pytest.mark.asyncio
+async def test_scheduler_stats_admin_only(async_client: AsyncClient):
+    response = await async_client.get("/api/scheduler/stats")
+    assert response.status_code == 404
+
+    with patch.object(profiler, "ADMIN_TOKEN", "secret"):
+        response = await async_client.get("/api/scheduler/stats")
+    assert response.status_code == 403
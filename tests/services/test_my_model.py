@@ -1,10 +1,13 @@
-from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.my_model import MyModel
+from helpers.cache import get_cache
+from models.my_model import MyModel, MyModelRequest
 from services import my_model as service_my_model
 
 
@@ -126,6 +129,26 @@ async def test_find_by_id_success(db: AsyncSession):
     assert result.field2 == True
 
 
+@pytest.mark.asyncio
+async def test_find_by_id_skips_orm(db: AsyncSession):
+    items = await service_my_model.bulk_create(
+        [MyModelRequest(field1=f"Test {i}", field2=i == 0) for i in range(2)], db
+    )
+    await get_cache().clear()
+    db.expunge_all()
+
+    # the prebuilt statements must bind each call's ids
+    for item in items:
+        result = await service_my_model.find_by_id(item.id, db)
+        assert result == item
+
+    found = await service_my_model._find_many([item.id for item in items], db)
+    assert sorted(found, key=lambda item: item.id) == items
+
+    # plain rows, nothing loaded into the identity map
+    assert len(db.identity_map) == 0
+
+
 @pytest.mark.asyncio
 async def test_find_by_id_failure(db: AsyncSession):
     result = await service_my_model.find_by_id(1, db)
@@ -166,3 +189,380 @@ async def test_delete_item_not_found(db: AsyncSession):
     result = await service_my_model.delete(999, db)
 
     assert result is False
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_success(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=i % 2 == 0) for i in range(5)]
+
+    result = await service_my_model.bulk_create(items, db, chunk_size=2)
+
+    assert result is not None
+    assert len(result) == 5
+    assert [item.field1 for item in result] == [f"Test {i}" for i in range(5)]
+    assert [item.field2 for item in result] == [True, False, True, False, True]
+    assert all(item.created_at is not None for item in result)
+    assert all(item.updated_at is not None for item in result)
+
+    stmt = select(MyModel).order_by(MyModel.id)
+    result_exec = await db.execute(stmt)
+    objs_from_db = result_exec.scalars().all()
+    assert [obj.id for obj in objs_from_db] == [item.id for item in result]
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_empty(db: AsyncSession):
+    result = await service_my_model.bulk_create([], db)
+
+    assert result == []
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_failure(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(3)]
+
+    with patch.object(db, "commit", side_effect=Exception("DB Error")):
+        result = await service_my_model.bulk_create(items, db, chunk_size=2)
+
+    assert result is None
+    stmt = select(MyModel)
+    result_exec = await db.execute(stmt)
+    assert result_exec.scalars().all() == []
+
+
+def asyncpg_session(created: list) -> MagicMock:
+    # stands in for an AsyncSession bound to asyncpg, down to the raw
+    # connection that copy_records_to_table is called on
+    driver_connection = MagicMock(copy_records_to_table=AsyncMock())
+    raw = MagicMock(driver_connection=driver_connection)
+    conn = MagicMock(get_raw_connection=AsyncMock(return_value=raw))
+
+    db = MagicMock()
+    db.get_bind.return_value.dialect.driver = "asyncpg"
+    db.execute = AsyncMock(return_value=MagicMock(all=MagicMock(return_value=created)))
+    db.connection = AsyncMock(return_value=conn)
+    db.commit = AsyncMock()
+    db.rollback = AsyncMock()
+    return db
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_copy():
+    now = datetime.now(timezone.utc)
+    created = [
+        SimpleNamespace(
+            id=i + 1, field1=f"Test {i}", field2=True, created_at=now, updated_at=now
+        )
+        for i in range(3)
+    ]
+    db = asyncpg_session(created)
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(3)]
+
+    with patch.object(service_my_model, "BULK_CREATE_COPY_THRESHOLD", 3):
+        result = await service_my_model.bulk_create(items, db)
+
+    assert [item.id for item in result] == [1, 2, 3]
+    assert [item.field1 for item in result] == ["Test 0", "Test 1", "Test 2"]
+
+    raw = db.connection.return_value.get_raw_connection.return_value
+    raw.driver_connection.copy_records_to_table.assert_awaited_once_with(
+        "my_model_copy",
+        records=[(0, "Test 0", True), (1, "Test 1", True), (2, "Test 2", True)],
+        columns=["ord", "field1", "field2"],
+    )
+    statements = [str(call.args[0]) for call in db.execute.await_args_list]
+    assert statements[0].startswith("CREATE TEMP TABLE my_model_copy")
+    assert "INSERT INTO my_model (field1, field2)" in statements[1]
+    db.commit.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_copy_below_threshold():
+    db = asyncpg_session([])
+    items = [MyModelRequest(field1="Test", field2=True)]
+
+    with patch.object(service_my_model, "BULK_CREATE_COPY_THRESHOLD", 3):
+        assert await service_my_model.bulk_create(items, db) == []
+
+    db.connection.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_create_returning_success(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+
+    result = await service_my_model.create_returning(obj, db)
+
+    assert result is not None
+    assert result.id is not None
+    assert result.field1 == "Test 1"
+    assert result.field2 == True
+    assert result.created_at is not None
+    assert result.updated_at is not None
+
+
+@pytest.mark.asyncio
+async def test_create_returning_failure(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+
+    with patch.object(db, "commit", side_effect=Exception("DB Error")):
+        result = await service_my_model.create_returning(obj, db)
+
+    assert result is None
+    stmt = select(MyModel).where(MyModel.field1 == "Test 1")
+    result_exec = await db.execute(stmt)
+    assert result_exec.scalar_one_or_none() is None
+
+
+@pytest.mark.asyncio
+async def test_update_returning_success(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+    obj_id = await service_my_model.create(obj, db)
+
+    update_obj = MyModel(field1="Updated Test 1", field2=False)
+    result = await service_my_model.update_returning(obj_id, update_obj, db)
+
+    assert result is not None
+    assert result.id == obj_id
+    assert result.field1 == "Updated Test 1"
+    assert result.field2 == False
+    assert result.updated_at is not None
+
+
+@pytest.mark.asyncio
+async def test_update_returning_item_not_found(db: AsyncSession):
+    update_obj = MyModel(field1="Updated Test 1", field2=False)
+
+    result = await service_my_model.update_returning(999, update_obj, db)
+
+    assert result is None
+
+
+@pytest.mark.asyncio
+async def test_update_returning_failure(db: AsyncSession):
+    update_obj = MyModel(field1="Updated Test 1", field2=False)
+
+    with patch.object(db, "execute", side_effect=Exception("DB Error")):
+        result = await service_my_model.update_returning(1, update_obj, db)
+
+    assert result is None
+
+
+@pytest.mark.asyncio
+async def test_get_random_rows_count(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(10)]
+    await service_my_model.bulk_create(items, db)
+
+    result = await service_my_model.get_random_rows(db, 4)
+
+    assert result is not None
+    assert len(result) == 4
+    assert len({item.id for item in result}) == 4
+
+
+@pytest.mark.asyncio
+async def test_get_random_rows_with_gaps(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(20)]
+    created = await service_my_model.bulk_create(items, db)
+    for item in created[1:-1]:
+        await service_my_model.delete(item.id, db)
+
+    result = await service_my_model.get_random_rows(db, 2)
+
+    assert result is not None
+    assert {item.id for item in result} == {created[0].id, created[-1].id}
+
+
+@pytest.mark.asyncio
+async def test_get_random_rows_more_than_available(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(3)]
+    await service_my_model.bulk_create(items, db)
+
+    result = await service_my_model.get_random_rows(db, 10)
+
+    assert result is not None
+    assert len(result) == 3
+
+
+@pytest.mark.asyncio
+async def test_get_random_rows_empty(db: AsyncSession):
+    result = await service_my_model.get_random_rows(db, 3)
+
+    assert result == []
+
+
+@pytest.mark.asyncio
+async def test_get_random_row_is_uniform(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(4)]
+    created = await service_my_model.bulk_create(items, db)
+    await service_my_model.delete(created[1].id, db)
+
+    seen = set()
+    for _ in range(60):
+        item = await service_my_model.get_random_row(db)
+        seen.add(item.id)
+
+    assert seen == {created[0].id, created[2].id, created[3].id}
+
+
+@pytest.mark.asyncio
+async def test_find_by_id_uses_cache(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+    obj_id = await service_my_model.create(obj, db)
+
+    await service_my_model.find_by_id(obj_id, db)
+
+    with patch.object(db, "execute", side_effect=Exception("DB Error")):
+        result = await service_my_model.find_by_id(obj_id, db)
+
+    assert result is not None
+    assert result.field1 == "Test 1"
+    assert get_cache().stats()["hits"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_create_returning_writes_through_cache(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+    created = await service_my_model.create_returning(obj, db)
+
+    with patch.object(db, "execute", side_effect=Exception("DB Error")):
+        result = await service_my_model.find_by_id(created.id, db)
+
+    assert result == created
+
+
+@pytest.mark.asyncio
+async def test_update_writes_through_cache(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+    obj_id = await service_my_model.create(obj, db)
+    await service_my_model.find_by_id(obj_id, db)
+
+    update_obj = MyModel(field1="Updated Test 1", field2=False)
+    await service_my_model.update(obj_id, update_obj, db)
+    result = await service_my_model.find_by_id(obj_id, db)
+    assert result.field1 == "Updated Test 1"
+
+    update_obj = MyModel(field1="Updated Test 2", field2=False)
+    await service_my_model.update_returning(obj_id, update_obj, db)
+    result = await service_my_model.find_by_id(obj_id, db)
+    assert result.field1 == "Updated Test 2"
+
+
+@pytest.mark.asyncio
+async def test_delete_invalidates_cache(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+    obj_id = await service_my_model.create(obj, db)
+    await service_my_model.find_by_id(obj_id, db)
+
+    await service_my_model.delete(obj_id, db)
+
+    assert await service_my_model.find_by_id(obj_id, db) is None
+    assert await service_my_model.get_random_row(db) is None
+
+
+@pytest.mark.asyncio
+async def test_get_random_row_uses_cache(db: AsyncSession):
+    obj = MyModel(field1="Test 1", field2=True)
+    await service_my_model.create(obj, db)
+    await service_my_model.get_random_row(db)
+
+    with patch.object(db, "execute", side_effect=Exception("DB Error")):
+        result = await service_my_model.get_random_row(db)
+
+    assert result is not None
+    assert result.field1 == "Test 1"
+
+
+@pytest.mark.asyncio
+async def test_list_page(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(3)]
+    created = await service_my_model.bulk_create(items, db)
+
+    models, next_cursor = await service_my_model.list_page(db, 2)
+    assert [item.id for item in models] == [item.id for item in created[:2]]
+    assert next_cursor is not None
+
+    after = service_my_model.decode_cursor(next_cursor)
+    models, next_cursor = await service_my_model.list_page(db, 2, after, "created_at")
+    assert [item.id for item in models] == [created[2].id]
+    assert next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_list_page_failure(db: AsyncSession):
+    with patch.object(db, "execute", side_effect=Exception("DB Error")):
+        result = await service_my_model.list_page(db, 2)
+
+    assert result is None
+
+
+@pytest.mark.asyncio
+async def test_list_page_filters(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=i % 2 == 0) for i in range(5)]
+    created = await service_my_model.bulk_create(items, db)
+
+    models, next_cursor = await service_my_model.list_page(db, 2, field2=True)
+    assert [item.id for item in models] == [created[0].id, created[2].id]
+
+    after = service_my_model.decode_cursor(next_cursor)
+    models, next_cursor = await service_my_model.list_page(db, 2, after, field2=True)
+    assert [item.id for item in models] == [created[4].id]
+    assert next_cursor is None
+
+    models, _ = await service_my_model.list_page(
+        db, 10, created_after=datetime.now(timezone.utc) + timedelta(days=1)
+    )
+    assert models == []
+
+
+async def query_plan(db: AsyncSession, stmt) -> str:
+    sql = stmt.compile(db.bind, compile_kwargs={"literal_binds": True})
+    result = await db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+    return " ".join(row.detail for row in result)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "kwargs, index",
+    [
+        ({"field2": True}, "ix_my_model_field2_id (field2=?)"),
+        (
+            {"field2": False, "after": (10, datetime(2024, 1, 1))},
+            "ix_my_model_field2_id (field2=? AND id>?)",
+        ),
+        ({"order_by": "created_at"}, "ix_my_model_created_at_id"),
+        (
+            {"order_by": "created_at", "created_after": datetime(2024, 1, 1)},
+            "ix_my_model_created_at_id (created_at>?)",
+        ),
+        (
+            {
+                "order_by": "created_at",
+                "after": (10, datetime(2024, 1, 1)),
+                "created_before": datetime(2025, 1, 1),
+            },
+            "ix_my_model_created_at_id",
+        ),
+    ],
+)
+async def test_list_query_uses_index(db: AsyncSession, kwargs, index):
+    plan = await query_plan(db, service_my_model.list_query(10, **kwargs))
+
+    assert f"USING INDEX {index}" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_decode_cursor_invalid():
+    with pytest.raises(ValueError):
+        service_my_model.decode_cursor("not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_stream_all(db: AsyncSession):
+    items = [MyModelRequest(field1=f"Test {i}", field2=True) for i in range(5)]
+    created = await service_my_model.bulk_create(items, db)
+
+    batches = [batch async for batch in service_my_model.stream_all(db, 2)]
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [item for batch in batches for item in batch] == created
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+# seconds `import main` may take in a fresh interpreter, worker cold starts
+# and reloads pay it before serving the first request
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "1.5"))
+
+# loaded when needed, never by `import main`
+LAZY_MODULES = ["jobs.my_model", "helpers.scheduler", "apscheduler"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module: str) -> dict[str, int]:
+    # cumulative microseconds per module, from python -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time():
+    times = import_times("main")
+
+    assert times["main"] / 1_000_000 < IMPORT_TIME_BUDGET
+    for module in LAZY_MODULES:
+        assert module not in times